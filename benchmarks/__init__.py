@@ -0,0 +1 @@
+# To treat benchmarks as a package
\ No newline at end of file
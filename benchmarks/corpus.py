@@ -0,0 +1,108 @@
+"""
+Synthetic requirements corpus generator
+
+Writes requirement files in the same format as 'text_files' ('NFRx (Category): text' then 'FRx: text', blank
+line between requirements) with any number of requirements and NFRs. Words are drawn from the bundled
+requirement files with a Zipf distribution, plus made up words for the long tail so the vocabulary keeps
+growing with the corpus size (Heaps' law) like a real requirements export would.
+
+To generate a file use 'python -m benchmarks.corpus 10000 --nfrs 5 --output bench_10000.txt' in the root directory.
+"""
+import argparse
+import re
+from pathlib import Path
+
+import numpy as np
+
+TEXT_FILES = Path(__file__).resolve().parent.parent / "text_files"
+CATEGORIES = ["Operational", "Usability", "Security", "Performance", "Reliability", "Maintainability"]
+OPENINGS = ["The system shall", "Users shall be able to", "The application will", "Users can", "The service shall"]
+SYLLABLES = ["ka", "lo", "mi", "ne", "ro", "ta", "vi", "su", "pe", "dor", "lin", "mar", "sel", "tur", "ven"]
+
+
+def seed_vocabulary(text_files=TEXT_FILES):
+    """
+    Words of the bundled requirement files, most common first
+
+    return - words: List of lower case words
+    """
+    counts = {}
+    for path in sorted(Path(text_files).glob("*requirements*.txt")):
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                text = line.split(":", 1)[-1]
+                for word in re.findall(r"[A-Za-z][A-Za-z\-]+", text):
+                    word = word.lower()
+                    counts[word] = counts.get(word, 0) + 1
+    return sorted(counts, key=lambda word: (-counts[word], word))
+
+def made_up_word(number: int):
+    word = ""
+    number += len(SYLLABLES)
+    while number:
+        number, rest = divmod(number, len(SYLLABLES))
+        word += SYLLABLES[rest]
+    return word
+
+def generate_requirements(n_requirements: int, n_nfrs=3, seed=0, words_per_requirement=(8, 24), vocabulary_size=None):
+    """
+    Yields requirement lines one at a time, so any corpus size fits in memory
+
+    param - n_requirements: Total number of requirements (NFRs + FRs)
+    param - n_nfrs: Number of NFRs, written first like the bundled files
+    param - seed: Random seed, the same arguments always give the same corpus
+    param - words_per_requirement: Range of words in a requirement after the opening words
+    param - vocabulary_size: Number of distinct words to draw from, grows with the corpus size if None
+
+    return - lines like 'NFR1 (Security): ...' and 'FR1: ...'
+    """
+    if n_nfrs > n_requirements:
+        raise ValueError("The number of NFRs can't be larger than the number of requirements")
+
+    rng = np.random.default_rng(seed)
+    words = seed_vocabulary()
+    if vocabulary_size is None:
+        vocabulary_size = max(len(words), int(40 * n_requirements ** 0.6))
+    words += [made_up_word(number) for number in range(max(0, vocabulary_size - len(words)))]
+    words = np.array(words[:vocabulary_size])
+
+    # Zipf word frequencies, sampled through the cumulative distribution so each draw is a binary search
+    cumulative = np.cumsum(1 / np.arange(1, len(words) + 1) ** 1.05)
+    cumulative /= cumulative[-1]
+
+    for number in range(n_requirements):
+        length = rng.integers(words_per_requirement[0], words_per_requirement[1] + 1)
+        drawn = np.minimum(np.searchsorted(cumulative, rng.random(length), side="right"), len(words) - 1)
+        body = " ".join(words[drawn])
+        text = f"{OPENINGS[rng.integers(len(OPENINGS))]} {body}."
+
+        if number < n_nfrs:
+            yield f"NFR{number + 1} ({CATEGORIES[number % len(CATEGORIES)]}): {text}"
+        else:
+            yield f"FR{number - n_nfrs + 1}: {text}"
+
+def write_corpus(path, n_requirements: int, n_nfrs=3, seed=0, **options):
+    """
+    Writes a synthetic requirements file
+
+    return - path: Path of the written file
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        for line in generate_requirements(n_requirements, n_nfrs, seed, **options):
+            file.write(line + "\n\n")
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic requirements file")
+    parser.add_argument("requirements", type=int, help="Number of requirements (NFRs + FRs)")
+    parser.add_argument("--nfrs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args(argv)
+
+    print(write_corpus(args.output, args.requirements, args.nfrs, args.seed))
+
+if __name__ == "__main__":
+    main()
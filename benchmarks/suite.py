@@ -0,0 +1,244 @@
+"""
+Benchmark suite for the tracing stages
+
+Generates synthetic requirement files (benchmarks/corpus.py) and times every stage on its own:
+loading, variant1 - variant3, tf_idf_cosine, merge_sort, transpose_with_threshold and the CSV writers.
+Every stage gets its wall time and CPU time (best of --repeat runs) and, in a separate run under tracemalloc,
+its peak Python/NumPy memory. Results are written as JSON so two versions can be compared.
+
+To run use 'python -m benchmarks.suite --sizes 100 1000 10000 --nfrs 3 --output bench.json' in the root directory.
+To compare use 'python -m benchmarks.suite compare old.json new.json'.
+
+When the NLTK data isn't installed the variant stages are recorded as skipped and the later stages use a
+whitespace split of the lower case text instead, so the vectorizing and sorting stages can still be measured.
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import scipy
+import sklearn
+
+from benchmarks.corpus import write_corpus
+from methods.functions import load_requirements, merge_sort, tf_idf_cosine, transpose_with_threshold
+from methods.runner import write_top_n, write_trace
+from methods.variants import VARIANTS, load_worker_state
+
+
+def measure(function, repeat=1, memory=True):
+    """
+    Times a stage and measures its peak memory
+
+    param - function: Stage to run, called without arguments
+    param - repeat: Number of timed runs, the fastest is kept
+    param - memory: Also run the stage once under tracemalloc
+
+    return - result: Return value of the last run
+           - stats: Dictionary with wall_seconds, cpu_seconds, runs and peak_bytes (None if not measured)
+    """
+    wall_times, cpu_times = [], []
+    for _ in range(max(1, repeat)):
+        gc.collect()
+        wall, cpu = time.perf_counter(), time.process_time()
+        result = function()
+        cpu_times.append(time.process_time() - cpu)
+        wall_times.append(time.perf_counter() - wall)
+
+    peak = None
+    if memory:
+        del result
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    stats = {
+        "wall_seconds": min(wall_times),
+        "cpu_seconds": min(cpu_times),
+        "runs": len(wall_times),
+        "peak_bytes": peak,
+    }
+    return result, stats
+
+def preprocessed(keys, texts):
+    """
+    Variant function returning already preprocessed text, so tf_idf_cosine is measured without preprocessing
+    """
+    def variant(info, output_path, **options):
+        return keys, texts
+    return variant
+
+def benchmark_size(n_requirements: int, n_nfrs: int, work_path: Path, variants=tuple(VARIANTS), top_n=10,
+                   threshold=0.14, repeat=1, memory=True, seed=0):
+    """
+    Runs every stage on one synthetic corpus
+
+    return - Dictionary with the corpus size and the stats of every stage
+    """
+    requirements_file = write_corpus(work_path / f"requirements_{n_requirements}_{n_nfrs}.txt",
+                                     n_requirements, n_nfrs, seed)
+    output_path = work_path / f"results_{n_requirements}_{n_nfrs}"
+    output_path.mkdir(parents=True, exist_ok=True)
+    stages = {}
+
+    info, stages["load"] = measure(lambda: load_requirements(requirements_file), repeat, memory)
+
+    nltk_ready = True
+    try:
+        load_worker_state()
+    except LookupError:
+        nltk_ready = False
+        print("NLTK data is missing, skipping the variant stages")
+
+    for name in variants:
+        if nltk_ready:
+            (keys, texts), stages[name] = measure(lambda: VARIANTS[name](info, output_path), repeat, memory)
+        else:
+            stages[name] = {"skipped": "NLTK data is missing"}
+            keys, texts = list(info), [text.lower() for text in info.values()]
+
+        results, stages[f"tf_idf_cosine.{name}"] = measure(
+            lambda: tf_idf_cosine(info, output_path, preprocessed(keys, texts)), repeat, memory
+        )
+
+        # The original per NFR sort of the whole FR list, cut to the top N afterwards
+        top_results, stages[f"merge_sort.{name}"] = measure(
+            lambda: {nfr: merge_sort(nfr_results)[:top_n] for nfr, nfr_results in results.items()}, repeat, memory
+        )
+        fr_view, stages[f"transpose_with_threshold.{name}"] = measure(
+            lambda: transpose_with_threshold(results, threshold), repeat, memory
+        )
+
+        _, stages[f"write_top_n.{name}"] = measure(
+            lambda: write_top_n(output_path / f"top_n_results_{name}.csv", top_results), repeat, memory
+        )
+        _, stages[f"write_trace.{name}"] = measure(
+            lambda: write_trace(output_path / f"trace_{name}.csv", fr_view), repeat, memory
+        )
+
+    return {
+        "requirements": len(info),
+        "nfrs": sum(key.upper().startswith("NFR") for key in info),
+        "frs": sum(not key.upper().startswith("NFR") for key in info),
+        "corpus_bytes": requirements_file.stat().st_size,
+        "stages": stages,
+    }
+
+def environment():
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "scikit-learn": sklearn.__version__,
+    }
+
+def run_suite(sizes, nfrs, variants=tuple(VARIANTS), top_n=10, threshold=0.14, repeat=1, memory=True, seed=0,
+              work_path=None):
+    """
+    Benchmarks every corpus size x NFR count
+
+    param - sizes: Numbers of requirements (NFRs + FRs), ex. [100, 1000, 10000]
+    param - nfrs: NFR counts, ex. [3]
+    param - work_path: Folder for the corpora and outputs, a temporary folder if None
+
+    return - report: Dictionary with the environment, the settings and one run per size x NFR count
+    """
+    report = {
+        "environment": environment(),
+        "settings": {"variants": list(variants), "top_n": top_n, "threshold": threshold, "repeat": repeat,
+                     "memory": memory, "seed": seed},
+        "runs": [],
+    }
+
+    with tempfile.TemporaryDirectory() as temporary:
+        work_path = Path(work_path) if work_path else Path(temporary)
+        for n_requirements in sizes:
+            for n_nfrs in nfrs:
+                print(f"Benchmarking {n_requirements} requirements with {n_nfrs} NFRs")
+                run = benchmark_size(n_requirements, n_nfrs, work_path, variants, top_n, threshold, repeat, memory,
+                                     seed)
+                report["runs"].append(run)
+                for stage, stats in run["stages"].items():
+                    if "skipped" not in stats:
+                        peak = "" if stats["peak_bytes"] is None else f", peak {stats['peak_bytes'] / 2**20:.1f} MiB"
+                        print(f"  {stage}: {stats['wall_seconds']:.4f}s wall, {stats['cpu_seconds']:.4f}s cpu{peak}")
+
+    return report
+
+def compare(old_report: dict, new_report: dict):
+    """
+    Wall time and peak memory ratios (new / old) of every stage both reports ran
+
+    return - List of (requirements, nfrs, stage, old seconds, new seconds, time ratio, memory ratio)
+    """
+    old_runs = {(run["requirements"], run["nfrs"]): run["stages"] for run in old_report["runs"]}
+    rows = []
+    for run in new_report["runs"]:
+        old_stages = old_runs.get((run["requirements"], run["nfrs"]), {})
+        for stage, stats in run["stages"].items():
+            old = old_stages.get(stage)
+            if old is None or "skipped" in old or "skipped" in stats:
+                continue
+            time_ratio = stats["wall_seconds"] / old["wall_seconds"] if old["wall_seconds"] else float("nan")
+            memory_ratio = None
+            if stats["peak_bytes"] is not None and old["peak_bytes"]:
+                memory_ratio = stats["peak_bytes"] / old["peak_bytes"]
+            rows.append((run["requirements"], run["nfrs"], stage, old["wall_seconds"], stats["wall_seconds"],
+                         time_ratio, memory_ratio))
+    return rows
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "compare":
+        parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+        parser.add_argument("old")
+        parser.add_argument("new")
+        args = parser.parse_args(argv[1:])
+
+        with open(args.old, "r") as file:
+            old_report = json.load(file)
+        with open(args.new, "r") as file:
+            new_report = json.load(file)
+        for requirements, nfrs, stage, old, new, time_ratio, memory_ratio in compare(old_report, new_report):
+            memory = "" if memory_ratio is None else f", memory x{memory_ratio:.2f}"
+            print(f"{requirements} ({nfrs} NFRs) {stage}: {old:.4f}s -> {new:.4f}s, time x{time_ratio:.2f}{memory}")
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark the tracing stages on synthetic requirement files")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="Numbers of requirements, up to 1000000")
+    parser.add_argument("--nfrs", type=int, nargs="+", default=[3], help="NFR counts")
+    parser.add_argument("--variant", action="append", choices=list(VARIANTS), help="Variant(s) to run")
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--threshold", type=float, default=0.14)
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per stage, the fastest is kept")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc runs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="Keep the corpora and outputs in this folder")
+    parser.add_argument("--output", default="bench.json")
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.sizes, args.nfrs, args.variant or list(VARIANTS), args.top_n, args.threshold,
+                       args.repeat, not args.no_memory, args.seed, args.work_dir)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Binary artifact store for the TF-IDF model and similarity results of a run
+
+Every run of a variant saves its sparse TF-IDF matrix (CSR data, indices and indptr), the IDF vector, the
+vocabulary and the NFR x FR similarity block as .npy files next to a manifest. The manifest ties the
+artifacts to a hash of the requirements, the variant, the dtype and the library/NLTK versions that made
+them. Loading memory-maps the arrays (no copy, no parsing), so re-ranking, re-thresholding and evaluation
+start from the stored scores instead of preprocessing and vectorizing again.
+
+Layout of one artifact folder (ex. 'part_1_results/artifacts/variant3'):
+    manifest.json       inputs, shapes, dtypes and the files below
+    keys.txt            requirement keys in row order, one per line
+    vocabulary.txt      terms in column order, one per line
+    tf_idf_data.npy, tf_idf_indices.npy, tf_idf_indptr.npy
+    idf.npy
+    nfr_indices.npy, fr_indices.npy
+    similarity.npy      (|NFR|, |FR|)
+"""
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import scipy.sparse as sp
+import sklearn
+
+from methods.cache import nltk_resource_fingerprint
+from methods.vocabulary import TokenVectorizer
+
+FORMAT_VERSION = 1
+
+
+def requirements_hash(info: dict):
+    """
+    return - SHA-256 of the requirement keys and texts in order
+    """
+    digest = hashlib.sha256()
+    for key, text in info.items():
+        digest.update(key.encode("utf-8") + b"\0" + text.encode("utf-8") + b"\n")
+    return digest.hexdigest()
+
+def artifact_inputs(info: dict, variant: str, dtype=np.float64, token_ids=False):
+    """
+    Everything the stored artifacts depend on, two runs with the same inputs give the same artifacts
+
+    param - token_ids: The TF-IDF matrix was built from interned token IDs instead of joined text
+
+    return - Dictionary of input name -> value
+    """
+    return {
+        "requirements": requirements_hash(info),
+        "variant": variant,
+        "tokens": "ids" if token_ids else "text",
+        "dtype": np.dtype(dtype).name,
+        "scikit-learn": sklearn.__version__,
+        "nltk": nltk_resource_fingerprint(),
+    }
+
+def save_artifacts(path, info: dict, variant: str, keys: list, vectorizer, tf_idf_matrix, similarity,
+                   nfr_indices, fr_indices):
+    """
+    Writes the artifacts of one variant, the folder is replaced at once so readers never see half a store
+
+    param - path: Artifact folder
+    param - info: Dictionary of requirement key -> requirement text the artifacts were made from
+    param - variant: Variant name
+    param - keys: Requirement keys in row order of the TF-IDF matrix
+    param - vectorizer: Fitted TfidfVectorizer
+    param - tf_idf_matrix: Sparse TF-IDF matrix
+    param - similarity: Array of shape (|NFR|, |FR|)
+    param - nfr_indices: Row positions of the NFRs
+    param - fr_indices: Row positions of the FRs
+
+    return - path: Artifact folder
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tf_idf_matrix = sp.csr_matrix(tf_idf_matrix)
+    tf_idf_matrix.sort_indices()
+    similarity = np.asarray(similarity)
+
+    arrays = {
+        "tf_idf_data": tf_idf_matrix.data,
+        "tf_idf_indices": tf_idf_matrix.indices,
+        "tf_idf_indptr": tf_idf_matrix.indptr,
+        "idf": np.asarray(vectorizer.idf_, dtype=tf_idf_matrix.dtype),
+        "nfr_indices": np.asarray(nfr_indices, dtype=np.intp),
+        "fr_indices": np.asarray(fr_indices, dtype=np.intp),
+        "similarity": similarity,
+    }
+    manifest = {
+        "format": FORMAT_VERSION,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "inputs": artifact_inputs(info, variant, similarity.dtype, isinstance(vectorizer, TokenVectorizer)),
+        "shape": {"requirements": len(keys), "vocabulary": len(vectorizer.vocabulary_),
+                  "nfrs": len(nfr_indices), "frs": len(fr_indices), "nonzeros": int(tf_idf_matrix.nnz)},
+        "arrays": {name: {"file": f"{name}.npy", "dtype": array.dtype.str, "shape": list(array.shape)}
+                   for name, array in arrays.items()},
+    }
+
+    staging = Path(tempfile.mkdtemp(prefix=f".{path.name}-", dir=path.parent))
+    try:
+        for name, array in arrays.items():
+            np.save(staging / f"{name}.npy", np.ascontiguousarray(array), allow_pickle=False)
+        with open(staging / "keys.txt", "w", encoding="utf-8") as file:
+            file.writelines(f"{key}\n" for key in keys)
+        with open(staging / "vocabulary.txt", "w", encoding="utf-8") as file:
+            file.writelines(f"{term}\n" for term in vectorizer.get_feature_names_out())
+        with open(staging / "manifest.json", "w") as file:
+            json.dump(manifest, file, indent=2)
+
+        replace_folder(staging, path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return path
+
+def replace_folder(staging: Path, path: Path):
+    """
+    Moves a fully written staging folder to path, replacing the folder that is there
+    """
+    if path.exists():
+        previous = path.with_name(f".{path.name}-old")
+        shutil.rmtree(previous, ignore_errors=True)
+        os.replace(path, previous)
+        os.replace(staging, path)
+        shutil.rmtree(previous, ignore_errors=True)
+    else:
+        os.replace(staging, path)
+
+
+class TraceArtifacts:
+    """
+    Read-only view of a stored artifact folder, the arrays are memory-mapped when first used
+
+    param - path: Artifact folder written by save_artifacts
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / "manifest.json", "r") as file:
+            self.manifest = json.load(file)
+        if self.manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported artifact format {self.manifest.get('format')} in {self.path}")
+        self._arrays = {}
+
+    def array(self, name: str):
+        if name not in self._arrays:
+            self._arrays[name] = np.load(self.path / self.manifest["arrays"][name]["file"], mmap_mode="r")
+        return self._arrays[name]
+
+    def matches(self, info: dict, variant: str, dtype=np.float64, token_ids=False):
+        """
+        return - True if the artifacts were made from these requirements with this variant and setup
+        """
+        return self.manifest["inputs"] == artifact_inputs(info, variant, dtype, token_ids)
+
+    @property
+    def keys(self):
+        with open(self.path / "keys.txt", "r", encoding="utf-8") as file:
+            return file.read().splitlines()
+
+    @property
+    def vocabulary(self):
+        with open(self.path / "vocabulary.txt", "r", encoding="utf-8") as file:
+            return file.read().splitlines()
+
+    @property
+    def nfr_keys(self):
+        keys = self.keys
+        return [keys[i] for i in self.array("nfr_indices")]
+
+    @property
+    def fr_keys(self):
+        keys = self.keys
+        return [keys[j] for j in self.array("fr_indices")]
+
+    @property
+    def tf_idf_matrix(self):
+        """
+        CSR matrix over the memory-mapped data, indices and indptr arrays
+        """
+        shape = (self.manifest["shape"]["requirements"], self.manifest["shape"]["vocabulary"])
+        matrix = sp.csr_matrix(shape, dtype=self.array("tf_idf_data").dtype)
+        matrix.data = self.array("tf_idf_data")
+        matrix.indices = self.array("tf_idf_indices")
+        matrix.indptr = self.array("tf_idf_indptr")
+        return matrix
+
+    @property
+    def idf(self):
+        return self.array("idf")
+
+    @property
+    def similarity(self):
+        return self.array("similarity")
+
+
+def load_artifacts(path, info=None, variant=None, dtype=np.float64, token_ids=False):
+    """
+    Opens a stored artifact folder
+
+    param - path: Artifact folder
+    param - info, variant, dtype, token_ids: When info is given, the artifacts are only returned if they were
+                                             made from these inputs
+
+    return - TraceArtifacts, or None if the folder doesn't exist or is out of date
+    """
+    path = Path(path)
+    if not (path / "manifest.json").exists():
+        return None
+    artifacts = TraceArtifacts(path)
+    if info is not None and not artifacts.matches(info, variant, dtype, token_ids):
+        return None
+    return artifacts
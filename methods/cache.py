@@ -0,0 +1,203 @@
+"""
+On-disk cache for preprocessing results
+
+Each requirement is stored under a hash of its text, the variant identity and the versions of the NLTK
+resources used, so a rerun only recomputes requirements that changed. Entries live in a single sqlite
+file, the least recently used entries are evicted when the cache grows past its size limit.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+import nltk
+
+NLTK_RESOURCES = [
+    "tokenizers/punkt_tab",
+    "corpora/stopwords",
+    "corpora/wordnet",
+    "taggers/averaged_perceptron_tagger_eng",
+]
+
+
+def nltk_resource_fingerprint(resources=NLTK_RESOURCES):
+    """
+    Identifies the installed NLTK version and resource files without loading them
+
+    param - resources: NLTK resource names to include
+
+    return - fingerprint: String that changes when NLTK or any of the resources change
+    """
+    parts = [f"nltk={nltk.__version__}"]
+    for resource in resources:
+        try:
+            path = Path(str(nltk.data.find(resource)))
+        except LookupError:
+            parts.append(f"{resource}=missing")
+            continue
+
+        files = [path] if path.is_file() else [Path(root) / name for root, _, names in os.walk(path) for name in names]
+        size = 0
+        modified = 0
+        for file in files:
+            stat = file.stat()
+            size += stat.st_size
+            modified = max(modified, stat.st_mtime_ns)
+        parts.append(f"{resource}={size}:{modified}")
+    return ";".join(parts)
+
+
+class PreprocessingCache:
+    """
+    Persistent cache of preprocessed token lists keyed by requirement text and variant
+
+    param - path: sqlite file the cache is stored in, created if it does not exist
+    param - max_bytes: Size limit of the stored token lists before the least recently used are evicted
+    param - resources: NLTK resources that are part of the cache key
+    param - check_same_thread: False allows using the cache from other threads, calls must not overlap
+    """
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, resources=NLTK_RESOURCES, check_same_thread=True):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.resources = resources
+        self._fingerprint = None
+
+        self.connection = sqlite3.connect(self.path, check_same_thread=check_same_thread)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, variant TEXT, tokens TEXT, size INTEGER, last_used REAL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS entries_variant ON entries (variant)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self.connection.commit()
+
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = nltk_resource_fingerprint(self.resources)
+        return self._fingerprint
+
+    def key(self, text, variant):
+        """
+        param - text: Raw requirement text
+        param - variant: Variant identity (ex. 'variant2')
+
+        return - key: Content hash of the text, variant and NLTK resource versions
+        """
+        digest = hashlib.sha256()
+        for part in (variant, self.fingerprint, text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def lookup(self, info, variant):
+        """
+        Splits the requirements into cached and missing ones
+
+        param - info: Dictionary of requirement key -> requirement text
+        param - variant: Variant identity
+
+        return - hits: Dictionary of requirement key -> cached token list
+               - missing: Dictionary of requirement key -> text that needs preprocessing
+        """
+        keys = {req_id: self.key(text, variant) for req_id, text in info.items()}
+        found = {}
+        unique_keys = list(set(keys.values()))
+        for start in range(0, len(unique_keys), 500):
+            batch = unique_keys[start:start + 500]
+            rows = self.connection.execute(
+                f"SELECT key, tokens FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch
+            )
+            for key, tokens in rows:
+                found[key] = json.loads(tokens)
+
+        if found:
+            self.connection.executemany(
+                "UPDATE entries SET last_used = ? WHERE key = ?", [(time.time(), key) for key in found]
+            )
+            self.connection.commit()
+
+        hits = {}
+        missing = {}
+        for req_id, key in keys.items():
+            if key in found:
+                hits[req_id] = found[key]
+            else:
+                missing[req_id] = info[req_id]
+        return hits, missing
+
+    def store(self, info, result, variant):
+        """
+        Saves preprocessed token lists and evicts old entries if the cache is over its size limit
+
+        param - info: Dictionary of requirement key -> requirement text
+        param - result: Dictionary of requirement key -> token list for the requirements to save
+        param - variant: Variant identity
+        """
+        now = time.time()
+        rows = []
+        for req_id, tokens in result.items():
+            encoded = json.dumps(tokens)
+            rows.append((self.key(info[req_id], variant), variant, encoded, len(encoded), now))
+
+        self.connection.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", rows)
+        self.connection.commit()
+        self.evict()
+
+    def size(self):
+        """
+        return - size: Total size in bytes of the stored token lists
+        """
+        return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self, max_bytes=None):
+        """
+        Removes the least recently used entries until the cache fits in max_bytes
+
+        param - max_bytes: Size limit, defaults to the limit of the cache
+
+        return - removed: Number of removed entries
+        """
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        excess = self.size() - limit
+        if excess <= 0:
+            return 0
+
+        stale = []
+        for key, size in self.connection.execute("SELECT key, size FROM entries ORDER BY last_used"):
+            stale.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.connection.executemany("DELETE FROM entries WHERE key = ?", stale)
+        self.connection.commit()
+        return len(stale)
+
+    def invalidate(self, variant=None, texts=None):
+        """
+        Removes cached entries
+
+        param - variant: Only remove entries of this variant, all variants if None
+        param - texts: Only remove entries of these requirement texts, all texts if None
+
+        return - removed: Number of removed entries
+        """
+        if texts is not None:
+            if variant is None:
+                variants = [row[0] for row in self.connection.execute("SELECT DISTINCT variant FROM entries")]
+            else:
+                variants = [variant]
+            keys = [(self.key(text, name),) for text in texts for name in variants]
+            cursor = self.connection.executemany("DELETE FROM entries WHERE key = ?", keys)
+        elif variant is not None:
+            cursor = self.connection.execute("DELETE FROM entries WHERE variant = ?", (variant,))
+        else:
+            cursor = self.connection.execute("DELETE FROM entries")
+        self.connection.commit()
+        return cursor.rowcount
+
+    def close(self):
+        self.connection.close()
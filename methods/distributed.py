@@ -0,0 +1,566 @@
+"""
+Sharded trace execution: FR shards in worker processes, a coordinator that merges their results
+
+The FR side of a requirements file is split over shard workers, the FR with position p (counting FRs in file
+order) goes to shard p % shards. Every worker reads the file, keeps and preprocesses only its own FRs and
+holds their TF-IDF rows. The coordinator holds the NFRs (the small side, the queries):
+    Statistics  every worker sends its terms, their document frequencies and where they were first seen, the
+                coordinator adds the NFRs and computes the global IDF (smooth IDF like TfidfVectorizer) and the
+                order every term was first seen in the whole file
+    IDF         every worker gets the IDF and first seen order of its own terms and weighs and L2 normalizes
+                its rows
+    Queries     the coordinator sends the NFR rows (terms and weights) to every worker. A worker scores
+                them against its rows a block at a time and answers with its top k (FR positions, keys
+                and scores) and the pairs above the threshold, the coordinator merges the partial top k
+
+The entries of every row are kept in first seen order like TfidfVectorizer.fit_transform keeps them, so the
+norms and the dot products add up the terms in the same order as the single process sparse product and the
+scores are exactly the ones of tf_idf_cosine (streaming.weigh sums in column order and can be one bit off).
+Ties are broken by FR position like top_k, FRs that share no term with the NFR fill up the top k with 0 in FR
+order.
+
+Workers and the coordinator talk over sockets (multiprocessing.connection with an authentication key), so the
+workers can run on other machines as long as each one can read the requirements file:
+    python -m methods.distributed worker text_files/p2_requirements.txt --shard 0/2 --port 7101
+    python -m methods.distributed worker text_files/p2_requirements.txt --shard 1/2 --port 7102
+    python -m methods.distributed trace text_files/p2_requirements.txt --connect localhost:7101 localhost:7102 --output distributed_results
+To start the workers as local processes for testing use
+'python -m methods.distributed local text_files/p2_requirements.txt --shards 2 --output distributed_results'
+"""
+import argparse
+import csv
+import multiprocessing
+import traceback
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+import scipy.sparse as sp
+from pathlib import Path
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from methods.functions import split_requirement_types, top_k
+from methods.metrics import stage
+from methods.streaming import StreamCounter, iter_requirement_chunks, merge_top_k, preprocess_chunk
+from methods.variants import PreprocessingPipeline, VARIANT_STAGES
+
+DEFAULT_AUTHKEY = b"requirements-trace"
+# FR rows scored at once in a worker, bounds the dense (queries x block) score array
+SCORE_BLOCK = 8192
+
+
+def split_chunk(info: dict):
+    """
+    return - keys: Requirement keys of a chunk in file order
+           - nfr_indices, fr_indices: Positions of the NFRs and the FRs in keys
+    """
+    keys = list(info)
+    nfr_indices, fr_indices = split_requirement_types(keys)
+    return keys, nfr_indices, fr_indices
+
+
+class TermStatistics:
+    """
+    Document frequencies of the terms of a part of the requirements file and where each term was first seen
+
+    TfidfVectorizer.fit_transform keeps the terms of a row in the order they were first seen in the whole
+    file and sums the L2 norm in that order. The rows of every part are normalized in the same order (see
+    weigh_rows), so the first document (file ordinal) and the order within it are kept for every term.
+    """
+    def __init__(self):
+        self.counter = StreamCounter("vocabulary")
+        self.first_document = []
+        self.texts = []
+
+    def add(self, token_lists: list, ordinals):
+        """
+        Counts preprocessed requirements
+
+        param - token_lists: Token lists of the requirements
+        param - ordinals: Position of every requirement among all requirements of the file
+        """
+        known = len(self.counter.vocabulary)
+        counts = self.counter.count(token_lists).tocoo()
+        new = counts.col >= known
+        first = np.full(len(self.counter.vocabulary) - known, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(first, counts.col[new] - known, np.asarray(ordinals, dtype=np.int64)[counts.row[new]])
+        self.first_document.append(first)
+        self.texts += [" ".join(tokens) for tokens in token_lists]
+
+    def finish(self):
+        """
+        return - Dictionary with
+                    documents: Number of counted requirements
+                    terms: Array of terms in TF-IDF column order (ordered by term)
+                    document_frequency: Document frequency of every term
+                    first_document: File ordinal of the first requirement with the term
+                    first_order: Order the terms were first seen in this part, breaks ties in first_document
+        """
+        columns, _ = self.counter.finish()
+        terms = np.empty(len(columns), dtype=object)
+        terms[columns] = self.counter.vocabulary.terms
+        document_frequency = np.empty(len(columns), dtype=np.int64)
+        document_frequency[columns] = self.counter.document_frequency[:len(columns)]
+        first_document = np.empty(len(columns), dtype=np.int64)
+        first_document[columns] = np.concatenate(self.first_document) if self.first_document else []
+        first_order = np.empty(len(columns), dtype=np.int64)
+        first_order[columns] = np.arange(len(columns))
+        return {"documents": len(self.texts), "terms": terms, "document_frequency": document_frequency,
+                "first_document": first_document, "first_order": first_order}
+
+def weigh_rows(texts: list, terms, idf, rank):
+    """
+    L2 normalized TF-IDF rows, the same values as TfidfVectorizer.fit_transform on the whole file
+
+    param - texts: Preprocessed requirement texts (joined tokens)
+    param - terms: Terms of the columns, ordered by term
+    param - idf: Global IDF of every term
+    param - rank: Order every term was first seen in the whole file
+
+    return - rows: CSR matrix of shape (len(texts), len(terms)), the entries of a row in rank order
+    """
+    vectorizer = TfidfVectorizer(vocabulary=list(terms), norm=None)
+    vectorizer.idf_ = np.asarray(idf, dtype=np.float64)
+    if not texts:
+        return sp.csr_matrix((0, len(terms)))
+    rows = vectorizer.transform(texts)
+    row_of = np.repeat(np.arange(rows.shape[0]), np.diff(rows.indptr))
+    order = np.lexsort((np.asarray(rank)[rows.indices], row_of))
+    rows.indices, rows.data = rows.indices[order], rows.data[order]
+    rows.has_sorted_indices = False
+    return normalize(rows, norm="l2", copy=False)
+
+
+class ShardWorker:
+    """
+    TF-IDF rows of one FR shard of a requirements file
+
+    param - requirements_file: Requirements file, read lazily
+    param - shard: Shard number, from 0
+    param - shards: Number of shards
+    param - variant: 'variant1', 'variant2' or 'variant3'
+    param - chunk_size: Requirements read and preprocessed at once
+    param - cache: PreprocessingCache or None
+    param - workers: Preprocessing worker processes, started once and kept over the chunks
+    """
+    def __init__(self, requirements_file, shard: int, shards: int, variant: str, chunk_size=10000, cache=None,
+                 workers=1):
+        if not 0 <= shard < shards:
+            raise ValueError(f"Shard {shard} is not one of 0 - {shards - 1}")
+        self.shard, self.shards = shard, shards
+        statistics = TermStatistics()
+        self.keys, positions = [], []
+        position = ordinal = 0
+
+        with stage("shard_count", shard=shard, shards=shards) as record, PreprocessingPipeline(workers) as pipeline:
+            for info in iter_requirement_chunks(requirements_file, chunk_size):
+                keys, _, fr_indices = split_chunk(info)
+                frs, ordinals = {}, []
+                for j in fr_indices:
+                    if position % shards == shard:
+                        frs[keys[j]] = info[keys[j]]
+                        ordinals.append(ordinal + j)
+                        positions.append(position)
+                    position += 1
+                ordinal += len(keys)
+                if frs:
+                    statistics.add(preprocess_chunk(frs, variant, cache, pipeline=pipeline), ordinals)
+                    self.keys += list(frs)
+            record.count(frs=len(self.keys), total_frs=position)
+
+        self.positions = np.array(positions, dtype=np.int64)
+        self.texts = statistics.texts
+        self.statistics = statistics.finish()
+        self.terms = self.statistics["terms"]
+        self.rows = None
+
+    def set_idf(self, idf, rank):
+        """
+        Weighs the shard's rows with the global IDF and first seen order of its terms
+        """
+        self.rows = weigh_rows(self.texts, self.terms, idf, rank)
+
+    def query_rows(self, terms, rows):
+        """
+        Query rows in the shard's columns, terms the shard doesn't have are dropped (they add nothing)
+
+        param - terms: Terms of the query columns, ordered by term
+        param - rows: CSR matrix of shape (queries, len(terms))
+        """
+        terms = np.asarray(terms, dtype=object)
+        columns = np.searchsorted(self.terms, terms)
+        found = columns < len(self.terms)
+        found[found] = self.terms[columns[found]] == terms[found]
+        mapped = np.full(len(terms), -1, dtype=np.intp)
+        mapped[found] = columns[found]
+
+        rows = sp.csr_matrix(rows)
+        keep = mapped[rows.indices] >= 0
+        # Kept entries before every row start, the entries keep their order in the row
+        indptr = np.concatenate([[0], np.cumsum(keep)])[rows.indptr]
+        return sp.csr_matrix((rows.data[keep], mapped[rows.indices[keep]], indptr),
+                             shape=(rows.shape[0], len(self.terms)))
+
+    def query(self, terms, rows, k=10, threshold=None):
+        """
+        Top k FRs of the shard and the FRs above the threshold for every query row
+
+        return - Dictionary with
+                    positions, keys, scores: Top k FR positions (int64), keys and scores of shape (queries, k)
+                    above: (query rows, FR positions, scores) of the pairs above the threshold, or None
+        """
+        if self.rows is None:
+            raise RuntimeError("The shard has no IDF yet")
+        queries = self.query_rows(terms, rows)
+        n_queries = queries.shape[0]
+        k = min(int(k or 0), len(self.keys))
+        best_scores = np.empty((n_queries, 0))
+        best_positions = np.empty((n_queries, 0), dtype=np.int64)
+        above = ([], [], [])
+
+        with stage("shard_query", shard=self.shard, queries=n_queries, frs=len(self.keys)):
+            for start in range(0, len(self.keys), SCORE_BLOCK):
+                end = min(start + SCORE_BLOCK, len(self.keys))
+                scores = (queries @ self.rows[start:end].T).toarray()
+                if k:
+                    block_best, block_scores = top_k(scores, k)
+                    best_scores, best_positions = merge_top_k(best_scores, best_positions, block_scores,
+                                                              self.positions[start:end][block_best], k)
+                if threshold is not None:
+                    rows_above, columns_above = np.nonzero(scores > threshold)
+                    above[0].append(rows_above)
+                    above[1].append(self.positions[start:end][columns_above])
+                    above[2].append(scores[rows_above, columns_above])
+
+        local = np.searchsorted(self.positions, best_positions)
+        return {
+            "positions": best_positions,
+            "keys": [[self.keys[j] for j in row] for row in local.tolist()],
+            "scores": best_scores,
+            "above": None if threshold is None else tuple(
+                np.concatenate(part) if part else np.empty(0) for part in above
+            ),
+        }
+
+    def handle(self, message):
+        command, arguments = message[0], message[1:]
+        if command == "statistics":
+            return self.statistics
+        if command == "idf":
+            self.set_idf(*arguments)
+            return len(self.keys)
+        if command == "query":
+            return self.query(*arguments)
+        raise ValueError(f"Unknown command {command!r}")
+
+
+def serve(worker: ShardWorker, address=("127.0.0.1", 0), authkey=DEFAULT_AUTHKEY, ready=None):
+    """
+    Answers coordinator requests until a 'shutdown' message
+
+    param - address: (host, port) to listen on, port 0 picks a free port
+    param - ready: Connection the listening address is sent to once the worker accepts connections
+    """
+    with Listener(address, authkey=authkey) as listener:
+        if ready is not None:
+            ready.send(listener.address)
+            ready.close()
+        while True:
+            with listener.accept() as connection:
+                while True:
+                    try:
+                        message = connection.recv()
+                    except EOFError:
+                        break
+                    if message[0] == "shutdown":
+                        connection.send(("ok", None))
+                        return
+                    try:
+                        connection.send(("ok", worker.handle(message)))
+                    except Exception:
+                        connection.send(("error", traceback.format_exc()))
+
+def run_worker(requirements_file, shard: int, shards: int, variant: str, address=("127.0.0.1", 0),
+               authkey=DEFAULT_AUTHKEY, chunk_size=10000, ready=None):
+    """
+    Loads a shard and serves it, the target of local worker processes
+    """
+    try:
+        worker = ShardWorker(requirements_file, shard, shards, variant, chunk_size)
+    except Exception:
+        if ready is None:
+            raise
+        ready.send(traceback.format_exc())
+        return
+    serve(worker, address, authkey, ready)
+
+
+class Coordinator:
+    """
+    NFR side of a sharded trace, fans the queries out to the shard workers and merges their results
+
+    param - addresses: (host, port) of every shard worker, in shard order
+    param - authkey: Authentication key of the workers
+    """
+    def __init__(self, addresses, authkey=DEFAULT_AUTHKEY):
+        self.addresses = [tuple(address) for address in addresses]
+        self.connections = [Client(address, authkey=authkey) for address in self.addresses]
+        self.terms = None
+
+    def request_all(self, messages):
+        """
+        Sends one message to every worker, then collects the replies, so the workers run at the same time
+
+        param - messages: One message for all workers, or a list with one message per worker
+        """
+        if not isinstance(messages, list):
+            messages = [messages] * len(self.connections)
+        for connection, message in zip(self.connections, messages):
+            connection.send(message)
+        # Every reply is read before raising, so no connection is left with an unread reply
+        replies = [connection.recv() for connection in self.connections]
+        for address, (status, reply) in zip(self.addresses, replies):
+            if status != "ok":
+                raise RuntimeError(f"Shard worker {address[0]}:{address[1]} failed:\n{reply}")
+        return [reply for _, reply in replies]
+
+    def prepare(self, requirements_file, variant: str, chunk_size=10000, cache=None, workers=1):
+        """
+        Reads and preprocesses the NFRs, computes the global IDF and sends every worker the IDF of its terms
+
+        return - nfr_keys: NFR keys in file order
+        """
+        statistics = TermStatistics()
+        self.nfr_keys = []
+        ordinal = 0
+        with stage("coordinator_prepare", shards=len(self.connections)) as record:
+            with PreprocessingPipeline(workers) as pipeline:
+                for info in iter_requirement_chunks(requirements_file, chunk_size):
+                    keys, nfr_indices, _ = split_chunk(info)
+                    if len(nfr_indices):
+                        nfrs = {keys[i]: info[keys[i]] for i in nfr_indices}
+                        statistics.add(preprocess_chunk(nfrs, variant, cache, pipeline=pipeline),
+                                       ordinal + nfr_indices)
+                        self.nfr_keys += list(nfrs)
+                    ordinal += len(keys)
+
+            parts = [statistics.finish()] + self.request_all(("statistics",))
+            documents = sum(part["documents"] for part in parts)
+            terms, inverse = np.unique(np.concatenate([part["terms"] for part in parts]).astype(str),
+                                       return_inverse=True)
+            frequency = np.bincount(inverse, weights=np.concatenate([part["document_frequency"] for part in parts]),
+                                    minlength=len(terms))
+            idf = np.log((1 + documents) / (1 + frequency)) + 1
+
+            # First sighting of every term over all parts, then the terms in the order they were first seen
+            first_document = np.concatenate([part["first_document"] for part in parts])
+            first_order = np.concatenate([part["first_order"] for part in parts])
+            entries = np.lexsort((first_order, first_document, inverse))
+            firsts = entries[np.concatenate([[True], np.diff(inverse[entries]) != 0])]
+            rank = np.empty(len(terms), dtype=np.int64)
+            rank[np.lexsort((first_order[firsts], first_document[firsts]))] = np.arange(len(terms))
+
+            bounds = np.cumsum([0] + [len(part["terms"]) for part in parts])
+            self.request_all([("idf", idf[inverse[start:end]], rank[inverse[start:end]])
+                              for start, end in zip(bounds[1:-1], bounds[2:])])
+
+            self.terms, self.idf, self.rank = terms.astype(object), idf, rank
+            self.nfr_rows = self.transform(statistics.texts)
+            record.count(nfrs=len(self.nfr_keys), frs=documents - len(self.nfr_keys), terms=len(terms))
+        return self.nfr_keys
+
+    def transform(self, preprocessed_text: list):
+        """
+        TF-IDF rows of preprocessed requirement text (joined tokens) in the global vocabulary, nothing is refit
+        """
+        return weigh_rows(preprocessed_text, self.terms, self.idf, self.rank)
+
+    def query(self, rows, k=10, threshold=None):
+        """
+        Top k FRs over every shard and the FRs above the threshold for TF-IDF rows in the global vocabulary
+
+        param - rows: CSR matrix of shape (queries, global terms), ex. self.transform(texts)
+
+        return - Dictionary with
+                    positions, keys, scores: Top k FR positions, keys and scores of shape (queries, k)
+                    above: Per query list of (FR position, score) above the threshold in FR order, or None
+        """
+        rows = sp.csr_matrix(rows)
+        used = np.unique(rows.indices)
+        columns = np.searchsorted(used, rows.indices)
+        compact = sp.csr_matrix((rows.data, columns, rows.indptr), shape=(rows.shape[0], len(used)))
+        terms = self.terms[used]
+
+        replies = self.request_all(("query", terms, compact, k, threshold))
+        with stage("coordinator_merge", shards=len(replies), queries=rows.shape[0]):
+            positions = np.concatenate([reply["positions"] for reply in replies], axis=1)
+            scores = np.concatenate([reply["scores"] for reply in replies], axis=1)
+            keys = [sum((reply["keys"][i] for reply in replies), []) for i in range(rows.shape[0])]
+            # Score descending, ties by FR position, over the partial top k of every shard
+            order = np.lexsort((positions, -scores), axis=1)[:, :k]
+            result = {
+                "positions": np.take_along_axis(positions, order, axis=1),
+                "scores": np.take_along_axis(scores, order, axis=1),
+                "keys": [[keys[i][j] for j in row] for i, row in enumerate(order.tolist())],
+                "above": None,
+            }
+
+            if threshold is not None:
+                query_rows = np.concatenate([reply["above"][0] for reply in replies]).astype(np.intp)
+                fr_positions = np.concatenate([reply["above"][1] for reply in replies]).astype(np.int64)
+                above_scores = np.concatenate([reply["above"][2] for reply in replies])
+                order = np.lexsort((fr_positions, query_rows))
+                bounds = np.searchsorted(query_rows[order], np.arange(rows.shape[0] + 1))
+                result["above"] = [list(zip(fr_positions[order[start:end]].tolist(),
+                                            above_scores[order[start:end]].tolist()))
+                                   for start, end in zip(bounds[:-1], bounds[1:])]
+        return result
+
+    def query_text(self, preprocessed_text: list, k=10, threshold=None):
+        """
+        Traces new preprocessed requirement text (joined tokens) against the sharded FRs, nothing is refit
+        """
+        return self.query(self.transform(preprocessed_text), k, threshold)
+
+    def shutdown(self):
+        """
+        Stops every worker
+        """
+        self.request_all(("shutdown",))
+        self.close()
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+        self.connections = []
+
+
+def distributed_trace(coordinator: Coordinator, requirements_file, output_path, variant: str, top_n=10,
+                      threshold=0.14, chunk_size=10000):
+    """
+    Traces the NFRs of a requirements file against the sharded FRs and writes the top N and trace files in
+    the format of the runner ('top_n_results_<variant>.csv', 'trace_<variant>.csv')
+
+    return - Dictionary of output name -> path
+    """
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+    nfr_keys = coordinator.prepare(requirements_file, variant, chunk_size)
+    result = coordinator.query(coordinator.nfr_rows, top_n, threshold)
+
+    top_n_file = output_path / f"top_n_results_{variant}.csv"
+    with stage("write_top_n", nfrs=len(nfr_keys)), top_n_file.open("w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["NFR", "Rank", "FR", "Similarity"])
+        for nfr, keys, scores in zip(nfr_keys, result["keys"], result["scores"].tolist()):
+            for rank, (fr, score) in enumerate(zip(keys, scores), start=1):
+                writer.writerow([nfr, rank, fr, f"{score:.3f}"])
+
+    # Only the links are held, the FR rows of the trace come from reading the file again
+    links = {}
+    for i, pairs in enumerate(result["above"]):
+        for position, _ in pairs:
+            links.setdefault(position, set()).add(i)
+    trace_file = output_path / f"trace_{variant}.csv"
+    with stage("write_trace", links=sum(len(nfrs) for nfrs in links.values())), \
+            trace_file.open("w", newline="") as file:
+        writer = csv.writer(file)
+        position = 0
+        for info in iter_requirement_chunks(requirements_file, chunk_size):
+            keys, _, fr_indices = split_chunk(info)
+            for key in (keys[j] for j in fr_indices):
+                linked = links.get(position, ())
+                writer.writerow([key] + [int(i in linked) for i in range(len(nfr_keys))])
+                position += 1
+    return {"top_n": top_n_file, "trace": trace_file}
+
+def start_local_workers(requirements_file, shards: int, variant: str, authkey=DEFAULT_AUTHKEY, chunk_size=10000):
+    """
+    Starts one local worker process per shard, listening on free ports of 127.0.0.1
+
+    return - processes: Worker processes
+           - addresses: (host, port) of every worker, in shard order
+    """
+    processes, addresses, pipes = [], [], []
+    for shard in range(shards):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=run_worker, name=f"trace-shard-{shard}", daemon=True,
+            args=(requirements_file, shard, shards, variant, ("127.0.0.1", 0), authkey, chunk_size, sender),
+        )
+        process.start()
+        sender.close()
+        processes.append(process)
+        pipes.append(receiver)
+    for shard, receiver in enumerate(pipes):
+        try:
+            address = receiver.recv()
+        except EOFError:
+            raise RuntimeError(f"Shard worker {shard} exited before it was ready") from None
+        if isinstance(address, str):
+            raise RuntimeError(f"Shard worker {shard} failed:\n{address}")
+        addresses.append(address)
+    return processes, addresses
+
+def parse_address(text: str):
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sharded tracing with FR shard workers and a coordinator")
+    parser.add_argument("--authkey", default=DEFAULT_AUTHKEY.decode(), help="Shared key of the workers")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    worker = commands.add_parser("worker", help="Serve one FR shard")
+    worker.add_argument("requirements", help="Requirements file")
+    worker.add_argument("--shard", required=True, help="Shard as <number>/<shards>, numbers from 0")
+    worker.add_argument("--variant", default="variant1", choices=list(VARIANT_STAGES))
+    worker.add_argument("--host", default="127.0.0.1")
+    worker.add_argument("--port", type=int, required=True)
+    worker.add_argument("--chunk-size", type=int, default=10000)
+
+    for name, help_text in (("trace", "Trace with running shard workers"), ("local", "Trace with local workers")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("requirements", help="Requirements file")
+        command.add_argument("--variant", default="variant1", choices=list(VARIANT_STAGES))
+        command.add_argument("--output", required=True, help="Output folder")
+        command.add_argument("--top-n", type=int, default=10)
+        command.add_argument("--threshold", type=float, default=0.14)
+        command.add_argument("--chunk-size", type=int, default=10000)
+        if name == "trace":
+            command.add_argument("--connect", nargs="+", required=True, help="host:port of every worker")
+            command.add_argument("--shutdown", action="store_true", help="Stop the workers afterwards")
+        else:
+            command.add_argument("--shards", type=int, default=2)
+    args = parser.parse_args(argv)
+    authkey = args.authkey.encode()
+
+    if args.command == "worker":
+        shard, shards = (int(value) for value in args.shard.split("/"))
+        worker = ShardWorker(args.requirements, shard, shards, args.variant, args.chunk_size)
+        print(f"shard {shard}/{shards}: {len(worker.keys)} FRs, listening on {args.host}:{args.port}")
+        serve(worker, (args.host, args.port), authkey)
+        return
+
+    processes = []
+    if args.command == "local":
+        processes, addresses = start_local_workers(args.requirements, args.shards, args.variant, authkey,
+                                                   args.chunk_size)
+    else:
+        addresses = [parse_address(address) for address in args.connect]
+    coordinator = Coordinator(addresses, authkey)
+    try:
+        outputs = distributed_trace(coordinator, args.requirements, args.output, args.variant, args.top_n,
+                                    args.threshold, args.chunk_size)
+    finally:
+        if processes or args.shutdown:
+            coordinator.shutdown()
+        else:
+            coordinator.close()
+        for process in processes:
+            process.join()
+    for name, path in outputs.items():
+        print(f"{name}: {path}")
+
+if __name__ == "__main__":
+    main()
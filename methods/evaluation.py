@@ -0,0 +1,190 @@
+"""
+Evaluation of the similarity scores against a ground truth trace
+
+All NFR x FR scores are sorted once and swept from the highest to the lowest score. Every distinct score is
+an operating point: the trace at threshold t is every pair scoring above t, the same rule as threshold_trace.
+Precision, recall, F1 and MAP at every threshold come out of cumulative sums over the sorted scores, so
+tuning a threshold is one O(n log n) pass instead of one pipeline run per candidate value.
+"""
+import csv
+from pathlib import Path
+
+import numpy as np
+
+
+def load_trace(path):
+    """
+    Reads a trace file with lines like 'FR1,0,1,0' (one 0/1 column per NFR)
+
+    param - path: Trace file
+
+    return - trace: Dictionary of FR key -> list of 0/1 per NFR
+    """
+    trace = {}
+    with open(path, "r", newline="") as file:
+        for row in csv.reader(file):
+            if row:
+                trace[row[0].strip()] = [int(value) for value in row[1:]]
+    return trace
+
+def truth_matrix(trace: dict, nfr_keys: list, fr_keys: list):
+    """
+    Ground truth in the shape of the similarity block, the trace columns are in NFR order (NFR1, NFR2, ...)
+
+    return - truth: Boolean array of shape (|NFR|, |FR|), FRs missing from the trace have no links
+    """
+    truth = np.zeros((len(nfr_keys), len(fr_keys)), dtype=bool)
+    for j, fr in enumerate(fr_keys):
+        values = trace.get(fr)
+        if values is None:
+            continue
+        if len(values) != len(nfr_keys):
+            raise ValueError(f"Trace row of {fr} has {len(values)} NFR columns, expected {len(nfr_keys)}")
+        truth[:, j] = np.array(values, dtype=bool)
+    return truth
+
+def sweep(scores, relevant):
+    """
+    Precision, recall and F1 at every distinct score used as the threshold
+
+    param - scores: Scores of any shape
+    param - relevant: Ground truth of the same shape
+
+    return - Dictionary of arrays, one entry per threshold from the highest to the lowest:
+             threshold, predicted (pairs above the threshold), true_positives, precision, recall, f1
+    """
+    scores = np.asarray(scores, dtype=np.float64).ravel()
+    relevant = np.asarray(relevant, dtype=bool).ravel()
+
+    order = np.argsort(-scores, kind="stable")
+    true_positives = np.concatenate([[0], np.cumsum(relevant[order])])
+
+    # First position of every distinct score in the sorted scores is the number of scores above it
+    negated, predicted = np.unique(-scores[order], return_index=True)
+    thresholds = -negated
+    hits = true_positives[predicted]
+    total = relevant.sum()
+
+    precision = np.divide(hits, predicted, out=np.zeros(len(hits)), where=predicted > 0)
+    recall = hits / total if total else np.zeros(len(hits))
+    f1 = np.divide(2 * precision * recall, precision + recall,
+                   out=np.zeros(len(hits)), where=(precision + recall) > 0)
+
+    return {
+        "threshold": thresholds,
+        "predicted": predicted,
+        "true_positives": hits,
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+    }
+
+def average_precision(similarity, truth, thresholds):
+    """
+    Average precision of every NFR ranking cut at every threshold
+
+    Each NFR row is sorted once (ties in FR order like top_k). The precision at every relevant FR is summed
+    cumulatively, so the AP of the FRs above any threshold is a lookup.
+
+    param - similarity: Array of shape (|NFR|, |FR|)
+    param - truth: Boolean array of shape (|NFR|, |FR|)
+    param - thresholds: Thresholds to cut the rankings at
+
+    return - ap: Array of shape (|NFR|, len(thresholds)), NaN for NFRs without any ground truth link
+             full: Array of shape (|NFR|,) with the AP of the whole ranking
+    """
+    similarity = np.asarray(similarity, dtype=np.float64)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    ap = np.full((similarity.shape[0], len(thresholds)), np.nan)
+    full = np.full(similarity.shape[0], np.nan)
+
+    for i in range(similarity.shape[0]):
+        order = np.argsort(-similarity[i], kind="stable")
+        relevant = truth[i][order]
+        links = relevant.sum()
+        if not links:
+            continue
+
+        precision_at = np.cumsum(relevant) / np.arange(1, len(relevant) + 1)
+        cumulative = np.concatenate([[0.0], np.cumsum(precision_at * relevant)])
+        above = np.searchsorted(-similarity[i][order], -thresholds, side="left")
+        ap[i] = cumulative[above] / links
+        full[i] = cumulative[-1] / links
+
+    return ap, full
+
+def best_point(result: dict):
+    """
+    Operating point with the highest F1, the highest threshold wins a tie
+
+    return - Dictionary of the values at that threshold
+    """
+    best = int(np.argmax(result["f1"]))
+    return {name: values[best].item() for name, values in result.items()}
+
+def evaluate(similarity, truth, nfr_keys=None):
+    """
+    Sweeps every threshold for all NFRs together and for each NFR separately
+
+    param - similarity: Array of shape (|NFR|, |FR|)
+    param - truth: Boolean array of shape (|NFR|, |FR|)
+    param - nfr_keys: NFR keys in row order, used as the names of the per NFR results
+
+    return - Dictionary with
+             'overall': sweep over every NFR x FR pair, with a 'map' array (MAP at each threshold)
+             'best': best operating point of 'overall'
+             'map': MAP of the full rankings
+             'per_nfr': Dictionary of NFR key -> {'sweep', 'best', 'ap'}
+    """
+    similarity = np.asarray(similarity)
+    truth = np.asarray(truth, dtype=bool)
+    nfr_keys = list(nfr_keys) if nfr_keys is not None else [f"NFR{i + 1}" for i in range(similarity.shape[0])]
+
+    overall = sweep(similarity, truth)
+    ap, full = average_precision(similarity, truth, overall["threshold"])
+    linked = ~np.isnan(full)
+    overall["map"] = ap[linked].mean(axis=0) if linked.any() else np.zeros(len(overall["threshold"]))
+
+    per_nfr = {}
+    for i, nfr in enumerate(nfr_keys):
+        result = sweep(similarity[i], truth[i])
+        nfr_ap, _ = average_precision(similarity[i:i + 1], truth[i:i + 1], result["threshold"])
+        result["map"] = np.nan_to_num(nfr_ap[0])
+        per_nfr[nfr] = {"sweep": result, "best": best_point(result), "ap": None if np.isnan(full[i]) else full[i].item()}
+
+    return {
+        "overall": overall,
+        "best": best_point(overall),
+        "map": full[linked].mean().item() if linked.any() else 0.0,
+        "per_nfr": per_nfr,
+    }
+
+def evaluate_variants(results: dict, trace: dict):
+    """
+    param - results: Dictionary of variant name -> (nfr_keys, fr_keys, similarity)
+    param - trace: Ground truth from load_trace
+
+    return - Dictionary of variant name -> evaluate(...) result
+    """
+    evaluations = {}
+    for name, (nfr_keys, fr_keys, similarity) in results.items():
+        evaluations[name] = evaluate(similarity, truth_matrix(trace, nfr_keys, fr_keys), nfr_keys)
+    return evaluations
+
+def write_evaluation(full_path: Path, evaluation: dict):
+    """
+    Writes every operating point of the overall and per NFR sweeps as CSV
+    """
+    columns = ["threshold", "predicted", "true_positives", "precision", "recall", "f1", "map"]
+    with Path(full_path).open("w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Scope", "Threshold", "Predicted", "TruePositives", "Precision", "Recall", "F1", "MAP"])
+        scopes = [("ALL", evaluation["overall"])]
+        scopes += [(nfr, result["sweep"]) for nfr, result in evaluation["per_nfr"].items()]
+        for scope, result in scopes:
+            for position in range(len(result["threshold"])):
+                row = [scope]
+                for column in columns:
+                    value = result[column][position]
+                    row.append(int(value) if column in ("predicted", "true_positives") else f"{value:.6f}")
+                writer.writerow(row)
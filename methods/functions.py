@@ -1,62 +1,476 @@
 """
 Functions used in tracing process
 """
+import re
+from collections.abc import Mapping
+
+import numpy as np
+import scipy.sparse as sp
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
+from methods.metrics import stage
+from methods.vocabulary import TokenIds, TokenVectorizer
+
+
+def load_requirements(path):
+    """
+    Reads a requirements file with lines like 'NFR1 (Operational): text' or 'FR1: text'
+
+    param - path: Requirements file
+
+    return - info: Dictionary of requirement key (categories removed) -> requirement text
+    """
+    with stage("load") as record:
+        with open(path, "r") as file:
+            data = file.readlines()
+
+        info = {}
+        for line in data:
+            parsed = parse_requirement_line(line)
+            if parsed is not None:
+                info[parsed[0]] = parsed[1]
+        record.count(lines=len(data), requirements=len(info))
+    return info
 
-def tf_idf_cosine(info, output_path, variant_function):
-    keys, preprocessed_text = variant_function(info, output_path)
-    vectorizer = TfidfVectorizer()
+def parse_requirement_line(line: str):
+    """
+    return - (requirement key with the category removed, requirement text), or None for a line without ':'
+    """
+    parts = line.split(":", 1)
+    parts[0] = re.sub(r"\(.*?\)", "", parts[0])
+    parts[0] = parts[0].strip()
+
+    if len(parts) > 1:
+        parts[1] = parts[1].rstrip("\n")
+        parts[1] = parts[1].strip()
+        return parts[0], parts[1]
+    return None
+
+def split_requirement_types(keys):
+    """
+    Splits requirement keys into NFR and FR row positions using the key prefix
+
+    param - keys: Requirement keys in row order (ex. 'NFR1', 'FR12')
+
+    return - nfr_indices: Row positions of the non-functional requirements
+           - fr_indices: Row positions of the functional requirements
+    """
+    nfr_indices = []
+    fr_indices = []
 
-    tf_idf_matrix = vectorizer.fit_transform(preprocessed_text)
+    for idx, key in enumerate(keys):
+        if key.upper().startswith("NFR"):
+            nfr_indices.append(idx)
+        elif key.upper().startswith("FR"):
+            fr_indices.append(idx)
+        else:
+            raise ValueError(f"Unknown requirement type for key '{key}'")
+
+    return np.array(nfr_indices, dtype=np.intp), np.array(fr_indices, dtype=np.intp)
+
+def nfr_fr_similarity(tf_idf_matrix, nfr_indices, fr_indices, dtype=np.float64):
+    """
+    Cosine similarity between NFR rows and FR rows only
+
+    The TF-IDF rows are already L2 normalized, so the cosine similarity is the dot product of the rows.
+    Only the |NFR| x |FR| block is computed, no NFR x NFR or FR x FR pairs.
+
+    param - tf_idf_matrix: Sparse TF-IDF matrix with L2 normalized rows
+    param - nfr_indices: Row positions of the NFRs
+    param - fr_indices: Row positions of the FRs
+    param - dtype: Output type (np.float64 or np.float32)
+
+    return - similarity: Dense array of shape (|NFR|, |FR|)
+    """
+    with stage("similarity", nfrs=len(nfr_indices), frs=len(fr_indices)) as record:
+        tf_idf_matrix = tf_idf_matrix.tocsr().astype(dtype, copy=False)
+        nfr_rows = tf_idf_matrix[nfr_indices]
+        fr_rows = tf_idf_matrix[fr_indices]
+
+        similarity = nfr_rows @ fr_rows.T
+        record.count(nonzeros=similarity.nnz)
+        return np.asarray(similarity.toarray(), dtype=dtype)
+
+def tf_idf_vectorize(info, output_path, variant_function, dtype=np.float64, **variant_options):
+    """
+    Preprocesses the requirements and fits the TF-IDF vectorizer
+
+    param - info: Dictionary of requirement key -> requirement text
+    param - output_path: Folder the preprocessing results are written to
+    param - variant_function: Preprocessing variant (variant1, variant2, variant3)
+    param - dtype: Type of the TF-IDF values
+    param - variant_options: Passed on to the variant function (ex. cache, vocabulary)
+
+    return - keys: Requirement keys in row order
+           - vectorizer: Fitted TfidfVectorizer, or TokenVectorizer when the variant returns token IDs
+           - tf_idf_matrix: Sparse TF-IDF matrix with L2 normalized rows
+    """
+    keys, preprocessed_text = variant_function(info, output_path, **variant_options)
+    with stage("vectorize", documents=len(preprocessed_text)) as record:
+        if isinstance(preprocessed_text, TokenIds):
+            vectorizer = TokenVectorizer(preprocessed_text.vocabulary, dtype)
+        else:
+            vectorizer = TfidfVectorizer(dtype=dtype)
+
+        tf_idf_matrix = vectorizer.fit_transform(preprocessed_text)
+        record.count(vocabulary=len(vectorizer.vocabulary_), nonzeros=tf_idf_matrix.nnz)
+    return keys, vectorizer, tf_idf_matrix
+
+def sample_positions(count: int, sample=None, seed=0):
+    """
+    Sorted positions of a random sample, every position if sample is None
+    """
+    if sample is None or sample >= count:
+        return np.arange(count)
+    return np.sort(np.random.default_rng(seed).choice(count, size=sample, replace=False))
+
+def tf_idf_similarity(info, output_path, variant_function, dtype=np.float64, verbose=False, sample=20,
+                      **variant_options):
+    """
+    Preprocesses the requirements, vectorizes them and computes the NFR x FR similarity block
+
+    param - info: Dictionary of requirement key -> requirement text
+    param - output_path: Folder the preprocessing results are written to
+    param - variant_function: Preprocessing variant (variant1, variant2, variant3)
+    param - dtype: Type of the TF-IDF values and similarity scores
+    param - verbose: Print the TF-IDF weights and the similarity scores
+    param - sample: Only print the weights of this many random requirements and the scores of this many
+                    random FRs per NFR, None prints everything
+    param - variant_options: Passed on to the variant function (ex. cache)
+
+    return - nfr_keys: NFR keys in row order of the similarity block
+           - fr_keys: FR keys in column order of the similarity block
+           - similarity: Array of shape (|NFR|, |FR|)
+    """
+    keys, vectorizer, tf_idf_matrix = tf_idf_vectorize(info, output_path, variant_function, dtype, **variant_options)
+    nfr_indices, fr_indices = split_requirement_types(keys)
+    nfr_keys = [keys[i] for i in nfr_indices]
+    fr_keys = [keys[j] for j in fr_indices]
+
+    if verbose:
+        print_tf_idf(vectorizer, tf_idf_matrix, nfr_indices, fr_indices, sample)
+    similarity = nfr_fr_similarity(tf_idf_matrix, nfr_indices, fr_indices, dtype)
+    if verbose:
+        print_similarity(nfr_keys, fr_keys, similarity, sample)
+
+    return nfr_keys, fr_keys, similarity
+
+def print_tf_idf(vectorizer, tf_idf_matrix, nfr_indices, fr_indices, sample=20):
+    """
+    Prints the TF-IDF weights of a random sample of requirements (every requirement if sample is None)
+    """
     feature_names = vectorizer.get_feature_names_out()
+    tf_idf_matrix = tf_idf_matrix.tocsr()
+    labels = {}
+    for position, req_idx in enumerate(nfr_indices, start=1):
+        labels[req_idx] = f"NFR {position}"
+    for position, req_idx in enumerate(fr_indices, start=1):
+        labels[req_idx] = f"FR {position}"
+
     print("TF-IDF RESULT:")
-    for req_idx in range(tf_idf_matrix.shape[0]):
+    for req_idx in sample_positions(tf_idf_matrix.shape[0], sample):
         row = tf_idf_matrix[req_idx]
         for col_idx, value in zip(row.indices, row.data):
-            if req_idx in [0, 1, 2]:
-                print(f"NFR {req_idx + 1}, Word '{feature_names[col_idx]}': {value:.3f}")
-            else:
-                print(f"FR {req_idx - 2}, Word '{feature_names[col_idx]}': {value:.3f}")
+            print(f"{labels[req_idx]}, Word '{feature_names[col_idx]}': {value:.3f}")
 
-    similarity = cosine_similarity(tf_idf_matrix)
+def print_similarity(nfr_keys, fr_keys, similarity, sample=20):
+    """
+    Prints the scores of a random sample of FRs for every NFR (every FR if sample is None)
+    """
     print("COSINE SIMILARITY (NFR to FR)")
-    for i in range(3):
-        for j in range(3, len(keys)):
-            print(f"{keys[i]} -> {keys[j]}: {similarity[i][j]:.3f}")
-
-    nfr_indices = [0, 1, 2]
-    result = {
-        keys[0]: [],
-        keys[1]: [],
-        keys[2]: [],
-    }
-
-    for i in nfr_indices:
-        for j in range(3, len(keys)):
-            result[keys[i]].append((keys[j], similarity[i][j]))
-    return result
+    for i, nfr in enumerate(nfr_keys):
+        for j in sample_positions(len(fr_keys), sample, seed=i):
+            print(f"{nfr} -> {fr_keys[j]}: {similarity[i][j]:.3f}")
+
+class TraceResult(Mapping):
+    """
+    NFR -> FR results backed by the key tables and arrays, no Python object per pair
+
+    The scores are one of
+        - the full similarity block of shape (|NFR|, |FR|), column j is FR j (indices is None)
+        - ranked scores of shape (|NFR|, k) with the FR positions of every rank in indices (int32)
+        - the 0/1 links of a trace of shape (|NFR|, |FR|) (ex. trace)
+    Arrays are kept as they are given, rows, columns and top N prefixes are views. Scores cost their dtype per
+    pair (8 bytes, 4 with dtype=np.float32 in tf_idf_similarity) instead of a (key, score) tuple.
+
+    It is also a read-only mapping of NFR key -> list of (FR key, score) like the dictionaries the stages used
+    to pass around, the lists are made when an NFR is looked up.
+
+    param - nfr_keys: NFR keys in row order
+    param - fr_keys: FR keys in column order
+    param - scores: Scores (or links) of every NFR row
+    param - indices: FR positions of the ranked scores, None for the full block
+    """
+    def __init__(self, nfr_keys: list, fr_keys: list, scores, indices=None):
+        self.nfr_keys = list(nfr_keys)
+        self.fr_keys = list(fr_keys)
+        self.scores = np.asarray(scores)
+        self.indices = None if indices is None else np.asarray(indices, dtype=np.int32)
+        self.positions = None
+        self.fr_positions = None
+
+        expected = len(self.fr_keys) if indices is None else self.indices.shape[1]
+        if self.scores.shape != (len(self.nfr_keys), expected):
+            raise ValueError(f"Scores of shape {self.scores.shape} don't match {len(self.nfr_keys)} NFRs "
+                             f"and {expected} {'FRs' if indices is None else 'ranks'}")
+
+    @property
+    def ranked(self):
+        return self.indices is not None
+
+    def nfr_position(self, nfr: str):
+        if self.positions is None:
+            self.positions = {key: i for i, key in enumerate(self.nfr_keys)}
+        return self.positions[nfr]
+
+    def fr_position(self, fr: str):
+        if self.fr_positions is None:
+            self.fr_positions = {key: j for j, key in enumerate(self.fr_keys)}
+        return self.fr_positions[fr]
+
+    def row(self, nfr: str):
+        """
+        return - positions: FR positions of the NFR's scores (rank order when ranked)
+               - scores: View of the NFR's scores
+        """
+        i = self.nfr_position(nfr)
+        if self.ranked:
+            return self.indices[i], self.scores[i]
+        return np.arange(len(self.fr_keys), dtype=np.int32), self.scores[i]
+
+    def column(self, fr: str):
+        """
+        return - View of the scores (or links) of one FR for every NFR, in NFR order
+        """
+        if self.ranked:
+            raise ValueError("Ranked results have no FR columns, use the full block")
+        return self.scores[:, self.fr_position(fr)]
+
+    def top(self, k: int):
+        """
+        Top k FRs of every NFR in descending order of score, ties in FR order (see top_k)
+
+        return - Ranked TraceResult, a view when these results are already ranked at least k deep
+        """
+        if self.ranked:
+            k = min(int(k), self.indices.shape[1])
+            return TraceResult(self.nfr_keys, self.fr_keys, self.scores[:, :k], self.indices[:, :k])
+        indices, scores = top_k(self.scores, k)
+        return TraceResult(self.nfr_keys, self.fr_keys, scores, indices)
+
+    def trace(self, threshold=0.14):
+        """
+        return - Links of the pairs scoring above the threshold (see threshold_trace) as a TraceResult
+        """
+        if self.ranked:
+            raise ValueError("Ranked results can't be traced, use the full block")
+        return TraceResult(self.nfr_keys, self.fr_keys, threshold_trace(self.scores, threshold).T)
+
+    def rows(self):
+        """
+        return - Yields (NFR key, FR positions, scores) for every NFR
+        """
+        for nfr in self.nfr_keys:
+            yield (nfr, *self.row(nfr))
+
+    def columns(self):
+        """
+        return - Yields (FR key, scores of every NFR) for every FR
+        """
+        for j, fr in enumerate(self.fr_keys):
+            yield fr, self.scores[:, j]
+
+    def __getitem__(self, nfr: str):
+        positions, scores = self.row(nfr)
+        return [(self.fr_keys[j], score) for j, score in zip(positions.tolist(), scores)]
+
+    def __iter__(self):
+        return iter(self.nfr_keys)
+
+    def __len__(self):
+        return len(self.nfr_keys)
+
+
+class TraceLinks(Mapping):
+    """
+    FR -> NFR links of a trace backed by one array
+
+    It is a read-only mapping of FR key -> list of 0/1 per NFR (in NFR order), the dictionary
+    transpose_with_threshold used to return and the rows of the trace CSV. The lists are made when a FR is
+    looked up.
+
+    param - nfr_keys: NFR keys in column order
+    param - fr_keys: FR keys in row order
+    param - links: 0/1 array of shape (|FR|, |NFR|) (ex. threshold_trace)
+    """
+    def __init__(self, nfr_keys: list, fr_keys: list, links):
+        self.nfr_keys = list(nfr_keys)
+        self.fr_keys = list(fr_keys)
+        self.links = np.asarray(links)
+        self.positions = None
+
+        if self.links.shape != (len(self.fr_keys), len(self.nfr_keys)):
+            raise ValueError(f"Links of shape {self.links.shape} don't match {len(self.fr_keys)} FRs "
+                             f"and {len(self.nfr_keys)} NFRs")
+
+    def fr_position(self, fr: str):
+        if self.positions is None:
+            self.positions = {key: j for j, key in enumerate(self.fr_keys)}
+        return self.positions[fr]
+
+    def __getitem__(self, fr: str):
+        return self.links[self.fr_position(fr)].tolist()
+
+    def __iter__(self):
+        return iter(self.fr_keys)
+
+    def __len__(self):
+        return len(self.fr_keys)
+
+
+def similarity_to_results(nfr_keys, fr_keys, similarity):
+    """
+    Wraps the similarity block as the NFR -> FR results
+
+    param - nfr_keys: NFR keys in row order
+    param - fr_keys: FR keys in column order
+    param - similarity: Array of shape (|NFR|, |FR|)
+
+    return - result: TraceResult over the similarity block (not copied)
+    """
+    return TraceResult(nfr_keys, fr_keys, similarity)
+
+def tf_idf_cosine(info, output_path, variant_function, dtype=np.float64, verbose=False, sample=20, **variant_options):
+    nfr_keys, fr_keys, similarity = tf_idf_similarity(info, output_path, variant_function, dtype, verbose, sample,
+                                                      **variant_options)
+    return similarity_to_results(nfr_keys, fr_keys, similarity)
+
+def top_k(similarity, k):
+    """
+    Top k FRs for every NFR row at once, in descending order of score
+
+    Only the top k candidates of each row are selected (partial selection) and sorted: the scores above the
+    k-th largest score, and the first FRs scoring exactly the k-th score for the slots that are left. On sparse
+    rows (most scores 0) the ties at the k-th score are picked by position without sorting them.
+    Ties keep the FR order, the same as merge_sort, so top_k(...)[:, :n] matches merge_sort(...)[:n].
+
+    param - similarity: Array of shape (|NFR|, |FR|)
+    param - k: Number of results per NFR, limited to |FR|
+
+    return - indices: FR column positions of shape (|NFR|, k)
+           - scores: Scores of shape (|NFR|, k)
+    """
+    similarity = np.asarray(similarity)
+    n_rows, n_cols = similarity.shape
+    k = max(0, min(int(k), n_cols))
+    if k == 0 or n_rows == 0:
+        return np.empty((n_rows, k), dtype=np.intp), np.empty((n_rows, k), dtype=similarity.dtype)
+
+    with stage("top_k", rows=n_rows, columns=n_cols, k=k) as record:
+        # k-th largest score of each row, the scores above it are candidates
+        kth_score = -np.partition(-similarity, k - 1, axis=1)[:, k - 1]
+        candidates = similarity > kth_score[:, None]
+        # The slots left are filled with the lowest FR positions scoring exactly the k-th score
+        needed = k - np.count_nonzero(candidates, axis=1)
+        tied = similarity == kth_score[:, None]
+        trimmed = np.flatnonzero(np.count_nonzero(tied, axis=1) > needed)
+        if len(trimmed):
+            tied[trimmed] &= np.cumsum(tied[trimmed], axis=1, dtype=np.int32) <= needed[trimmed, None]
+        candidates |= tied
+        rows, cols = np.nonzero(candidates)
+        record.count(candidates=len(rows))
+
+        # Exactly k candidates per row in FR order, a stable sort by score descending keeps ties in FR order
+        cols = cols.reshape(n_rows, k)
+        scores = similarity[rows, cols.ravel()].reshape(n_rows, k)
+        order = np.argsort(-scores, axis=1, kind="stable")
+        selected = (np.arange(n_rows)[:, None], order)
+
+    return cols[selected], scores[selected]
+
+def top_k_results(nfr_keys, fr_keys, similarity, k):
+    """
+    Top k results per NFR, in the same order as merge_sort
+
+    param - nfr_keys: NFR keys in row order
+    param - fr_keys: FR keys in column order
+    param - similarity: Array of shape (|NFR|, |FR|)
+    param - k: Number of results per NFR
+
+    return - result: Ranked TraceResult (NFR -> list of (FR key, score) in descending order when looked up)
+    """
+    return TraceResult(nfr_keys, fr_keys, similarity).top(k)
+
+def threshold_trace(similarity, threshold=0.14, sparse=False):
+    """
+    Binary FR x NFR trace matrix straight from the similarity block in one comparison
+
+    A FR traces to a NFR when the score is greater than the threshold, the same as transpose_with_threshold.
+
+    param - similarity: Array of shape (|NFR|, |FR|)
+    param - threshold: One of
+              - a single threshold for every NFR
+              - a per NFR threshold vector of shape (|NFR|,)
+              - a matrix of thresholds of shape (T, |NFR|) or (T, 1), one trace per row
+    param - sparse: Return scipy CSR matrices instead of dense arrays, useful when few pairs trace
+
+    return - trace: Array of shape (|FR|, |NFR|) with 1 for a trace and 0 otherwise,
+                    or shape (T, |FR|, |NFR|) (a list of T CSR matrices if sparse) for a matrix of thresholds
+    """
+    scores = np.asarray(similarity).T
+    thresholds = np.asarray(threshold, dtype=np.float64)
+
+    if thresholds.ndim > 2:
+        raise ValueError("threshold must be a scalar, a per NFR vector or a matrix of thresholds")
+
+    with stage("threshold", pairs=scores.size, thresholds=len(thresholds) if thresholds.ndim == 2 else 1) as record:
+        if thresholds.ndim == 2:
+            above = scores[None, :, :] > thresholds[:, None, :]
+        else:
+            above = scores > thresholds
+        record.count(traces=np.count_nonzero(above))
+
+        if sparse and thresholds.ndim == 2:
+            return [sp.csr_matrix(level, dtype=np.int8) for level in above]
+        if sparse:
+            return sp.csr_matrix(above, dtype=np.int8)
+        return above.astype(np.int8)
+
+def trace_to_results(fr_keys, trace):
+    """
+    Converts a FR x NFR trace matrix into the FR -> [0/1 per NFR] dictionary used by the trace CSV
+
+    param - fr_keys: FR keys in row order of the trace
+    param - trace: Dense array or sparse matrix of shape (|FR|, |NFR|)
+
+    return - frs_result: Dictionary of FR key -> list of 0/1 per NFR
+    """
+    if sp.issparse(trace):
+        trace = trace.toarray()
+    return dict(zip(fr_keys, trace.tolist()))
 
 def transpose_with_threshold(results, threshold=0.14):
-    frs_result = {}
-    nfr_keys = list(results.keys())
-
-    all_frs = []
-    for res in results[nfr_keys[0]]:
-        all_frs.append(res[0])
-
-    for fr in all_frs:
-        frs_result[fr] = []
-        for nfr in nfr_keys:
-            score = 0
-            for res in results[nfr]:
-                if res[0] == fr:
-                    score = res[1]
-                    break
-            frs_result[fr].append(1 if score > threshold else 0)
-    
-    return frs_result
+    """
+    Trace of the NFR -> FR results, a FR traces to a NFR when the score is greater than the threshold
+
+    param - results: TraceResult with the full block, or a dictionary of NFR key -> list of (FR key, score)
+
+    return - frs_result: TraceLinks, a mapping of FR key -> list of 0/1 per NFR
+    """
+    if not isinstance(results, TraceResult):
+        nfr_keys = list(results.keys())
+        fr_keys = [res[0] for res in results[nfr_keys[0]]]
+        fr_positions = {fr: j for j, fr in enumerate(fr_keys)}
+
+        similarity = np.zeros((len(nfr_keys), len(fr_keys)))
+        for i, nfr in enumerate(nfr_keys):
+            for fr, score in results[nfr]:
+                similarity[i, fr_positions[fr]] = score
+        results = TraceResult(nfr_keys, fr_keys, similarity)
+    elif results.ranked:
+        raise ValueError("Ranked results can't be traced, use the full block")
+
+    return TraceLinks(results.nfr_keys, results.fr_keys, threshold_trace(results.scores, threshold))
 
 def merge(left_array, right_array):
     """
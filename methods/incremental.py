@@ -0,0 +1,439 @@
+"""
+Incremental re-tracing when only a few requirements change
+
+The fitted vocabulary, document frequencies, raw term counts and the TF-IDF rows of the previous run are
+saved to a state file. A new version of the requirements is diffed against it: only new or edited
+requirements are preprocessed, the IDF is updated from the document frequencies, and only the TF-IDF rows
+and NFR x FR similarity rows/columns touched by the change are recomputed. The output files are patched
+line by line for the requirements whose results changed.
+
+Scores match a full TfidfVectorizer (smooth_idf, l2 norm) run up to floating point summation order,
+the vocabulary columns are kept in first seen order instead of being sorted.
+
+The state file records its format version and the top N, threshold and output folder it was saved with. A
+state from another version or with other parameters, or result files that went missing, start over with a
+full fit. Set '"incremental": true' in the run config (or run it with '--incremental') to trace every
+dataset/variant this way (see 'methods/runner.py').
+"""
+import csv
+import io
+import pickle
+from pathlib import Path
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from methods.functions import load_requirements, split_requirement_types, nfr_fr_similarity, top_k_results, threshold_trace
+from methods.variants import PreprocessingPipeline, split_cached
+
+# Format of the state file, saved states of another version are refit
+STATE_VERSION = 1
+
+
+def patch_lines(path: Path, updates: dict, order: list, key_of, header=(), newline="\n"):
+    """
+    Replaces the lines of the given keys in a keyed text file and keeps every other line as it is
+
+    param - path: File to patch, created if it does not exist
+    param - updates: Dictionary of key -> list of new lines (without line endings), an empty list removes the key
+    param - order: Every key in the order it should appear in the file
+    param - key_of: Function returning the key of a line, or None for header lines
+    param - header: Header lines of a new file
+    param - newline: Line ending of a new file, an existing file keeps its own
+
+    return - changed: True if the file was written
+    """
+    path = Path(path)
+    header = list(header)
+    blocks = {}
+
+    if path.exists():
+        with open(path, "r", newline="") as file:
+            lines = file.readlines()
+        newline = "\r\n" if lines and lines[0].endswith("\r\n") else "\n"
+        header = []
+        for line in lines:
+            text = line.rstrip("\r\n")
+            key = key_of(text)
+            if key is None:
+                header.append(text)
+            else:
+                blocks.setdefault(key, []).append(text)
+
+    changed = False
+    for key, new_lines in updates.items():
+        if blocks.get(key, []) != new_lines:
+            blocks[key] = new_lines
+            changed = True
+    if not changed and list(blocks) == [key for key in order if blocks.get(key)]:
+        return False
+
+    with open(path, "w", newline="") as file:
+        for text in header:
+            file.write(text + newline)
+        for key in order:
+            for text in blocks.get(key, []):
+                file.write(text + newline)
+    return True
+
+def csv_line(row):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow(row)
+    return buffer.getvalue()
+
+
+class IncrementalTrace:
+    """
+    TF-IDF and NFR x FR similarity state of one variant that can be updated in place
+
+    param - variant: 'variant1', 'variant2' or 'variant3'
+    param - pipeline: PreprocessingPipeline used for new and edited requirements
+    param - cache: PreprocessingCache or None
+    """
+    def __init__(self, variant: str, pipeline=None, cache=None):
+        self.variant = variant
+        self.pipeline = pipeline
+        self.cache = cache
+        self.analyzer = TfidfVectorizer().build_analyzer()
+
+        self.keys = []
+        self.texts = {}
+        self.tokens = {}
+        self.vocabulary = {}
+        self.counts = sp.csr_matrix((0, 0))
+        self.df = np.zeros(0, dtype=np.int64)
+        self.tf_idf = sp.csr_matrix((0, 0))
+        self.nfr_keys = []
+        self.fr_keys = []
+        self.similarity = np.zeros((0, 0))
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["pipeline"] = None
+        state["cache"] = None
+        state["analyzer"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.analyzer = TfidfVectorizer().build_analyzer()
+
+    def save(self, path: Path, parameters=None):
+        """
+        param - parameters: Dictionary of the settings the result files were written with (see state_parameters)
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        state = {"version": STATE_VERSION, "variant": self.variant, "parameters": parameters or {}, "trace": self}
+        with open(path, "wb") as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: Path, pipeline=None, cache=None, parameters=None):
+        """
+        param - parameters: Settings the saved state must have been saved with, None accepts any
+
+        return - trace, or None for a state file of another version, with other parameters or that can't be read
+        """
+        try:
+            with open(path, "rb") as file:
+                state = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+            return None
+        if parameters is not None and state["parameters"] != parameters:
+            return None
+        trace = state["trace"]
+        trace.pipeline = pipeline
+        trace.cache = cache
+        return trace
+
+    def preprocess(self, info: dict):
+        result, missing = split_cached(info, self.variant, self.cache)
+        if missing:
+            if self.pipeline is None:
+                self.pipeline = PreprocessingPipeline()
+            result.update(zip(missing, self.pipeline.variant(self.variant, list(missing.values()))))
+            if self.cache is not None:
+                self.cache.store(info, {key: result[key] for key in missing}, self.variant)
+        return result
+
+    def count_rows(self, token_lists: list):
+        """
+        Raw term counts of preprocessed requirements, new terms are added to the vocabulary
+        """
+        indptr = [0]
+        indices = []
+        data = []
+        for tokens in token_lists:
+            row = {}
+            for term in self.analyzer(" ".join(tokens)):
+                column = self.vocabulary.setdefault(term, len(self.vocabulary))
+                row[column] = row.get(column, 0) + 1
+            indices.extend(row)
+            data.extend(row.values())
+            indptr.append(len(indices))
+        return indptr, indices, data
+
+    def idf(self):
+        n_docs = len(self.keys)
+        return np.log((1 + n_docs) / (1 + self.df)) + 1
+
+    def weigh(self, counts):
+        """
+        TF-IDF rows with L2 normalization, the same as TfidfVectorizer
+        """
+        weighted = sp.csr_matrix(counts @ sp.diags(self.idf()))
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sp.csr_matrix(sp.diags(1 / norms) @ weighted)
+
+    def fit(self, info: dict):
+        """
+        Full fit of every requirement
+
+        return - summary: Dictionary with the changed NFRs, FRs and requirements (all of them)
+        """
+        self.keys = list(info)
+        self.texts = dict(info)
+        self.tokens = self.preprocess(info)
+        self.vocabulary = {}
+
+        indptr, indices, data = self.count_rows([self.tokens[key] for key in self.keys])
+        self.counts = sp.csr_matrix((data, indices, indptr), shape=(len(self.keys), len(self.vocabulary)),
+                                    dtype=np.float64)
+        self.df = np.bincount(self.counts.indices, minlength=len(self.vocabulary))
+        self.tf_idf = self.weigh(self.counts)
+        self.refresh_similarity()
+
+        return {"requirements": list(self.keys), "nfrs": list(self.nfr_keys), "frs": list(self.fr_keys)}
+
+    def refresh_similarity(self):
+        nfr_indices, fr_indices = split_requirement_types(self.keys)
+        self.nfr_keys = [self.keys[i] for i in nfr_indices]
+        self.fr_keys = [self.keys[j] for j in fr_indices]
+        self.similarity = nfr_fr_similarity(self.tf_idf, nfr_indices, fr_indices)
+
+    def update(self, info: dict):
+        """
+        Diffs the requirements against the saved state and recomputes only what the change touches
+
+        param - info: Dictionary of requirement key -> requirement text, the new version
+
+        return - summary: Dictionary with the keys of the changed requirements and of the NFRs/FRs whose
+                          similarity scores were recomputed
+        """
+        if not self.keys:
+            return self.fit(info)
+
+        edited = [key for key in info if key in self.texts and self.texts[key] != info[key]]
+        added = [key for key in info if key not in self.texts]
+        removed = [key for key in self.keys if key not in info]
+        changed = edited + added
+        if not changed and not removed and list(info) == self.keys:
+            return {"requirements": [], "nfrs": [], "frs": []}
+
+        self.tokens.update(self.preprocess({key: info[key] for key in changed}))
+        for key in removed:
+            del self.tokens[key]
+        indptr, indices, data = self.count_rows([self.tokens[key] for key in changed])
+        new_rows = sp.csr_matrix((data, indices, indptr), shape=(len(changed), len(self.vocabulary)),
+                                 dtype=np.float64)
+        self.counts.resize((len(self.keys), len(self.vocabulary)))
+        self.df = np.concatenate([self.df, np.zeros(len(self.vocabulary) - len(self.df), dtype=self.df.dtype)])
+
+        old_positions = {key: i for i, key in enumerate(self.keys)}
+        old_keys = self.keys
+        self.texts = dict(info)
+
+        if added or removed or list(info) != old_keys:
+            # The number of requirements changes every IDF value, renormalize every row from the stored counts
+            unchanged = [key for key in info if key not in changed]
+            new_positions = {key: i for i, key in enumerate(changed)}
+            stacked = sp.vstack([self.counts[[old_positions[key] for key in unchanged]], new_rows]).tocsr()
+            row_of = {key: i for i, key in enumerate(unchanged)}
+            row_of.update({key: len(unchanged) + new_positions[key] for key in changed})
+
+            self.keys = list(info)
+            self.counts = stacked[[row_of[key] for key in self.keys]]
+            self.df = np.bincount(self.counts.indices, minlength=len(self.vocabulary))
+            self.tf_idf = self.weigh(self.counts)
+            self.refresh_similarity()
+            return {"requirements": changed + removed, "nfrs": list(self.nfr_keys), "frs": list(self.fr_keys)}
+
+        # Only edits: the IDF changes for the terms whose document frequency changed
+        edited_rows = [old_positions[key] for key in edited]
+        old_presence = np.bincount(self.counts[edited_rows].indices, minlength=len(self.vocabulary))
+        new_presence = np.bincount(new_rows.indices, minlength=len(self.vocabulary))
+        changed_terms = np.flatnonzero(old_presence != new_presence)
+        self.df = self.df - old_presence + new_presence
+
+        keep = np.ones(len(self.keys))
+        keep[edited_rows] = 0
+        scatter = sp.csr_matrix(
+            (np.ones(len(edited_rows)), (edited_rows, np.arange(len(edited_rows)))),
+            shape=(len(self.keys), len(edited_rows)),
+        )
+        self.counts = sp.csr_matrix(sp.diags(keep) @ self.counts + scatter @ new_rows)
+
+        affected = set(edited_rows)
+        if len(changed_terms):
+            affected.update(self.counts[:, changed_terms].nonzero()[0].tolist())
+        affected = sorted(affected)
+        self.tf_idf.resize((len(self.keys), len(self.vocabulary)))
+
+        keep = np.ones(len(self.keys))
+        keep[affected] = 0
+        scatter = sp.csr_matrix(
+            (np.ones(len(affected)), (affected, np.arange(len(affected)))),
+            shape=(len(self.keys), len(affected)),
+        )
+        self.tf_idf = sp.csr_matrix(sp.diags(keep) @ self.tf_idf + scatter @ self.weigh(self.counts[affected]))
+
+        nfr_indices, fr_indices = split_requirement_types(self.keys)
+        affected_keys = {self.keys[i] for i in affected}
+        nfr_changed = [i for i, key in enumerate(self.nfr_keys) if key in affected_keys]
+        fr_changed = [j for j, key in enumerate(self.fr_keys) if key in affected_keys]
+        if nfr_changed:
+            self.similarity[nfr_changed, :] = nfr_fr_similarity(self.tf_idf, nfr_indices[nfr_changed], fr_indices)
+        if fr_changed:
+            self.similarity[:, fr_changed] = nfr_fr_similarity(self.tf_idf, nfr_indices, fr_indices[fr_changed])
+
+        return {
+            "requirements": changed,
+            "nfrs": [self.nfr_keys[i] for i in nfr_changed],
+            "frs": [self.fr_keys[j] for j in fr_changed],
+        }
+
+    def patch_outputs(self, output_path: Path, summary: dict, top_n=None, threshold=None):
+        """
+        Patches the preprocessing, top n and trace files of the variant for the changes in summary
+
+        param - output_path: Folder with the result files
+        param - summary: Return value of fit or update
+        param - top_n: Number of results per NFR in the top n file, skipped if None
+        param - threshold: Trace threshold of the trace file, skipped if None
+
+        return - files: Paths of the files that were written
+        """
+        output_path = Path(output_path)
+        written = []
+        changed_requirements = [key for key in summary["requirements"] if key in self.texts]
+        removed = [key for key in summary["requirements"] if key not in self.texts]
+
+        updates = {key: [f"{key}: {self.tokens[key]}"] for key in changed_requirements}
+        updates.update({key: [] for key in removed})
+        full_path = output_path / Path(f"preprocessing_{self.variant}.txt")
+        if patch_lines(full_path, updates, self.keys, lambda line: line.split(":", 1)[0]):
+            written.append(full_path)
+
+        if top_n is not None:
+            # A changed FR column can move into or out of the top n of every NFR
+            nfrs = self.nfr_keys if summary["frs"] else summary["nfrs"]
+            positions = {nfr: i for i, nfr in enumerate(self.nfr_keys)}
+            rows = np.array([positions[nfr] for nfr in nfrs], dtype=np.intp)
+            top = top_k_results(nfrs, self.fr_keys, self.similarity[rows], top_n)
+            updates = {
+                nfr: [csv_line([nfr, rank, fr, f"{score:.3f}"]) for rank, (fr, score) in enumerate(results, start=1)]
+                for nfr, results in top.items()
+            }
+            updates.update({key: [] for key in removed})
+            full_path = output_path / Path(f"top_n_results_{self.variant}.csv")
+            key_of = lambda line: None if line.startswith("NFR,Rank") else line.split(",", 1)[0]
+            if patch_lines(full_path, updates, self.nfr_keys, key_of, ["NFR,Rank,FR,Similarity"], "\r\n"):
+                written.append(full_path)
+
+        if threshold is not None:
+            # A changed NFR row can change the trace of every FR
+            frs = self.fr_keys if summary["nfrs"] else summary["frs"]
+            positions = {fr: j for j, fr in enumerate(self.fr_keys)}
+            columns = np.array([positions[fr] for fr in frs], dtype=np.intp)
+            trace = threshold_trace(self.similarity[:, columns], threshold)
+            updates = {fr: [csv_line([fr] + values)] for fr, values in zip(frs, trace.tolist())}
+            updates.update({key: [] for key in removed})
+            full_path = output_path / Path(f"trace_{self.variant}.csv")
+            if patch_lines(full_path, updates, self.fr_keys, lambda line: line.split(",", 1)[0], newline="\r\n"):
+                written.append(full_path)
+
+        return written
+
+
+def state_parameters(output_path: Path, top_n=None, threshold=None):
+    """
+    return - Dictionary of the settings a saved state is only valid for
+    """
+    return {"output_path": str(Path(output_path).resolve()), "top_n": top_n,
+            "threshold": None if threshold is None else float(threshold)}
+
+def output_files(output_path: Path, variant: str, top_n=None, threshold=None):
+    """
+    return - Result files patch_outputs keeps up to date
+    """
+    output_path = Path(output_path)
+    files = [output_path / f"preprocessing_{variant}.txt"]
+    if top_n is not None:
+        files.append(output_path / f"top_n_results_{variant}.csv")
+    if threshold is not None:
+        files.append(output_path / f"trace_{variant}.csv")
+    return files
+
+def incremental_trace(info: dict, output_path: Path, variant: str, state_path: Path, top_n=None, threshold=None,
+                      pipeline=None, cache=None):
+    """
+    Updates the saved trace of a variant to the requirements and patches its result files
+
+    A full fit is run when there is no usable state: no state file, a state of another version or saved with
+    another top N, threshold or output folder, or a result file that is missing.
+
+    param - info: Dictionary of requirement key -> requirement text
+    param - output_path: Folder with the result files
+    param - variant: 'variant1', 'variant2' or 'variant3'
+    param - state_path: File the trace state is saved to between runs
+    param - top_n: Number of results per NFR in the top n file, skipped if None
+    param - threshold: Trace threshold of the trace file, skipped if None
+
+    return - trace: Updated IncrementalTrace (keys and similarity block)
+           - summary: Dictionary with the changed requirements, NFRs and FRs
+           - files: Paths of the files that were written
+    """
+    state_path = Path(state_path)
+    parameters = state_parameters(output_path, top_n, threshold)
+
+    trace = None
+    if state_path.exists() and all(path.exists() for path in output_files(output_path, variant, top_n, threshold)):
+        trace = IncrementalTrace.load(state_path, pipeline, cache, parameters)
+    if trace is not None and trace.variant != variant:
+        raise ValueError(f"State file {state_path} belongs to {trace.variant}, not {variant}")
+
+    if trace is None:
+        trace = IncrementalTrace(variant, pipeline, cache)
+        summary = trace.fit(info)
+    else:
+        summary = trace.update(info)
+
+    files = trace.patch_outputs(output_path, summary, top_n, threshold)
+    trace.save(state_path, parameters)
+    return trace, summary, files
+
+def retrace(requirements_file: Path, output_path: Path, variant: str, state_path: Path,
+            top_n=None, threshold=None, pipeline=None, cache=None):
+    """
+    Updates the saved trace of a variant to the current requirements file and patches its result files
+
+    The first run (no usable state yet, see incremental_trace) is a full fit, later runs only redo what changed.
+
+    param - requirements_file: Requirements file
+    param - output_path: Folder with the result files
+    param - variant: 'variant1', 'variant2' or 'variant3'
+    param - state_path: File the trace state is saved to between runs
+    param - top_n: Number of results per NFR in the top n file, skipped if None
+    param - threshold: Trace threshold of the trace file, skipped if None
+
+    return - summary: Dictionary with the changed requirements, NFRs and FRs
+           - files: Paths of the files that were written
+    """
+    _, summary, files = incremental_trace(load_requirements(requirements_file), output_path, variant, state_path,
+                                          top_n, threshold, pipeline, cache)
+    return summary, files
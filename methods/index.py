@@ -0,0 +1,211 @@
+"""
+Inverted index over the TF-IDF term postings for pruned trace queries
+
+Most NFR x FR pairs share no terms and score exactly 0, so the index only visits the postings of the query
+terms. Terms are processed from the largest possible score contribution (query weight x largest posting
+weight) to the smallest. Once the contributions still left can't lift a new FR past the current k-th best
+(or past the threshold), no new FRs are added and candidates that can't reach it are dropped (MaxScore).
+The remaining candidates are rescored with the same sparse product as the brute force path, so the scores
+and the order (ties by FR position) match tf_idf_similarity + top_k exactly.
+"""
+import numpy as np
+import scipy.sparse as sp
+
+from methods.functions import split_requirement_types, tf_idf_vectorize, top_k
+
+# Slack on the bounds so floating point rounding of the partial sums never prunes a FR that ties or wins
+BOUND_SLACK = 1e-9
+
+
+class InvertedIndex:
+    """
+    Term postings of the indexed requirements
+
+    param - tf_idf_matrix: Sparse TF-IDF rows of the indexed requirements (ex. the FR rows)
+    param - keys: Requirement keys in row order
+    """
+    def __init__(self, tf_idf_matrix, keys=None):
+        self.rows = sp.csr_matrix(tf_idf_matrix)
+        self.keys = list(keys) if keys is not None else list(range(self.rows.shape[0]))
+        self.n_docs, self.n_terms = self.rows.shape
+
+        postings = self.rows.tocsc()
+        postings.sort_indices()
+        self.indptr = postings.indptr
+        self.doc_ids = postings.indices
+        self.weights = postings.data
+
+        self.max_weight = np.zeros(self.n_terms, dtype=np.float64)
+        nonempty = np.flatnonzero(np.diff(self.indptr))
+        if len(nonempty):
+            self.max_weight[nonempty] = np.maximum.reduceat(self.weights, self.indptr[nonempty])
+
+    @classmethod
+    def from_vectorizer(cls, vectorizer, tf_idf_matrix, keys=None):
+        """
+        Index built on a fitted vectorizer, new text can then be queried with query_text
+        """
+        index = cls(tf_idf_matrix, keys)
+        index.vectorizer = vectorizer
+        return index
+
+    def postings(self, term):
+        start, end = self.indptr[term], self.indptr[term + 1]
+        return self.doc_ids[start:end], self.weights[start:end]
+
+    def workspace(self):
+        """
+        Score accumulator, seen flags and a buffer for the candidate positions, reset after every query so a
+        batch reuses them
+        """
+        return (np.zeros(self.n_docs, dtype=np.float64), np.zeros(self.n_docs, dtype=bool),
+                np.empty(self.n_docs, dtype=np.intp))
+
+    def candidates(self, query_terms, query_weights, workspace, k=None, threshold=None):
+        """
+        FRs that can still be in the top k (or above the threshold) for one query row
+
+        param - query_terms: Term columns of the query
+        param - query_weights: TF-IDF weights of the query terms
+        param - k: Number of results, for top k queries
+        param - threshold: Score to beat, for threshold queries
+        param - workspace: Return value of workspace()
+
+        return - Sorted row positions of the candidate requirements, every other requirement is out
+        """
+        if len(query_terms) == 0:
+            return np.empty(0, dtype=np.intp)
+
+        bounds = query_weights * self.max_weight[query_terms]
+        order = np.argsort(-bounds, kind="stable")
+        remaining = np.concatenate([np.cumsum(bounds[order][::-1])[::-1][1:], [0.0]])
+        total = remaining[0] + bounds[order[0]]
+
+        accumulator, seen, found = workspace
+        n_found = 0
+        cutoff = -np.inf if threshold is None else threshold
+        stop = len(order)
+
+        # Collect every FR sharing a term until no new FR can make it
+        for step, position in enumerate(order):
+            docs, weights = self.postings(query_terms[position])
+            accumulator[docs] += query_weights[position] * weights
+            new_docs = docs[~seen[docs]]
+            seen[new_docs] = True
+            found[n_found:n_found + len(new_docs)] = new_docs
+            n_found += len(new_docs)
+
+            # The k-th best partial score is at most the bounds summed so far, only look it up once that
+            # could stop the loop
+            if k is not None and n_found >= k and remaining[step] < total - remaining[step] - BOUND_SLACK:
+                cutoff = np.partition(accumulator[found[:n_found]], n_found - k)[n_found - k]
+            if remaining[step] < cutoff - BOUND_SLACK:
+                stop = step + 1
+                break
+
+        candidates = found[:n_found].copy()
+        partial = accumulator[candidates]
+        accumulator[candidates] = 0
+        seen[candidates] = False
+
+        # Drop candidates that can't reach the cutoff, adding the rest of the terms only for the candidates left
+        for step in range(stop, len(order) + 1):
+            keep = partial + remaining[step - 1] >= cutoff - BOUND_SLACK
+            candidates, partial = candidates[keep], partial[keep]
+            if step == len(order) or len(candidates) == 0:
+                break
+
+            docs, weights = self.postings(query_terms[order[step]])
+            hits = np.searchsorted(docs, candidates)
+            found = hits < len(docs)
+            found[found] = docs[hits[found]] == candidates[found]
+            partial[found] += query_weights[order[step]] * weights[hits[found]]
+
+        return np.sort(candidates)
+
+    def exact_scores(self, query_row, candidates):
+        """
+        Scores of the candidates with the same sparse product as nfr_fr_similarity
+        """
+        return np.asarray((query_row @ self.rows[candidates].T).toarray()).ravel()
+
+    def top_k(self, queries, k):
+        """
+        Top k indexed requirements of every query row, the same result as functions.top_k on the full scores
+
+        param - queries: Sparse TF-IDF rows of the queries (ex. the NFR rows), same vocabulary as the index
+        param - k: Number of results per query
+
+        return - indices: Row positions in the index of shape (queries, k)
+               - scores: Scores of shape (queries, k)
+        """
+        queries = sp.csr_matrix(queries)
+        k = max(0, min(int(k), self.n_docs))
+        indices = np.zeros((queries.shape[0], k), dtype=np.intp)
+        scores = np.zeros((queries.shape[0], k), dtype=queries.dtype)
+        workspace = self.workspace()
+
+        for row in range(queries.shape[0]):
+            query_row = queries[row]
+            candidates = self.candidates(query_row.indices, query_row.data.astype(np.float64), workspace, k=k)
+            candidate_scores = self.exact_scores(query_row, candidates)
+
+            best, best_scores = top_k(candidate_scores[None, :], k)
+            chosen = candidates[best[0]]
+            # FRs sharing no term with the query score exactly 0 and fill the rest in FR order
+            positive = best_scores[0] > 0
+            chosen, chosen_scores = chosen[positive], best_scores[0][positive]
+            if len(chosen) < k:
+                zeros = np.setdiff1d(np.arange(min(self.n_docs, k + len(chosen))), chosen)[:k - len(chosen)]
+                chosen = np.concatenate([chosen, zeros])
+                chosen_scores = np.concatenate([chosen_scores, np.zeros(len(zeros), dtype=scores.dtype)])
+
+            indices[row] = chosen
+            scores[row] = chosen_scores
+
+        return indices, scores
+
+    def above_threshold(self, queries, threshold):
+        """
+        Indexed requirements scoring above the threshold for every query row
+
+        return - List per query of (row positions, scores) in FR order
+        """
+        queries = sp.csr_matrix(queries)
+        results = []
+        workspace = self.workspace()
+
+        for row in range(queries.shape[0]):
+            query_row = queries[row]
+            candidates = self.candidates(
+                query_row.indices, query_row.data.astype(np.float64), workspace, threshold=threshold
+            )
+            candidate_scores = self.exact_scores(query_row, candidates)
+            above = candidate_scores > threshold
+            results.append((candidates[above], candidate_scores[above]))
+
+        return results
+
+    def query_text(self, preprocessed_text, k):
+        """
+        Top k for preprocessed requirement text using the vectorizer of from_vectorizer (transform only)
+        """
+        return self.top_k(self.vectorizer.transform(preprocessed_text), k)
+
+def tf_idf_top_k(info, output_path, variant_function, k, dtype=np.float64, **variant_options):
+    """
+    Top k FRs per NFR through the inverted index instead of the full similarity block
+
+    return - nfr_keys: NFR keys in row order
+           - fr_keys: FR keys
+           - indices: FR positions of shape (|NFR|, k)
+           - scores: Scores of shape (|NFR|, k)
+    """
+    keys, vectorizer, tf_idf_matrix = tf_idf_vectorize(info, output_path, variant_function, dtype, **variant_options)
+    tf_idf_matrix = tf_idf_matrix.tocsr()
+    nfr_indices, fr_indices = split_requirement_types(keys)
+    fr_keys = [keys[j] for j in fr_indices]
+
+    index = InvertedIndex.from_vectorizer(vectorizer, tf_idf_matrix[fr_indices], fr_keys)
+    indices, scores = index.top_k(tf_idf_matrix[nfr_indices], k)
+    return [keys[i] for i in nfr_indices], fr_keys, indices, scores
@@ -0,0 +1,108 @@
+"""
+Precompiled WordNet lookups for lemmatization and synonym expansion
+
+Variant 2 lemmatizes every word with its POS and variant 3 also looks up the first synset of every lemma.
+Both go through the NLTK WordNet corpus reader, which is loaded lazily in every process and queried once
+per token. A Lexicon answers both lookups from two tables keyed on (word, POS):
+    lemmas      (word, POS) -> lemma            (WordNetLemmatizer.lemmatize)
+    synonyms    (lemma, POS) -> synonyms        (variants.wordnet_expansion)
+Entries that are missing are asked from NLTK once and remembered, so a Lexicon is also the in-process
+memoization layer. A compiled lexicon file holds the entries of a set of requirements ('build_lexicon' in
+'methods/variants.py'), it is read in one go and the requirements it was built from never touch the corpus
+reader again.
+
+File format (JSON):
+    {"format": 1, "wordnet": "<NLTK and WordNet fingerprint>",
+     "lemmas": {"n": {"word": "lemma", ...}, "v": {...}, ...},
+     "synonyms": {"n": {"lemma": ["synonym", ...], ...}, ...}}
+"""
+import json
+from pathlib import Path
+
+from methods.cache import nltk_resource_fingerprint
+
+FORMAT_VERSION = 1
+WORDNET_RESOURCES = ["corpora/wordnet"]
+
+
+class Lexicon:
+    """
+    Memoized (word, POS) lemma and synonym lookups
+
+    param - lemmatize: Function (word, POS) -> lemma, asked for entries the lexicon doesn't have
+    param - expand: Function (lemma, POS) -> list of synonyms, asked for entries the lexicon doesn't have
+    param - lemmas: Dictionary of (word, POS) -> lemma to start from
+    param - synonyms: Dictionary of (lemma, POS) -> tuple of synonyms to start from
+    """
+    def __init__(self, lemmatize, expand, lemmas=None, synonyms=None):
+        self.lemmatize_missing = lemmatize
+        self.expand_missing = expand
+        self.lemmas = dict(lemmas or {})
+        self.synonyms = dict(synonyms or {})
+        self.misses = 0
+
+    def lemmatize(self, word: str, pos: str):
+        key = (word, pos)
+        lemma = self.lemmas.get(key)
+        if lemma is None:
+            self.misses += 1
+            lemma = self.lemmas[key] = self.lemmatize_missing(word, pos)
+        return lemma
+
+    def expand(self, lemma: str, pos: str):
+        key = (lemma, pos)
+        synonyms = self.synonyms.get(key)
+        if synonyms is None:
+            self.misses += 1
+            synonyms = self.synonyms[key] = tuple(self.expand_missing(lemma, pos))
+        return list(synonyms)
+
+    def save(self, path):
+        """
+        Writes every entry the lexicon knows to a lexicon file
+
+        return - path: Lexicon file
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lemmas = {}
+        for (word, pos), lemma in sorted(self.lemmas.items()):
+            lemmas.setdefault(pos, {})[word] = lemma
+        synonyms = {}
+        for (lemma, pos), names in sorted(self.synonyms.items()):
+            synonyms.setdefault(pos, {})[lemma] = list(names)
+
+        staging = path.with_name(path.name + ".tmp")
+        with open(staging, "w", encoding="utf-8") as file:
+            json.dump({"format": FORMAT_VERSION, "wordnet": nltk_resource_fingerprint(WORDNET_RESOURCES),
+                       "lemmas": lemmas, "synonyms": synonyms}, file, separators=(",", ":"))
+        staging.replace(path)
+        return path
+
+
+def load_lexicon(path, lemmatize, expand):
+    """
+    Reads a lexicon file
+
+    param - path: Lexicon file written by Lexicon.save
+    param - lemmatize, expand: Lookups for the entries the file doesn't have (see Lexicon)
+
+    return - Lexicon, or None if the file doesn't exist or was built from another NLTK or WordNet version
+             (without WordNet installed here the file is used as it is)
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as file:
+        table = json.load(file)
+    if table.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported lexicon format {table.get('format')} in {path}")
+
+    wordnet = nltk_resource_fingerprint(WORDNET_RESOURCES)
+    if table["wordnet"] != wordnet and not wordnet.endswith("=missing"):
+        return None
+
+    lemmas = {(word, pos): lemma for pos, words in table["lemmas"].items() for word, lemma in words.items()}
+    synonyms = {(lemma, pos): tuple(names) for pos, entries in table["synonyms"].items()
+                for lemma, names in entries.items()}
+    return Lexicon(lemmatize, expand, lemmas, synonyms)
@@ -0,0 +1,281 @@
+"""
+Approximate NFR x FR tracing with MinHash signatures and LSH buckets
+
+Every requirement gets a MinHash signature of its TF-IDF terms (the columns of its row). The signature is
+cut into bands of rows each, and an NFR and a FR are candidates when all the values of at least one band
+are the same. Only the candidate pairs are scored, with the same TF-IDF rows as the exact path, so every
+score that comes out is the exact cosine (up to float rounding). What is traded away is recall: a pair
+that shares few terms may never become a candidate and then scores 0.
+
+A pair whose term sets have Jaccard similarity s becomes a candidate with probability 1 - (1 - s^rows)^bands,
+the s where that is about 1/2 is roughly (1 / bands)^(1 / rows):
+    more bands or fewer rows per band -> more candidates, higher recall, slower
+    fewer bands or more rows per band -> fewer candidates, lower recall, faster
+
+To measure the recall and speed against the exact similarity on a requirements file use
+'python -m methods.lsh text_files/p2_requirements.txt --output lsh_results --bands 16 32 --rows 2 4'
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import scipy.sparse as sp
+
+from methods.functions import (load_requirements, nfr_fr_similarity, split_requirement_types, threshold_trace,
+                               tf_idf_vectorize, top_k)
+from methods.metrics import stage
+from methods.variants import VARIANTS
+
+# Hash values stay below 2^31, so a * column + b fits in 64 bits
+MERSENNE_PRIME = (1 << 31) - 1
+# Hash functions computed at once, each one holds a copy of the column indices
+HASH_BLOCK = 16
+# Candidate pairs scored at once, each one holds a copy of its NFR and FR row
+PAIR_BLOCK = 1 << 18
+
+
+def minhash_signatures(rows, num_perm=128, seed=0):
+    """
+    MinHash signature of the columns of every row
+
+    param - rows: Sparse matrix, a row's set is its non-zero columns
+    param - num_perm: Number of hash functions
+    param - seed: Seed of the hash functions, the NFRs and FRs must use the same one
+
+    return - signatures: uint64 array of shape (rows, num_perm), MERSENNE_PRIME for empty rows
+    """
+    rows = sp.csr_matrix(rows)
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+    b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+
+    signatures = np.full((rows.shape[0], num_perm), MERSENNE_PRIME, dtype=np.uint64)
+    filled = np.diff(rows.indptr) > 0
+    if rows.nnz:
+        columns = rows.indices.astype(np.uint64)[:, None]
+        starts = rows.indptr[:-1][filled]
+        for start in range(0, num_perm, HASH_BLOCK):
+            end = min(start + HASH_BLOCK, num_perm)
+            hashed = (columns * a[start:end] + b[start:end]) % MERSENNE_PRIME
+            signatures[filled, start:end] = np.minimum.reduceat(hashed, starts, axis=0)
+    return signatures
+
+def band_keys(signatures, bands, rows, seed=0):
+    """
+    One bucket key per band, the signature values of the band mixed into a single uint64
+
+    return - keys: uint64 array of shape (len(signatures), bands)
+    """
+    if signatures.shape[1] < bands * rows:
+        raise ValueError(f"Signatures have {signatures.shape[1]} values, {bands} bands x {rows} rows need more")
+    multipliers = np.random.default_rng(seed).integers(1, 2 ** 63, rows, dtype=np.uint64) | np.uint64(1)
+    banded = signatures[:, :bands * rows].reshape(len(signatures), bands, rows)
+    # uint64 arithmetic wraps around, which is what the mixing wants
+    return (banded * multipliers).sum(axis=2, dtype=np.uint64)
+
+def lsh_candidates(nfr_signatures, fr_signatures, bands=32, rows=4, seed=0):
+    """
+    NFR x FR pairs that share the bucket of at least one band, empty rows are never candidates
+
+    return - nfr_positions, fr_positions: Candidate pairs, sorted by NFR then FR position
+    """
+    nfr_keys = band_keys(nfr_signatures, bands, rows, seed)
+    fr_keys = band_keys(fr_signatures, bands, rows, seed)
+    nfr_filled = nfr_signatures[:, 0] != MERSENNE_PRIME
+    fr_filled = fr_signatures[:, 0] != MERSENNE_PRIME
+    n_frs = len(fr_signatures)
+
+    codes = []
+    for band in range(bands):
+        order = np.argsort(nfr_keys[:, band], kind="stable")
+        sorted_keys = nfr_keys[order, band]
+        low = np.searchsorted(sorted_keys, fr_keys[:, band], side="left")
+        counts = np.searchsorted(sorted_keys, fr_keys[:, band], side="right") - low
+        total = int(counts.sum())
+        if not total:
+            continue
+        # Every FR is paired with the run of NFRs that have its key
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        nfr_positions = order[np.repeat(low, counts) + offsets]
+        fr_positions = np.repeat(np.arange(n_frs), counts)
+        codes.append(nfr_positions.astype(np.int64) * n_frs + fr_positions)
+
+    codes = np.sort(np.concatenate(codes)) if codes else np.empty(0, dtype=np.int64)
+    # Pairs found in several bands, a sort and a neighbour compare is much faster than np.unique here
+    codes = codes[np.concatenate(([True], codes[1:] != codes[:-1]))] if len(codes) else codes
+    nfr_positions, fr_positions = np.divmod(codes, n_frs) if n_frs else (codes, codes)
+    keep = nfr_filled[nfr_positions] & fr_filled[fr_positions]
+    return nfr_positions[keep].astype(np.intp), fr_positions[keep].astype(np.intp)
+
+def candidate_scores(nfr_rows, fr_rows, nfr_positions, fr_positions):
+    """
+    Exact scores of the candidate pairs, the row-wise product of the NFR and FR rows of PAIR_BLOCK pairs at a time
+
+    return - scores: Array with one score per pair
+    """
+    scores = np.zeros(len(nfr_positions), dtype=nfr_rows.dtype)
+    for start in range(0, len(nfr_positions), PAIR_BLOCK):
+        end = start + PAIR_BLOCK
+        pairs = nfr_rows[nfr_positions[start:end]].multiply(fr_rows[fr_positions[start:end]])
+        scores[start:end] = np.asarray(pairs.sum(axis=1)).ravel()
+    return scores
+
+def candidate_top_k(nfr_positions, fr_positions, scores, n_nfrs, n_frs, k):
+    """
+    Top k FRs of every NFR from the scored candidates, same order as top_k on the full similarity: score
+    descending, ties by FR position, and the FRs that were not scored count as 0
+
+    return - indices: FR positions of shape (|NFR|, k)
+           - scores: Scores of shape (|NFR|, k)
+    """
+    top_indices = np.empty((n_nfrs, k), dtype=np.intp)
+    top_scores = np.zeros((n_nfrs, k), dtype=scores.dtype)
+    positive = scores > 0
+    nfr_positions, fr_positions, scores = nfr_positions[positive], fr_positions[positive], scores[positive]
+
+    # The pairs come sorted by NFR then FR, two stable sorts order them by NFR, score descending, FR
+    order = np.argsort(-scores, kind="stable")
+    order = order[np.argsort(nfr_positions[order], kind="stable")]
+    nfr_positions, fr_positions, scores = nfr_positions[order], fr_positions[order], scores[order]
+    starts = np.searchsorted(nfr_positions, np.arange(n_nfrs))
+    ranks = np.arange(len(nfr_positions)) - starts[nfr_positions]
+    kept = ranks < k
+    top_indices[nfr_positions[kept], ranks[kept]] = fr_positions[kept]
+    top_scores[nfr_positions[kept], ranks[kept]] = scores[kept]
+
+    # NFRs with fewer than k positive scores are filled up with the lowest FR positions not already in
+    filled = np.bincount(nfr_positions[kept], minlength=n_nfrs)
+    for i in np.flatnonzero(filled < k):
+        taken = top_indices[i, :filled[i]]
+        zeros = np.setdiff1d(np.arange(min(n_frs, filled[i] + k)), taken, assume_unique=True)
+        top_indices[i, filled[i]:] = zeros[:k - filled[i]]
+    return top_indices, top_scores
+
+def lsh_similarity(nfr_rows, fr_rows, k=10, threshold=None, bands=32, rows=4, seed=0):
+    """
+    Top k and above threshold NFR x FR scores, scored only on the LSH candidate pairs
+
+    param - nfr_rows: Sparse L2 normalized TF-IDF rows of the NFRs
+    param - fr_rows: Sparse L2 normalized TF-IDF rows of the FRs
+    param - k: Number of top FRs per NFR, 0 or None for none
+    param - threshold: Keep the scores above it, None for none
+    param - bands: Number of LSH bands
+    param - rows: Signature values per band
+    param - seed: Seed of the MinHash functions
+
+    return - indices: FR positions of shape (|NFR|, k) or None, FRs that were not scored count as 0
+           - scores: Scores of shape (|NFR|, k) or None
+           - above: CSR matrix of shape (|NFR|, |FR|) with the scores above the threshold, or None
+           - candidates: Number of scored pairs
+    """
+    nfr_rows = sp.csr_matrix(nfr_rows)
+    fr_rows = sp.csr_matrix(fr_rows)
+    n_nfrs, n_frs = nfr_rows.shape[0], fr_rows.shape[0]
+    k = min(int(k or 0), n_frs)
+
+    with stage("lsh_similarity", nfrs=n_nfrs, frs=n_frs, bands=bands, rows=rows) as record:
+        with stage("minhash", requirements=n_nfrs + n_frs):
+            nfr_signatures = minhash_signatures(nfr_rows, bands * rows, seed)
+            fr_signatures = minhash_signatures(fr_rows, bands * rows, seed)
+        nfr_positions, fr_positions = lsh_candidates(nfr_signatures, fr_signatures, bands, rows, seed)
+        record.count(candidates=len(nfr_positions))
+
+        scores = candidate_scores(nfr_rows, fr_rows, nfr_positions, fr_positions)
+
+        top_indices = top_scores = None
+        if k:
+            top_indices, top_scores = candidate_top_k(nfr_positions, fr_positions, scores, n_nfrs, n_frs, k)
+
+        above = None
+        if threshold is not None:
+            keep = scores > threshold
+            above = sp.csr_matrix((scores[keep], (nfr_positions[keep], fr_positions[keep])), shape=(n_nfrs, n_frs))
+            record.count(above=above.nnz)
+
+    return top_indices, top_scores, above, len(nfr_positions)
+
+def lsh_recall(similarity, indices=None, scores=None, above=None, k=10, threshold=None):
+    """
+    Recall of the LSH results against the exact NFR x FR similarity
+
+    param - similarity: Exact similarity of shape (|NFR|, |FR|) (ex. nfr_fr_similarity)
+    param - indices, scores, above: Results of lsh_similarity
+    param - k, threshold: Values lsh_similarity was called with
+
+    return - Dictionary with
+                top_k_recall: Share of the exact top k pairs with a score above 0 that are in the LSH top k
+                threshold_recall: Share of the exact pairs above the threshold that LSH found
+             (None when there is nothing to compare)
+    """
+    similarity = np.asarray(similarity)
+    report = {"top_k_recall": None, "threshold_recall": None}
+    if indices is not None and k:
+        exact_indices, exact_scores = top_k(similarity, k)
+        rows, positions = np.nonzero(exact_scores > 0)
+        if len(rows):
+            # FRs LSH never scored fill up the top k with 0 and don't count as found
+            found = ((indices[rows] == exact_indices[rows, positions][:, None]) & (scores[rows] > 0)).any(axis=1)
+            report["top_k_recall"] = float(found.mean())
+    if above is not None and threshold is not None:
+        rows, columns = np.nonzero(similarity > threshold)
+        if len(rows):
+            report["threshold_recall"] = float((np.asarray(above[rows, columns]).ravel() > threshold).mean())
+    return report
+
+def tf_idf_lsh(info, output_path, variant_function, k=10, threshold=None, bands=32, rows=4, seed=0,
+               dtype=np.float64, **variant_options):
+    """
+    Top k FRs per NFR and the scores above the threshold, scored on the LSH candidates only
+
+    return - nfr_keys: NFR keys in row order
+           - fr_keys: FR keys
+           - indices, scores, above, candidates: See lsh_similarity
+    """
+    keys, _, tf_idf_matrix = tf_idf_vectorize(info, output_path, variant_function, dtype, **variant_options)
+    tf_idf_matrix = tf_idf_matrix.tocsr()
+    nfr_indices, fr_indices = split_requirement_types(keys)
+
+    indices, scores, above, candidates = lsh_similarity(tf_idf_matrix[nfr_indices], tf_idf_matrix[fr_indices],
+                                                        k, threshold, bands, rows, seed)
+    return [keys[i] for i in nfr_indices], [keys[j] for j in fr_indices], indices, scores, above, candidates
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure LSH recall and speed against the exact similarity")
+    parser.add_argument("requirements", help="Requirements file")
+    parser.add_argument("--variant", default="variant1", choices=list(VARIANTS))
+    parser.add_argument("--output", required=True, help="Folder for the preprocessing file")
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--threshold", type=float, default=0.14)
+    parser.add_argument("--bands", type=int, nargs="+", default=[32])
+    parser.add_argument("--rows", type=int, nargs="+", default=[4])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    info = load_requirements(args.requirements)
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    keys, _, tf_idf_matrix = tf_idf_vectorize(info, Path(args.output), VARIANTS[args.variant])
+    tf_idf_matrix = tf_idf_matrix.tocsr()
+    nfr_indices, fr_indices = split_requirement_types(keys)
+    nfr_rows, fr_rows = tf_idf_matrix[nfr_indices], tf_idf_matrix[fr_indices]
+
+    start = time.perf_counter()
+    similarity = nfr_fr_similarity(tf_idf_matrix, nfr_indices, fr_indices)
+    top_k(similarity, args.top_n)
+    threshold_trace(similarity, args.threshold)
+    exact_seconds = time.perf_counter() - start
+    print(f"exact: {similarity.size} pairs, {exact_seconds:.4f} s")
+
+    for bands in args.bands:
+        for rows in args.rows:
+            start = time.perf_counter()
+            indices, scores, above, candidates = lsh_similarity(nfr_rows, fr_rows, args.top_n, args.threshold,
+                                                                bands, rows, args.seed)
+            seconds = time.perf_counter() - start
+            report = lsh_recall(similarity, indices, scores, above, args.top_n, args.threshold)
+            recalls = ", ".join(f"{name} {'-' if value is None else f'{value:.3f}'}" for name, value in report.items())
+            print(f"bands {bands} rows {rows}: {candidates} candidates ({candidates / max(1, similarity.size):.1%}), "
+                  f"{seconds:.4f} s, {recalls}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Per stage instrumentation of the tracing pipeline
+
+The pipeline stages (loading, preprocessing, vectorizing, similarity, ranking, thresholds, writing) are wrapped
+in 'stage(...)' blocks. They cost nothing until a Metrics recorder is active, then every block records its
+wall time, CPU time, peak memory (when tracemalloc is on) and item counts (requirements, tokens, vocabulary
+size, non-zeros, ...) and passes the record to the recorder's hooks.
+
+    metrics = Metrics(hooks=[json_lines_hook("metrics.jsonl"), log_hook()], memory=True)
+    with metrics.active():
+        run(config)
+    print(metrics.summary())
+
+Records are plain dictionaries:
+    {"stage": "vectorize", "parent": "trace", "wall_seconds": 0.01, "cpu_seconds": 0.01,
+     "peak_bytes": 123456, "counts": {"documents": 63, "vocabulary": 210, "nonzeros": 640}, "labels": {}}
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+import tracemalloc
+
+_active = contextvars.ContextVar("metrics", default=None)
+
+
+class StageRecord(dict):
+    """
+    Record of one stage, counts and labels can be added while the stage runs
+    """
+    def count(self, **counts):
+        for name, value in counts.items():
+            self["counts"][name] = int(value)
+
+    def label(self, **labels):
+        for name, value in labels.items():
+            self["labels"][name] = str(value)
+
+
+class Metrics:
+    """
+    Collects stage records and passes each finished record to the hooks
+
+    param - hooks: Callables taking a finished record (ex. json_lines_hook, log_hook)
+    param - memory: Trace Python/NumPy allocations with tracemalloc to record the peak memory of every stage,
+                    this slows the pipeline down so it is off by default
+    """
+    def __init__(self, hooks=(), memory=False):
+        self.hooks = list(hooks)
+        self.memory = memory
+        self.records = []
+        self.local = threading.local()
+
+    @property
+    def stack(self):
+        """
+        Open stages of the calling thread, stages on other threads (ex. the background writer) nest separately
+        """
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    @contextlib.contextmanager
+    def active(self):
+        """
+        Makes this recorder the one the stage blocks report to
+        """
+        token = _active.set(self)
+        started = self.memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            yield self
+        finally:
+            if started:
+                tracemalloc.stop()
+            _active.reset(token)
+
+    @contextlib.contextmanager
+    def stage(self, name: str, **counts):
+        record = StageRecord(
+            stage=name,
+            parent=self.stack[-1][0]["stage"] if self.stack else None,
+            wall_seconds=0.0,
+            cpu_seconds=0.0,
+            peak_bytes=None,
+            counts={},
+            labels={},
+        )
+        record.count(**counts)
+        tracing = tracemalloc.is_tracing()
+
+        # tracemalloc has one peak, so a stage folds its peak into its parent's before resetting it
+        start_memory = 0
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.stack:
+                self.stack[-1][1] = max(self.stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            start_memory = current
+        frame = [record, start_memory]
+        self.stack.append(frame)
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record["cpu_seconds"] = time.process_time() - cpu
+            record["wall_seconds"] = time.perf_counter() - wall
+            self.stack.pop()
+
+            if tracing and tracemalloc.is_tracing():
+                peak = max(frame[1], tracemalloc.get_traced_memory()[1])
+                record["peak_bytes"] = peak - start_memory
+                if self.stack:
+                    self.stack[-1][1] = max(self.stack[-1][1], peak)
+
+            self.records.append(record)
+            for hook in self.hooks:
+                hook(record)
+
+    def summary(self):
+        """
+        Totals of every stage name over all of its records
+
+        return - Dictionary of stage -> {"calls", "wall_seconds", "cpu_seconds", "peak_bytes", "counts"}
+        """
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record["stage"], {
+                "calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "peak_bytes": None, "counts": {},
+            })
+            total["calls"] += 1
+            total["wall_seconds"] += record["wall_seconds"]
+            total["cpu_seconds"] += record["cpu_seconds"]
+            if record["peak_bytes"] is not None:
+                total["peak_bytes"] = max(total["peak_bytes"] or 0, record["peak_bytes"])
+            for name, value in record["counts"].items():
+                total["counts"][name] = total["counts"].get(name, 0) + value
+        return totals
+
+    def write(self, path):
+        """
+        Writes every record and the summary as one JSON document
+        """
+        with open(path, "w") as file:
+            json.dump({"records": self.records, "summary": self.summary()}, file, indent=2)
+
+
+def current():
+    """
+    return - The active Metrics recorder or None
+    """
+    return _active.get()
+
+def stage(name: str, **counts):
+    """
+    Stage block reporting to the active recorder, a no-op record when there is none
+
+        with stage("vectorize", documents=len(texts)) as record:
+            ...
+            record.count(vocabulary=len(vectorizer.vocabulary_))
+    """
+    metrics = _active.get()
+    if metrics is None:
+        return contextlib.nullcontext(StageRecord(stage=name, counts={}, labels={}))
+    return metrics.stage(name, **counts)
+
+def json_lines_hook(path):
+    """
+    Hook appending every record as one JSON line to a file
+    """
+    def write(record):
+        with open(path, "a") as file:
+            file.write(json.dumps(record) + "\n")
+    return write
+
+def log_hook(logger=None, level=logging.INFO):
+    """
+    Hook logging every record as JSON, by default to the 'methods.metrics' logger
+    """
+    logger = logger or logging.getLogger(__name__)
+
+    def log(record):
+        logger.log(level, json.dumps(record))
+    return log
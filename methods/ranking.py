@@ -0,0 +1,295 @@
+"""
+Global ranking of every NFR -> FR pair with an external merge sort
+
+merge_sort and top_k rank the FRs of each NFR on their own. A review queue needs one list of all pairs,
+which for large requirement files doesn't fit in memory, so the pairs are sorted out of core:
+    Runs    pairs are read block by block as (score, NFR, FR) records, buffered up to run_size records,
+            sorted and written to a run file
+    Merge   the run files are read back a block at a time and k-way merged, a heap of the last buffered
+            record of every run tells how far all runs can be merged
+
+Pairs are ordered by score descending, ties by NFR position then FR position. That is the order merge_sort
+gives the row major list of pairs (ties keep the earlier pair), so the ranking is the same however the pairs
+were split into runs. The ranking is streamed, with a top N or a threshold (scores greater than it, like the
+trace) the merge stops early and the runs only keep the records that can still make it.
+
+Run files are raw arrays of RECORD (16 bytes per pair, little endian):
+    score   float64
+    nfr     uint32  NFR position (row of the similarity)
+    fr      uint32  FR position (column of the similarity)
+
+To rank the scores kept by 'methods/streaming.py' or a similarity table written with '"outputs": ["columnar"]' use
+'python -m methods.ranking stream_results/stream_variant1 --top-n 100 --output ranking_variant1.csv'
+"""
+import argparse
+import csv
+import heapq
+import json
+import tempfile
+from bisect import bisect_right
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from methods.metrics import stage
+from methods.writers import COLUMNAR_SUFFIX, read_columns
+
+RECORD = np.dtype([("score", "<f8"), ("nfr", "<u4"), ("fr", "<u4")])
+
+
+def pair_records(scores, nfr_positions, fr_positions):
+    """
+    Records of a set of pairs
+
+    param - scores: Score of every pair
+    param - nfr_positions, fr_positions: NFR and FR position of every pair (broadcast against the scores)
+
+    return - records: RECORD array
+    """
+    scores = np.asarray(scores)
+    records = np.empty(scores.size, dtype=RECORD)
+    records["score"] = scores.ravel()
+    records["nfr"] = np.broadcast_to(nfr_positions, scores.shape).ravel()
+    records["fr"] = np.broadcast_to(fr_positions, scores.shape).ravel()
+    return records
+
+def block_records(similarity, nfr_offset=0, fr_offset=0):
+    """
+    Records of a NFR x FR block of the similarity
+
+    param - similarity: Array of shape (NFRs of the block, FRs of the block)
+    param - nfr_offset, fr_offset: Position of the block's first NFR and first FR
+    """
+    similarity = np.asarray(similarity)
+    n_nfrs, n_frs = similarity.shape
+    return pair_records(similarity, np.arange(nfr_offset, nfr_offset + n_nfrs)[:, None],
+                        np.arange(fr_offset, fr_offset + n_frs)[None, :])
+
+def pair_keys(records):
+    """
+    NFR and FR position in one integer, the tie order of the ranking
+    """
+    return (records["nfr"].astype(np.uint64) << np.uint64(32)) | records["fr"]
+
+def sort_records(records):
+    """
+    return - records in ranking order (score descending, then NFR, then FR)
+    """
+    return records[np.lexsort((records["fr"], records["nfr"], -records["score"]))]
+
+def write_runs(blocks, work_path, run_size=1 << 20, top_n=None, threshold=None):
+    """
+    Sorted run files of the records of every block
+
+    param - blocks: Iterable of RECORD arrays (ex. block_records)
+    param - work_path: Folder for the run files
+    param - run_size: Records per run, bounds the memory use
+    param - top_n: Keep only the first top_n records of every run (the global top N is among them)
+    param - threshold: Keep only the records with a score greater than it
+
+    return - runs: Run file paths
+    """
+    work_path = Path(work_path)
+    work_path.mkdir(parents=True, exist_ok=True)
+    runs = []
+    pending, size = [], 0
+
+    def spill():
+        records = sort_records(np.concatenate(pending))
+        if top_n is not None:
+            records = records[:top_n]
+        path = work_path / f"run_{len(runs):05d}.bin"
+        records.tofile(path)
+        runs.append(path)
+
+    with stage("ranking_runs") as record:
+        pairs = 0
+        for records in blocks:
+            pairs += len(records)
+            if threshold is not None:
+                records = records[records["score"] > threshold]
+            while len(records):
+                taken = records[:run_size - size]
+                records = records[len(taken):]
+                pending.append(taken)
+                size += len(taken)
+                if size >= run_size:
+                    spill()
+                    pending, size = [], 0
+        if size:
+            spill()
+        record.count(pairs=pairs, runs=len(runs))
+    return runs
+
+def merge_runs(runs, block_size=1 << 16):
+    """
+    K-way merge of sorted run files, read block_size records of every run at a time
+
+    The heap holds the last buffered record of every run. The smallest of them is a bound: every record up
+    to it is buffered in some run, so those records are taken from all runs, sorted together and yielded.
+    The run the bound came from is then used up and reads its next block, so every step moves at least one
+    block and the heap is touched once per block instead of once per record.
+
+    return - Yields RECORD arrays in ranking order
+    """
+    files = [open(path, "rb") for path in runs]
+    try:
+        buffers = [None] * len(files)
+        heap = []
+
+        def refill(run):
+            records = np.fromfile(files[run], dtype=RECORD, count=block_size)
+            if not len(records):
+                buffers[run] = None
+                return
+            buffers[run] = (records, -records["score"], pair_keys(records))
+            heapq.heappush(heap, (float(buffers[run][1][-1]), int(buffers[run][2][-1]), run))
+
+        for run in range(len(files)):
+            refill(run)
+
+        while heap:
+            bound_score, bound_key, bound_run = heapq.heappop(heap)
+            taken = []
+            for run, buffer in enumerate(buffers):
+                if buffer is None:
+                    continue
+                records, negative_scores, keys = buffer
+                # Records up to the bound: lower negative score, or the same and a pair not after it
+                low = np.searchsorted(negative_scores, bound_score, side="left")
+                high = np.searchsorted(negative_scores, bound_score, side="right")
+                end = low + int(np.searchsorted(keys[low:high], bound_key, side="right"))
+                if end:
+                    taken.append(records[:end])
+                    buffers[run] = (records[end:], negative_scores[end:], keys[end:])
+            yield sort_records(np.concatenate(taken))
+            refill(bound_run)
+    finally:
+        for file in files:
+            file.close()
+
+def ranked_pairs(blocks, work_path=None, top_n=None, threshold=None, run_size=1 << 20, block_size=1 << 16):
+    """
+    Every pair of the blocks in ranking order, sorted out of core
+
+    param - blocks: Iterable of RECORD arrays
+    param - work_path: Folder for the run files, a temporary folder if None (removed when the ranking ends)
+    param - top_n: Stop after the first top_n pairs, None for all
+    param - threshold: Only the pairs with a score greater than it, None for all
+    param - run_size: Records per sorted run
+    param - block_size: Records read from every run at a time
+
+    return - Yields RECORD arrays in ranking order
+    """
+    with tempfile.TemporaryDirectory(dir=work_path) as folder:
+        runs = write_runs(blocks, folder, run_size, top_n, threshold)
+        merged = merge_runs(runs, block_size)
+        with stage("ranking_merge", runs=len(runs)) as record:
+            ranked = 0
+            try:
+                for records in merged:
+                    if top_n is not None:
+                        records = records[:top_n - ranked]
+                    ranked += len(records)
+                    if len(records):
+                        yield records
+                    if top_n is not None and ranked >= top_n:
+                        break
+            finally:
+                # Closes the run files before their folder is removed
+                merged.close()
+            record.count(pairs=ranked)
+
+def stream_score_blocks(scores_path):
+    """
+    Records of the per chunk similarity scores kept by stream_trace
+
+    param - scores_path: 'stream_<variant>' folder
+
+    return - nfr_keys: NFR keys in position order
+           - fr_key: Function FR position -> FR key (reads the chunk's key file)
+           - blocks: Generator of RECORD arrays, one per chunk
+    """
+    scores_path = Path(scores_path)
+    with open(scores_path / "chunks.json", "r") as file:
+        manifest = json.load(file)
+    chunks = manifest["chunks"]
+    firsts = [chunk["first_fr"] for chunk in chunks]
+
+    @lru_cache(maxsize=4)
+    def chunk_keys(number):
+        with open(scores_path / f"fr_keys_{number:05d}.txt", "r") as file:
+            return file.read().splitlines()
+
+    def fr_key(position):
+        chunk = chunks[bisect_right(firsts, position) - 1]
+        return chunk_keys(chunk["chunk"])[position - chunk["first_fr"]]
+
+    def blocks():
+        for chunk in chunks:
+            similarity = np.load(scores_path / f"similarity_{chunk['chunk']:05d}.npy", mmap_mode="r")
+            yield block_records(similarity, 0, chunk["first_fr"])
+
+    return manifest["nfr_keys"], fr_key, blocks()
+
+def similarity_table_blocks(table_path):
+    """
+    Records of a similarity table written by write_similarity_columns, one NFR column at a time
+
+    return - nfr_keys, fr_key, blocks: See stream_score_blocks
+    """
+    table = read_columns(table_path, decode=False)
+    with open(Path(table_path) / "schema.json", "r") as file:
+        fr_keys = next(column["dictionary"] for column in json.load(file)["columns"] if column["name"] == "FR")
+    nfr_keys = [name for name in table if name != "FR"]
+    fr_codes = np.asarray(table["FR"])
+
+    def blocks():
+        for i, nfr in enumerate(nfr_keys):
+            yield pair_records(table[nfr], i, fr_codes)
+
+    return nfr_keys, fr_keys.__getitem__, blocks()
+
+def write_ranking(path, nfr_keys: list, fr_key, ranked):
+    """
+    Writes the ranking as a CSV file with Rank, NFR, FR, Similarity columns
+
+    param - nfr_keys: NFR keys in position order
+    param - fr_key: Function FR position -> FR key, or a list of FR keys
+    param - ranked: Iterable of RECORD arrays in ranking order (ex. ranked_pairs)
+
+    return - rows: Number of ranked pairs written
+    """
+    if not callable(fr_key):
+        fr_key = fr_key.__getitem__
+    rank = 0
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Rank", "NFR", "FR", "Similarity"])
+        for records in ranked:
+            for score, nfr, fr in records.tolist():
+                rank += 1
+                writer.writerow([rank, nfr_keys[nfr], fr_key(fr), f"{score:.3f}"])
+    return rank
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rank every NFR -> FR pair with an external merge sort")
+    parser.add_argument("scores", help="'stream_<variant>' folder of methods.streaming or a similarity '.columns' table")
+    parser.add_argument("--output", required=True, help="Ranking CSV file")
+    parser.add_argument("--top-n", type=int, help="Only the first N pairs")
+    parser.add_argument("--threshold", type=float, help="Only the pairs with a score greater than the threshold")
+    parser.add_argument("--run-size", type=int, default=1 << 20, help="Records per sorted run")
+    parser.add_argument("--work-dir", help="Folder for the run files")
+    args = parser.parse_args(argv)
+
+    if Path(args.scores).suffix == COLUMNAR_SUFFIX:
+        nfr_keys, fr_key, blocks = similarity_table_blocks(args.scores)
+    else:
+        nfr_keys, fr_key, blocks = stream_score_blocks(args.scores)
+    ranked = ranked_pairs(blocks, args.work_dir, args.top_n, args.threshold, args.run_size)
+    rows = write_ranking(args.output, nfr_keys, fr_key, ranked)
+    print(f"{args.output}: {rows} pairs")
+
+if __name__ == "__main__":
+    main()
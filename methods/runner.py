@@ -0,0 +1,470 @@
+"""
+Non-interactive batch runner for the traceability analyses
+
+A run config lists the datasets, variants, top N values and thresholds. Every combination is run in one
+process: NLTK and scikit-learn are loaded once, each requirement is preprocessed once per variant, and the
+similarity results of a dataset/variant are kept in memory for all of its top N and threshold outputs.
+
+To run use 'python -m methods.runner configs/traceability.json' in the root directory.
+
+Config (JSON):
+{
+    "datasets": [{"name": "part_1", "requirements": "text_files/...", "output": "part_1_results",
+                  "ground_truth": "text_files/trace-..."}],   (ground_truth is optional)
+    "variants": ["variant1", "variant2", "variant3"],
+    "top_n": 10,                        (a number or a list of numbers)
+    "thresholds": {"variant1": 0.09},   (a number, a list, or per variant numbers/lists)
+    "cache": ".trace_cache/preprocessing.sqlite",   (optional, null disables the cache)
+    "workers": 1,                       (optional, preprocessing processes, null uses every core)
+    "chunk_size": 256,                  (optional)
+    "lexicon": ".trace_cache/lexicon.json",   (optional, compiled WordNet lookups for variant 2 and 3, made with
+                                               '--build-lexicon', see 'methods/lexicon.py', null disables it)
+    "tokenizer": "nltk",                (optional, 'nltk' or 'fast' (same tokens, see 'methods/tokenizer.py'),
+                                         or per variant values)
+    "verbose": false,                   (optional, print the TF-IDF weights and similarity scores)
+    "sample": 20,                       (optional, requirements / FRs per NFR printed when verbose, null for all)
+    "metrics": "metrics.json",          (optional, per stage time, memory and counts, see 'methods/metrics.py')
+    "trace_memory": false,              (optional, record the peak memory of every stage, slower)
+    "artifacts": "artifacts",           (optional, folder in the output folder for the binary TF-IDF and
+                                         similarity artifacts, see 'methods/artifacts.py', null disables them)
+    "reuse_artifacts": true,            (optional, start from stored artifacts made from the same inputs)
+    "token_ids": false,                 (optional, build the TF-IDF matrix from interned token IDs so every
+                                         token the variant kept is a term, see 'methods/vocabulary.py')
+    "outputs": ["csv", "columnar"],     (optional, 'columnar' adds NumPy column tables of the top N, trace and
+                                         full similarity, see 'methods/writers.py')
+    "background_writes": true,          (optional, write the output files on a background thread)
+    "lsa_components": null,             (optional, a number traces with the similarity of an LSA index with that
+                                         many dimensions instead of the TF-IDF cosine, see 'methods/semantic.py')
+    "incremental": false                (optional, keep a trace state per dataset/variant and only redo the
+                                         requirements that changed since the last run, see 'methods/incremental.py',
+                                         needs a single top N and threshold and only the 'csv' output)
+}
+Datasets with a ground truth trace also get an 'evaluation_<variant>.csv' with precision, recall, F1 and MAP
+at every threshold (see 'methods/evaluation.py'), and the best threshold is printed.
+When a dataset/variant has more than one top N value or threshold the file names get a '_top<N>' or
+'_threshold<T>' suffix, otherwise the original file names are used.
+When the requirements of a dataset haven't changed since the last run, the stored similarity block (or LSA
+index, stored in '<artifacts>/<variant>_lsa') is memory-mapped and only the ranking, thresholds and evaluation
+are redone.
+"""
+import argparse
+import csv
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from methods.artifacts import load_artifacts, save_artifacts
+from methods.cache import PreprocessingCache
+from methods.evaluation import evaluate, load_trace, truth_matrix, write_evaluation
+from methods.functions import (TraceLinks, TraceResult, load_requirements, nfr_fr_similarity, print_similarity,
+                               print_tf_idf, split_requirement_types, tf_idf_vectorize, threshold_trace)
+from methods.incremental import incremental_trace
+from methods.metrics import Metrics, log_hook, stage
+from methods.semantic import SemanticIndex, load_semantic_index
+from methods.variants import TOKENIZERS, VARIANTS, PreprocessingPipeline, build_lexicon
+from methods.vocabulary import Vocabulary
+from methods.writers import (COLUMNAR_SUFFIX, BackgroundWriter, SyncWriter, write_similarity_columns,
+                             write_top_n_columns, write_trace_columns)
+
+DEFAULT_CONFIG = {
+    "variants": list(VARIANTS),
+    "top_n": 10,
+    "thresholds": 0.14,
+    "cache": ".trace_cache/preprocessing.sqlite",
+    "workers": 1,
+    "chunk_size": 256,
+    "lexicon": ".trace_cache/lexicon.json",
+    "tokenizer": "nltk",
+    "verbose": False,
+    "sample": 20,
+    "metrics": None,
+    "trace_memory": False,
+    "artifacts": "artifacts",
+    "reuse_artifacts": True,
+    "token_ids": False,
+    "outputs": ["csv"],
+    "background_writes": True,
+    "lsa_components": None,
+    "incremental": False,
+}
+
+
+def as_list(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+def load_config(path):
+    """
+    param - path: JSON run config
+
+    return - config: Run config with the defaults filled in
+    """
+    with open(path, "r") as file:
+        config = json.load(file)
+    return validate_config(config)
+
+def validate_config(config: dict):
+    """
+    Fills in the defaults and checks the run config before anything is loaded
+
+    return - config: Run config with the defaults filled in
+    """
+    config = {**DEFAULT_CONFIG, **config}
+
+    if not config.get("datasets"):
+        raise ValueError("Run config needs at least one dataset")
+    for dataset in config["datasets"]:
+        for field in ("name", "requirements", "output"):
+            if field not in dataset:
+                raise ValueError(f"Dataset is missing '{field}': {dataset}")
+
+    for name in config["variants"]:
+        if name not in VARIANTS:
+            raise ValueError(f"Unknown variant '{name}', expected one of {list(VARIANTS)}")
+
+    for top_n in as_list(config["top_n"]):
+        if not isinstance(top_n, int) or top_n <= 0:
+            raise ValueError(f"top_n must be a positive integer, got {top_n!r}")
+
+    thresholds = config["thresholds"]
+    if not isinstance(thresholds, dict):
+        thresholds = {name: thresholds for name in config["variants"]}
+    missing = [name for name in config["variants"] if name not in thresholds]
+    if missing:
+        raise ValueError(f"No threshold for {missing}")
+    config["thresholds"] = {name: [float(value) for value in as_list(thresholds[name])] for name in config["variants"]}
+
+    tokenizers = config["tokenizer"]
+    if not isinstance(tokenizers, dict):
+        tokenizers = {name: tokenizers for name in config["variants"]}
+    for name, tokenizer in tokenizers.items():
+        if tokenizer not in TOKENIZERS:
+            raise ValueError(f"Unknown tokenizer '{tokenizer}' for {name}, expected one of {list(TOKENIZERS)}")
+    config["tokenizer"] = {name: tokenizers.get(name, "nltk") for name in config["variants"]}
+
+    lsa_components = config["lsa_components"]
+    if lsa_components is not None and (not isinstance(lsa_components, int) or lsa_components <= 0):
+        raise ValueError(f"lsa_components must be a positive integer or null, got {lsa_components!r}")
+
+    config["outputs"] = as_list(config["outputs"])
+    for output in config["outputs"]:
+        if output not in ("csv", "columnar"):
+            raise ValueError(f"Unknown output '{output}', expected 'csv' or 'columnar'")
+
+    if config["incremental"]:
+        if len(as_list(config["top_n"])) > 1 or any(len(values) > 1 for values in config["thresholds"].values()):
+            raise ValueError("incremental runs need a single top_n and a single threshold per variant")
+        if config["outputs"] != ["csv"]:
+            raise ValueError("incremental runs only write the 'csv' output")
+        if lsa_components is not None or config["token_ids"]:
+            raise ValueError("incremental runs trace the TF-IDF cosine, set lsa_components to null and "
+                             "token_ids to false")
+
+    return config
+
+def suffixed(name: str, suffix: str, values: list):
+    return f"{name}{suffix}.csv" if len(values) > 1 else f"{name}.csv"
+
+def write_top_n(full_path: Path, top_results):
+    """
+    param - top_results: Ranked TraceResult, or a dictionary of NFR key -> list of (FR key, score)
+    """
+    with stage("write_top_n", nfrs=len(top_results)), full_path.open("w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["NFR", "Rank", "FR", "Similarity"])
+        for nfr, nfr_results in top_results.items():
+            for rank, (fr, score) in enumerate(nfr_results, start=1):
+                writer.writerow([nfr, rank, fr, f"{score:.3f}"])
+
+def write_trace(full_path: Path, fr_view):
+    """
+    param - fr_view: TraceLinks, TraceResult of the trace links, or a dictionary of FR key -> list of 0/1 per NFR
+    """
+    if isinstance(fr_view, TraceLinks):
+        frs, rows = len(fr_view.fr_keys), zip(fr_view.fr_keys, fr_view.links.tolist())
+    elif isinstance(fr_view, TraceResult):
+        frs, rows = len(fr_view.fr_keys), zip(fr_view.fr_keys, fr_view.scores.T.tolist())
+    else:
+        frs, rows = len(fr_view), fr_view.items()
+    with stage("write_trace", frs=frs), full_path.open("w", newline="") as file:
+        writer = csv.writer(file)
+        for fr, values in rows:
+            writer.writerow([fr] + values)
+
+def variant_similarity(info: dict, output_path: Path, name: str, artifacts=None, reuse_artifacts=True,
+                       verbose=False, sample=20, writer=None, lsa_components=None, **variant_options):
+    """
+    NFR x FR similarity of one variant, memory-mapped from the stored artifacts when they were made from the
+    same requirements, otherwise computed and stored
+
+    param - artifacts: Artifact folder of this dataset/variant, None to neither load nor store artifacts
+    param - reuse_artifacts: Use stored artifacts made from the same inputs
+    param - writer: BackgroundWriter or SyncWriter for the preprocessing file and the artifacts
+    param - lsa_components: Number of LSA dimensions to score in (see semantic_similarity), None for the
+                            TF-IDF cosine
+
+    return - nfr_keys, fr_keys, similarity
+    """
+    if lsa_components:
+        return semantic_similarity(info, output_path, name, lsa_components, artifacts, reuse_artifacts, writer,
+                                   **variant_options)
+
+    if artifacts is not None and reuse_artifacts:
+        with stage("load_artifacts"):
+            stored = load_artifacts(artifacts, info, name, token_ids=variant_options.get("vocabulary") is not None)
+        if stored is not None:
+            print(f"{name}: using the stored artifacts in {artifacts}")
+            return stored.nfr_keys, stored.fr_keys, stored.similarity
+
+    writer = writer or SyncWriter()
+    keys, vectorizer, tf_idf_matrix = tf_idf_vectorize(info, output_path, VARIANTS[name], writer=writer,
+                                                       **variant_options)
+    nfr_indices, fr_indices = split_requirement_types(keys)
+    nfr_keys = [keys[i] for i in nfr_indices]
+    fr_keys = [keys[j] for j in fr_indices]
+
+    if verbose:
+        print_tf_idf(vectorizer, tf_idf_matrix, nfr_indices, fr_indices, sample)
+    similarity = nfr_fr_similarity(tf_idf_matrix, nfr_indices, fr_indices)
+    if verbose:
+        print_similarity(nfr_keys, fr_keys, similarity, sample)
+
+    if artifacts is not None:
+        writer.submit(save_variant_artifacts, artifacts, info, name, keys, vectorizer, tf_idf_matrix, similarity,
+                      nfr_indices, fr_indices)
+    return nfr_keys, fr_keys, similarity
+
+def semantic_similarity(info: dict, output_path: Path, name: str, n_components: int, artifacts=None,
+                        reuse_artifacts=True, writer=None, **variant_options):
+    """
+    NFR x FR similarity of one variant in the space of an LSA index, the index is stored next to the
+    artifacts ('<variant>_lsa') and memory-mapped while it was fitted on the same requirements
+
+    return - nfr_keys, fr_keys, similarity
+    """
+    token_ids = variant_options.get("vocabulary") is not None
+    folder = artifacts.with_name(f"{artifacts.name}_lsa") if artifacts is not None else None
+    if folder is not None and reuse_artifacts:
+        with stage("load_artifacts"):
+            index = load_semantic_index(folder, info, name, n_components, token_ids=token_ids)
+        if index is not None:
+            print(f"{name}: using the stored LSA index in {folder}")
+            return index.nfr_keys, index.fr_keys, index.similarity()
+
+    writer = writer or SyncWriter()
+    keys, vectorizer, tf_idf_matrix = tf_idf_vectorize(info, output_path, VARIANTS[name], writer=writer,
+                                                       **variant_options)
+    index = SemanticIndex.fit(keys, vectorizer, tf_idf_matrix.tocsr(), n_components)
+    if folder is not None:
+        writer.submit(index.save, folder, info, name)
+    return index.nfr_keys, index.fr_keys, index.similarity()
+
+def save_variant_artifacts(artifacts: Path, info: dict, name: str, keys: list, vectorizer, tf_idf_matrix, similarity,
+                           nfr_indices, fr_indices):
+    with stage("save_artifacts", nonzeros=tf_idf_matrix.nnz, pairs=similarity.size):
+        save_artifacts(artifacts, info, name, keys, vectorizer, tf_idf_matrix, similarity, nfr_indices, fr_indices)
+
+def run_variant(info: dict, output_path: Path, name: str, top_ns: list, thresholds: list, ground_truth=None,
+                outputs=("csv",), writer=None, **variant_options):
+    """
+    Runs one variant of one dataset and writes its top N and trace files for every value in the config,
+    and the threshold sweep against the ground truth trace if there is one
+
+    param - outputs: 'csv' and/or 'columnar'
+    param - writer: BackgroundWriter the files are written on, None writes them right away
+    param - variant_options: Passed on to variant_similarity (ex. artifacts, verbose, cache)
+
+    return - files: Paths of the written files (still being written until the writer is flushed)
+    """
+    writer = writer or SyncWriter()
+    with stage("trace") as record:
+        record.label(variant=name)
+        nfr_keys, fr_keys, similarity = variant_similarity(info, output_path, name, writer=writer, **variant_options)
+        files = []
+
+        result = TraceResult(nfr_keys, fr_keys, similarity)
+
+        # One partial selection for the largest N, the smaller ones are prefixes (views) of it
+        ranked = result.top(max(top_ns))
+        for top_n in top_ns:
+            top_results = ranked.top(top_n)
+            full_path = output_path / Path(suffixed(f"top_n_results_{name}", f"_top{top_n}", top_ns))
+            if "csv" in outputs:
+                writer.submit(write_top_n, full_path, top_results)
+                files.append(full_path)
+            if "columnar" in outputs:
+                full_path = full_path.with_suffix(COLUMNAR_SUFFIX)
+                writer.submit(write_top_n_columns, full_path, nfr_keys, fr_keys, top_results.indices,
+                              top_results.scores)
+                files.append(full_path)
+
+        # Every threshold in one comparison
+        traces = threshold_trace(similarity, np.array(thresholds)[:, None])
+        for threshold, trace in zip(thresholds, traces):
+            full_path = output_path / Path(suffixed(f"trace_{name}", f"_threshold{threshold:g}", thresholds))
+            if "csv" in outputs:
+                writer.submit(write_trace, full_path, TraceLinks(nfr_keys, fr_keys, trace))
+                files.append(full_path)
+            if "columnar" in outputs:
+                full_path = full_path.with_suffix(COLUMNAR_SUFFIX)
+                writer.submit(write_trace_columns, full_path, nfr_keys, fr_keys, trace)
+                files.append(full_path)
+
+        if "columnar" in outputs:
+            full_path = output_path / Path(f"similarity_{name}{COLUMNAR_SUFFIX}")
+            writer.submit(write_similarity_columns, full_path, nfr_keys, fr_keys, similarity)
+            files.append(full_path)
+
+        if ground_truth is not None:
+            files.append(evaluate_variant(output_path, name, nfr_keys, fr_keys, similarity, ground_truth, writer))
+
+        return files
+
+def run_incremental_variant(info: dict, output_path: Path, name: str, top_n: int, threshold: float, state_path: Path,
+                            ground_truth=None, writer=None, pipeline=None, cache=None):
+    """
+    Runs one variant of one dataset from its saved trace state, only the requirements that changed since the
+    last run are preprocessed and only their lines of the top N and trace files are rewritten
+
+    param - state_path: Trace state file of this dataset/variant, a full fit is run while it isn't usable
+
+    return - files: Paths of the written files (the evaluation file is still being written until the writer is
+                    flushed)
+    """
+    writer = writer or SyncWriter()
+    with stage("trace") as record:
+        record.label(variant=name)
+        trace, summary, files = incremental_trace(info, output_path, name, state_path, top_n, threshold,
+                                                  pipeline, cache)
+        record.count(changed=len(summary["requirements"]))
+        print(f"{name}: {len(summary['requirements'])} changed requirements, {len(files)} files patched")
+
+        if ground_truth is not None:
+            files.append(evaluate_variant(output_path, name, trace.nfr_keys, trace.fr_keys, trace.similarity,
+                                          ground_truth, writer))
+        return files
+
+def evaluate_variant(output_path: Path, name: str, nfr_keys: list, fr_keys: list, similarity, ground_truth,
+                     writer):
+    """
+    Threshold sweep of one variant against the ground truth trace, prints the best threshold
+
+    return - full_path: Evaluation file (still being written until the writer is flushed)
+    """
+    with stage("evaluate", pairs=similarity.size):
+        evaluation = evaluate(similarity, truth_matrix(ground_truth, nfr_keys, fr_keys), nfr_keys)
+    full_path = output_path / Path(f"evaluation_{name}.csv")
+    writer.submit(write_evaluation, full_path, evaluation)
+
+    best = evaluation["best"]
+    print(f"{name}: best threshold {best['threshold']:.3f} (precision {best['precision']:.3f}, "
+          f"recall {best['recall']:.3f}, F1 {best['f1']:.3f}), MAP {evaluation['map']:.3f}")
+    return full_path
+
+def run(config: dict):
+    """
+    Runs every dataset x variant x top N x threshold combination of the run config
+
+    param - config: Run config (see the module docstring)
+
+    return - files: Dictionary of (dataset name, variant name) -> paths of the written files
+    """
+    config = validate_config(config)
+    cache = PreprocessingCache(config["cache"]) if config["cache"] else None
+    pipeline = PreprocessingPipeline(config["workers"], config["chunk_size"], config["lexicon"], config["tokenizer"])
+    top_ns = sorted(set(as_list(config["top_n"])))
+    metrics = Metrics([log_hook()], memory=config["trace_memory"])
+    # One vocabulary for every dataset and variant, a token has the same ID everywhere
+    vocabulary = Vocabulary() if config["token_ids"] else None
+    writer = BackgroundWriter() if config["background_writes"] else SyncWriter()
+    files = {}
+
+    try:
+        with metrics.active(), writer, pipeline:
+            for dataset in config["datasets"]:
+                with stage("dataset") as record:
+                    record.label(dataset=dataset["name"])
+                    info = load_requirements(dataset["requirements"])
+                    ground_truth = load_trace(dataset["ground_truth"]) if dataset.get("ground_truth") else None
+                    output_path = Path(dataset["output"])
+                    output_path.mkdir(parents=True, exist_ok=True)
+                    record.count(requirements=len(info))
+
+                    for name in config["variants"]:
+                        if config["incremental"]:
+                            state_path = output_path / (config["artifacts"] or "artifacts") / f"{name}_incremental.pkl"
+                            files[(dataset["name"], name)] = run_incremental_variant(
+                                info, output_path, name, top_ns[0], config["thresholds"][name][0], state_path,
+                                ground_truth, writer=writer, pipeline=pipeline, cache=cache
+                            )
+                            continue
+                        files[(dataset["name"], name)] = run_variant(
+                            info, output_path, name, top_ns, config["thresholds"][name], ground_truth,
+                            artifacts=output_path / config["artifacts"] / name if config["artifacts"] else None,
+                            reuse_artifacts=config["reuse_artifacts"], verbose=config["verbose"],
+                            sample=config["sample"], cache=cache, pipeline=pipeline, vocabulary=vocabulary,
+                            outputs=config["outputs"], writer=writer, lsa_components=config["lsa_components"]
+                        )
+    finally:
+        if cache is not None:
+            cache.close()
+        if config["metrics"]:
+            metrics.write(config["metrics"])
+
+    return files
+
+def build_run_lexicon(config: dict):
+    """
+    Compiles the WordNet lookups of every dataset in the run config into the config's lexicon file
+
+    return - path: Lexicon file
+    """
+    config = validate_config(config)
+    if not config["lexicon"]:
+        raise ValueError("Run config has no lexicon file")
+    texts = [text for dataset in config["datasets"] for text in load_requirements(dataset["requirements"]).values()]
+    lexicon = build_lexicon(list(dict.fromkeys(texts)), config["lexicon"], config["chunk_size"])
+    print(f"{config['lexicon']}: {len(lexicon.lemmas)} lemmas, {len(lexicon.synonyms)} synonym lookups")
+    return Path(config["lexicon"])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the traceability analyses from a run config")
+    parser.add_argument("config", help="JSON run config")
+    parser.add_argument("--dataset", action="append", help="Only run the dataset(s) with this name")
+    parser.add_argument("--verbose", action="store_true", help="Print a sample of the TF-IDF weights and scores")
+    parser.add_argument("--metrics", help="Write the per stage metrics to this JSON file")
+    parser.add_argument("--trace-memory", action="store_true", help="Record the peak memory of every stage")
+    parser.add_argument("--log-metrics", action="store_true", help="Log every stage record as JSON")
+    parser.add_argument("--recompute", action="store_true", help="Ignore stored artifacts and vectorize again")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only redo the requirements that changed since the last incremental run")
+    parser.add_argument("--build-lexicon", action="store_true",
+                        help="Compile the WordNet lookups of the datasets into the lexicon file and exit")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    if args.dataset:
+        config["datasets"] = [dataset for dataset in config["datasets"] if dataset["name"] in args.dataset]
+    if args.verbose:
+        config["verbose"] = True
+    if args.metrics:
+        config["metrics"] = args.metrics
+    if args.trace_memory:
+        config["trace_memory"] = True
+    if args.recompute:
+        config["reuse_artifacts"] = False
+    if args.incremental:
+        config["incremental"] = True
+        config = validate_config(config)
+    if args.log_metrics:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.build_lexicon:
+        build_run_lexicon(config)
+        return
+
+    for (dataset, name), paths in run(config).items():
+        print(f"{dataset} {name}: {', '.join(str(path) for path in paths)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+Latent semantic (LSA) index of the TF-IDF rows, an alternative to the WordNet expansion of variant 3
+
+Variant 3 adds the synonyms of every token to the text, which makes the documents longer, the vocabulary
+bigger and the similarity pass slower. LSA finds related terms from the requirements themselves: the TF-IDF
+matrix X (requirements x terms) is factored once with a randomized truncated SVD, X ~ U S V^T, and every
+requirement becomes the dense row of X V with a few hundred components. Terms that appear in the same
+requirements end up on the same components, so two requirements can be similar without sharing a term.
+
+    fit         randomized_svd of the sparse TF-IDF matrix, the rows of X V are L2 normalized
+    similarity  NFR embeddings @ FR embeddings^T, a small dense matrix product
+    fold-in     new text is transformed with the stored vocabulary and IDF and projected with V, nothing is refit
+
+With as many components as the rank of X the projection keeps every dot product, so the scores are the TF-IDF
+cosine scores; fewer components merge the co-occurring terms.
+
+An index is stored as a folder (see save and load_semantic_index):
+    manifest.json       inputs (same as 'methods/artifacts.py'), components, seed and the files below
+    keys.txt            requirement keys in row order
+    vocabulary.txt      terms in column order
+    idf.npy             IDF of every term
+    components.npy      V^T of shape (components, terms)
+    embeddings.npy      L2 normalized X V of shape (requirements, components)
+    nfr_indices.npy, fr_indices.npy
+
+Set '"lsa_components": 200' in the run config to trace with the LSA scores, or compare both on a dataset with
+'python -m methods.semantic text_files/p2_requirements.txt --variant variant2 --output lsa_results --components 200'
+"""
+import argparse
+import datetime
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+from sklearn.utils.extmath import randomized_svd
+
+from methods.artifacts import artifact_inputs, replace_folder
+from methods.evaluation import evaluate, load_trace, truth_matrix
+from methods.functions import (TraceResult, load_requirements, nfr_fr_similarity, split_requirement_types,
+                               tf_idf_vectorize, top_k)
+from methods.metrics import stage
+from methods.variants import VARIANTS
+from methods.vocabulary import TokenVectorizer
+
+FORMAT_VERSION = 1
+DEFAULT_COMPONENTS = 200
+# Power iterations of the randomized SVD, more is closer to the exact truncated SVD
+SVD_ITERATIONS = 5
+
+
+class SemanticIndex:
+    """
+    LSA projection of a set of requirements
+
+    param - keys: Requirement keys in row order
+    param - vocabulary: Terms in column order of the TF-IDF matrix
+    param - idf: IDF of every term
+    param - components: V^T of shape (components, terms)
+    param - embeddings: L2 normalized projections of shape (requirements, components)
+    param - vectorizer: Fitted vectorizer for fold-in, rebuilt from the vocabulary and IDF when None
+    param - token_ids: The index was fitted on interned token IDs (TokenVectorizer), text can't be folded in
+    """
+    def __init__(self, keys: list, vocabulary: list, idf, components, embeddings, vectorizer=None,
+                 token_ids=False):
+        self.keys = list(keys)
+        self.vocabulary = list(vocabulary)
+        self.idf = np.asarray(idf)
+        self.components = np.asarray(components)
+        self.embeddings = np.asarray(embeddings)
+        self.nfr_indices, self.fr_indices = split_requirement_types(self.keys)
+        self.vectorizer = vectorizer
+        self.token_ids = token_ids or isinstance(vectorizer, TokenVectorizer)
+
+    @classmethod
+    def fit(cls, keys: list, vectorizer, tf_idf_matrix, n_components=DEFAULT_COMPONENTS, seed=0):
+        """
+        Randomized truncated SVD of the TF-IDF matrix
+
+        param - keys: Requirement keys in row order
+        param - vectorizer: Fitted vectorizer of tf_idf_matrix
+        param - tf_idf_matrix: Sparse TF-IDF matrix with L2 normalized rows
+        param - n_components: Number of dimensions, limited to the smaller side of the matrix
+        param - seed: Seed of the random projection
+
+        return - SemanticIndex
+        """
+        n_components = max(1, min(int(n_components), *tf_idf_matrix.shape))
+        with stage("lsa_fit", requirements=tf_idf_matrix.shape[0], terms=tf_idf_matrix.shape[1],
+                   components=n_components):
+            u, s, vt = randomized_svd(tf_idf_matrix, n_components, n_iter=SVD_ITERATIONS, random_state=seed)
+            embeddings = normalize((u * s).astype(tf_idf_matrix.dtype, copy=False))
+        return cls(keys, vectorizer.get_feature_names_out(), vectorizer.idf_, vt.astype(tf_idf_matrix.dtype),
+                   embeddings, vectorizer)
+
+    @property
+    def n_components(self):
+        return self.components.shape[0]
+
+    @property
+    def nfr_keys(self):
+        return [self.keys[i] for i in self.nfr_indices]
+
+    @property
+    def fr_keys(self):
+        return [self.keys[j] for j in self.fr_indices]
+
+    def similarity(self):
+        """
+        return - NFR x FR similarity of shape (|NFR|, |FR|) in the LSA space
+        """
+        with stage("lsa_similarity", nfrs=len(self.nfr_indices), frs=len(self.fr_indices),
+                   components=self.n_components):
+            return self.embeddings[self.nfr_indices] @ self.embeddings[self.fr_indices].T
+
+    def result(self):
+        """
+        return - TraceResult over the LSA similarity
+        """
+        return TraceResult(self.nfr_keys, self.fr_keys, self.similarity())
+
+    def project(self, tf_idf_rows):
+        """
+        Folds TF-IDF rows made with the index's vocabulary and IDF into the LSA space
+
+        return - L2 normalized embeddings of shape (rows, components)
+        """
+        return normalize(np.asarray(tf_idf_rows @ self.components.T, dtype=self.embeddings.dtype))
+
+    def transform_text(self, preprocessed_text: list):
+        """
+        Embeddings of new preprocessed requirement text, nothing is refit
+
+        param - preprocessed_text: Joined tokens of every requirement (ex. the text a variant returns)
+        """
+        if self.token_ids:
+            raise ValueError("The index was fitted on token IDs, fold in TF-IDF rows with project")
+        if self.vectorizer is None:
+            self.vectorizer = TfidfVectorizer(vocabulary=self.vocabulary, dtype=self.embeddings.dtype)
+            self.vectorizer.idf_ = self.idf
+        return self.project(self.vectorizer.transform(preprocessed_text))
+
+    def query(self, preprocessed_text: list, k=10, kind="NFR"):
+        """
+        Top k indexed requirements of the other type for every new requirement
+
+        param - kind: 'NFR' to score the texts against the FRs, 'FR' to score them against the NFRs
+
+        return - keys: Keys of the indexed requirements the positions refer to
+               - indices, scores: See top_k
+        """
+        targets = self.fr_indices if kind.upper() == "NFR" else self.nfr_indices
+        scores = self.transform_text(preprocessed_text) @ self.embeddings[targets].T
+        indices, top_scores = top_k(scores, k)
+        return [self.keys[i] for i in targets], indices, top_scores
+
+    def save(self, path, info: dict, variant: str, seed=0):
+        """
+        Writes the index to a folder, the folder is replaced at once
+
+        param - info, variant: Requirements and variant the index was fitted on, checked when loading
+
+        return - path: Index folder
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {
+            "idf": self.idf,
+            "components": self.components,
+            "embeddings": self.embeddings,
+            "nfr_indices": self.nfr_indices,
+            "fr_indices": self.fr_indices,
+        }
+        manifest = {
+            "format": FORMAT_VERSION,
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "inputs": semantic_inputs(info, variant, self.n_components, seed, self.embeddings.dtype,
+                                      self.token_ids),
+            "arrays": {name: {"file": f"{name}.npy", "dtype": array.dtype.str, "shape": list(array.shape)}
+                       for name, array in arrays.items()},
+        }
+
+        with stage("lsa_save", requirements=len(self.keys), components=self.n_components):
+            staging = Path(tempfile.mkdtemp(prefix=f".{path.name}-", dir=path.parent))
+            try:
+                for name, array in arrays.items():
+                    np.save(staging / f"{name}.npy", np.ascontiguousarray(array), allow_pickle=False)
+                with open(staging / "keys.txt", "w", encoding="utf-8") as file:
+                    file.writelines(f"{key}\n" for key in self.keys)
+                with open(staging / "vocabulary.txt", "w", encoding="utf-8") as file:
+                    file.writelines(f"{term}\n" for term in self.vocabulary)
+                with open(staging / "manifest.json", "w") as file:
+                    json.dump(manifest, file, indent=2)
+                replace_folder(staging, path)
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+        return path
+
+
+def semantic_inputs(info: dict, variant: str, n_components: int, seed=0, dtype=np.float64, token_ids=False):
+    """
+    Everything a stored index depends on (see artifact_inputs), plus the number of components and the seed
+    """
+    inputs = artifact_inputs(info, variant, dtype, token_ids)
+    inputs.update(components=int(n_components), seed=int(seed))
+    return inputs
+
+def load_semantic_index(path, info=None, variant=None, n_components=DEFAULT_COMPONENTS, seed=0, dtype=np.float64,
+                        token_ids=False):
+    """
+    Opens a stored index, the arrays are memory-mapped
+
+    param - path: Index folder written by SemanticIndex.save
+    param - info, variant, n_components, seed, dtype, token_ids: When info is given, the index is only returned
+                                                                 if it was fitted on these inputs (the number
+                                                                 of components is limited like in fit)
+
+    return - SemanticIndex, or None if the folder doesn't exist or is out of date
+    """
+    path = Path(path)
+    if not (path / "manifest.json").exists():
+        return None
+    with open(path / "manifest.json", "r") as file:
+        manifest = json.load(file)
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported semantic index format {manifest.get('format')} in {path}")
+
+    arrays = {name: np.load(path / entry["file"], mmap_mode="r") for name, entry in manifest["arrays"].items()}
+    with open(path / "keys.txt", "r", encoding="utf-8") as file:
+        keys = file.read().splitlines()
+    with open(path / "vocabulary.txt", "r", encoding="utf-8") as file:
+        vocabulary = file.read().splitlines()
+
+    if info is not None:
+        n_components = max(1, min(int(n_components), len(keys), len(vocabulary)))
+        if manifest["inputs"] != semantic_inputs(info, variant, n_components, seed, dtype, token_ids):
+            return None
+    return SemanticIndex(keys, vocabulary, arrays["idf"], arrays["components"], arrays["embeddings"],
+                         token_ids=manifest["inputs"]["tokens"] == "ids")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit an LSA index and compare it with the TF-IDF cosine scores")
+    parser.add_argument("requirements", help="Requirements file")
+    parser.add_argument("--variant", default="variant2", choices=list(VARIANTS))
+    parser.add_argument("--output", required=True, help="Folder for the preprocessing file and the index")
+    parser.add_argument("--components", type=int, default=DEFAULT_COMPONENTS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ground-truth", help="Trace file to compare MAP and the best F1 with")
+    args = parser.parse_args(argv)
+
+    info = load_requirements(args.requirements)
+    output_path = Path(args.output)
+    output_path.mkdir(parents=True, exist_ok=True)
+    keys, vectorizer, tf_idf_matrix = tf_idf_vectorize(info, output_path, VARIANTS[args.variant])
+    tf_idf_matrix = tf_idf_matrix.tocsr()
+    nfr_indices, fr_indices = split_requirement_types(keys)
+
+    start = time.perf_counter()
+    exact = nfr_fr_similarity(tf_idf_matrix, nfr_indices, fr_indices)
+    print(f"tf-idf: {tf_idf_matrix.shape[1]} terms, similarity {time.perf_counter() - start:.4f} s")
+
+    start = time.perf_counter()
+    index = SemanticIndex.fit(keys, vectorizer, tf_idf_matrix, args.components, args.seed)
+    fitted = time.perf_counter() - start
+    start = time.perf_counter()
+    similarity = index.similarity()
+    print(f"lsa: {index.n_components} components, fit {fitted:.4f} s, similarity {time.perf_counter() - start:.4f} s")
+    path = index.save(output_path / f"lsa_{args.variant}", info, args.variant, args.seed)
+    print(f"index: {path}")
+
+    if args.ground_truth:
+        truth = truth_matrix(load_trace(args.ground_truth), index.nfr_keys, index.fr_keys)
+        for name, scores in (("tf-idf", exact), ("lsa", similarity)):
+            evaluation = evaluate(scores, truth, index.nfr_keys)
+            best = evaluation["best"]
+            print(f"{name}: MAP {evaluation['map']:.3f}, best threshold {best['threshold']:.3f} "
+                  f"(precision {best['precision']:.3f}, recall {best['recall']:.3f}, F1 {best['f1']:.3f})")
+
+if __name__ == "__main__":
+    main()
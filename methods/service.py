@@ -0,0 +1,284 @@
+"""
+Long-running trace service
+
+Loads a requirements file once, keeps the preprocessing pipeline (NLTK state) and a fitted TF-IDF model per
+variant warm, and answers trace requests for new requirement text over a local HTTP endpoint. A new text is
+only transformed with the fitted vectorizer and scored through the inverted index (methods/index.py) of the
+indexed requirements, nothing is refit.
+The requirements file is watched and the models are rebuilt in the background when it changes, requests
+keep using the previous models until the new ones are ready.
+
+To run use 'python -m methods.service text_files/requirements-3nfr-60fr.txt' in the root directory.
+The '--lexicon' and '--tokenizer' options are the same as the run config's 'lexicon' and 'tokenizer' (see
+'methods/runner.py'), new texts are preprocessed the same way as the indexed requirements.
+
+Endpoints:
+    GET  /health   -> {"status": "ok", "requirements": <count>, "variants": [...]}
+    POST /reload   -> rebuilds the models now, a failed reload keeps the previous models
+    POST /trace    <- {"text": "...", "type": "NFR" or "FR", "variant": "variant2", "top_n": 10, "threshold": 0.11}
+                   -> {"variant": ..., "type": ..., "results": [{"key": "FR12", "similarity": 0.31}, ...],
+                       "trace": ["FR12", ...]}   (trace only when a threshold is given)
+A NFR text is traced against the indexed FRs and a FR text against the indexed NFRs.
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from methods.cache import PreprocessingCache
+from methods.functions import load_requirements, split_requirement_types
+from methods.index import InvertedIndex
+from methods.variants import TOKENIZERS, PreprocessingPipeline, VARIANT_STAGES, load_worker_state, split_cached
+
+# Query texts memoized per model before the memo is cleared
+QUERY_MEMO_LIMIT = 4096
+
+
+class TraceModel:
+    """
+    Fitted TF-IDF model of one variant with the NFR and FR rows indexed for transform-only queries
+
+    param - info: Dictionary of requirement key -> requirement text
+    param - variant: 'variant1', 'variant2' or 'variant3'
+    param - pipeline: PreprocessingPipeline used for the corpus, queries use a pipeline with its lexicon and
+                      tokenizers
+    param - cache: PreprocessingCache or None
+    """
+    def __init__(self, info: dict, variant: str, pipeline: PreprocessingPipeline, cache=None):
+        self.variant = variant
+        keys = list(info)
+        # Queries are single texts, preprocessed in this process; the lock keeps the memo consistent between
+        # the request threads
+        self.query_pipeline = PreprocessingPipeline(1, pipeline.chunk_size, pipeline.lexicon, pipeline.tokenizers)
+        self.query_lock = threading.Lock()
+
+        hits, missing = split_cached(info, variant, cache)
+        hits.update(zip(missing, pipeline.variant(variant, list(missing.values()))))
+        if cache is not None and missing:
+            cache.store(info, {key: hits[key] for key in missing}, variant)
+
+        self.vectorizer = TfidfVectorizer()
+        tf_idf_matrix = self.vectorizer.fit_transform([" ".join(hits[key]) for key in keys]).tocsr()
+        nfr_indices, fr_indices = split_requirement_types(keys)
+
+        self.keys = {
+            "NFR": [keys[i] for i in nfr_indices],
+            "FR": [keys[j] for j in fr_indices],
+        }
+        self.indexes = {
+            "NFR": InvertedIndex(tf_idf_matrix[nfr_indices], self.keys["NFR"]),
+            "FR": InvertedIndex(tf_idf_matrix[fr_indices], self.keys["FR"]),
+        }
+
+    def query(self, text: str, kind="NFR", top_n=10, threshold=None):
+        """
+        Traces a new requirement against the indexed requirements of the other type
+
+        param - text: Requirement text
+        param - kind: 'NFR' to score against the FRs, 'FR' to score against the NFRs
+        param - top_n: Number of results
+        param - threshold: Only for the trace list, requirements scoring above it
+
+        return - Dictionary with the ranked results and the trace
+        """
+        kind = kind.upper()
+        if kind not in ("NFR", "FR"):
+            raise ValueError(f"type must be 'NFR' or 'FR', got {kind!r}")
+        target = "FR" if kind == "NFR" else "NFR"
+
+        tokens = self.preprocess(text)
+        vector = self.vectorizer.transform([" ".join(tokens)])
+        index = self.indexes[target]
+
+        indices, top_scores = index.top_k(vector, top_n)
+        response = {
+            "variant": self.variant,
+            "type": kind,
+            "tokens": tokens,
+            "results": [
+                {"key": self.keys[target][j], "similarity": float(score)}
+                for j, score in zip(indices[0], top_scores[0])
+            ],
+        }
+        if threshold is not None:
+            above, _ = index.above_threshold(vector, float(threshold))[0]
+            response["trace"] = [self.keys[target][j] for j in above]
+        return response
+
+    def preprocess(self, text: str):
+        """
+        return - tokens of a query text, the memo is cleared once it holds QUERY_MEMO_LIMIT texts
+        """
+        with self.query_lock:
+            if len(self.query_pipeline.memo["tokenize"]) >= QUERY_MEMO_LIMIT:
+                self.query_pipeline.clear()
+            return self.query_pipeline.variant(self.variant, [text])[0]
+
+
+class TraceService:
+    """
+    Warm models of every variant for one requirements file, rebuilt when the file changes
+
+    param - requirements_file: Requirements file to index
+    param - variants: Variant names to keep models for
+    param - cache: PreprocessingCache or None
+    param - workers: Preprocessing worker processes used when (re)building the models
+    param - lexicon: Compiled lexicon file for the lemma and synonym lookups (see 'methods/lexicon.py'), None uses
+                     the NLTK lookups
+    param - tokenizers: Dictionary of variant name -> 'nltk' or 'fast' ('nltk' if missing)
+    """
+    def __init__(self, requirements_file, variants=tuple(VARIANT_STAGES), cache=None, workers=1, lexicon=None,
+                 tokenizers=None):
+        self.requirements_file = Path(requirements_file)
+        self.variants = list(variants)
+        self.cache = cache
+        self.workers = workers
+        # Kept over reloads so the preprocessing worker processes start once
+        self.pipeline = PreprocessingPipeline(workers, lexicon=lexicon, tokenizers=tokenizers)
+        self.reload_lock = threading.Lock()
+        self.modified = None
+        self.models = {}
+        self.count = 0
+        load_worker_state(lexicon)
+        self.reload()
+
+    def reload(self):
+        """
+        Rebuilds the models from the requirements file and swaps them in at once
+        """
+        with self.reload_lock:
+            modified = self.requirements_file.stat().st_mtime_ns
+            info = load_requirements(self.requirements_file)
+            models = {name: TraceModel(info, name, self.pipeline, self.cache) for name in self.variants}
+            # Only the texts of the current file are worth keeping for the next reload
+            self.pipeline.retain(info.values())
+
+            self.models = models
+            self.count = len(info)
+            self.modified = modified
+
+    def close(self):
+        """
+        Stops the preprocessing worker processes
+        """
+        self.pipeline.close()
+
+    def reload_if_changed(self):
+        if self.requirements_file.stat().st_mtime_ns != self.modified:
+            self.reload()
+            return True
+        return False
+
+    def watch(self, interval=2.0, stop=None):
+        """
+        Polls the requirements file in a background thread and reloads the models when it changes
+
+        return - stop: threading.Event that stops the watcher when set
+        """
+        stop = stop or threading.Event()
+
+        def poll():
+            while not stop.wait(interval):
+                try:
+                    self.reload_if_changed()
+                except (OSError, ValueError) as error:
+                    print(f"Reload failed, keeping the previous models: {error}")
+
+        threading.Thread(target=poll, daemon=True).start()
+        return stop
+
+    def trace(self, request: dict):
+        models = self.models
+        variant = request.get("variant", self.variants[0])
+        if variant not in models:
+            raise ValueError(f"Unknown variant '{variant}', expected one of {list(models)}")
+        if not isinstance(request.get("text"), str):
+            raise ValueError("Request needs a 'text' string")
+        return models[variant].query(
+            request["text"], request.get("type", "NFR"), int(request.get("top_n", 10)), request.get("threshold")
+        )
+
+
+def make_handler(service: TraceService):
+    class TraceHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self.send_json(200, {"status": "ok", "requirements": service.count, "variants": list(service.models)})
+            else:
+                self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            try:
+                if self.path == "/reload":
+                    service.reload()
+                    self.send_json(200, {"status": "reloaded", "requirements": service.count})
+                elif self.path == "/trace":
+                    length = int(self.headers.get("Content-Length", 0))
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                    self.send_json(200, service.trace(request))
+                else:
+                    self.send_json(404, {"error": f"Unknown path {self.path}"})
+            except (ValueError, TypeError) as error:
+                self.send_json(400, {"error": str(error)})
+            except (OSError, LookupError) as error:
+                # Unreadable requirements file or missing NLTK data, the previous models stay in place
+                message = str(error).strip()
+                if self.path == "/reload":
+                    message = f"Reload failed, keeping the previous models: {message}"
+                self.send_json(500, {"error": message})
+
+        def log_message(self, format, *args):
+            pass
+
+    return TraceHandler
+
+def serve(service: TraceService, host="127.0.0.1", port=8765):
+    """
+    return - server: ThreadingHTTPServer answering requests on its own thread per client
+    """
+    return ThreadingHTTPServer((host, port), make_handler(service))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve trace requests against a warm requirements index")
+    parser.add_argument("requirements", help="Requirements file to index")
+    parser.add_argument("--variant", action="append", choices=list(VARIANT_STAGES), help="Variant(s) to serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--poll", type=float, default=2.0, help="Seconds between requirements file checks")
+    parser.add_argument("--cache", default=".trace_cache/preprocessing.sqlite", help="Preprocessing cache, '' disables it")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--lexicon", default=".trace_cache/lexicon.json",
+                        help="Compiled lexicon file (made with the runner's '--build-lexicon'), '' disables it")
+    parser.add_argument("--tokenizer", choices=list(TOKENIZERS), default="nltk")
+    args = parser.parse_args(argv)
+
+    # sqlite connections are used from the reload thread, so the cache is opened without the same thread check
+    cache = PreprocessingCache(args.cache, check_same_thread=False) if args.cache else None
+    variants = args.variant or list(VARIANT_STAGES)
+    service = TraceService(args.requirements, variants, cache, args.workers, args.lexicon or None,
+                           {name: args.tokenizer for name in variants})
+    service.watch(args.poll)
+
+    server = serve(service, args.host, args.port)
+    print(f"Serving {service.count} requirements on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Out-of-core tracing for requirement files larger than memory
+
+The requirements file is read in chunks and never held in memory as a whole:
+    Pass 1  every chunk is preprocessed and counted. The term counts of the chunk are spilled to disk and
+            only the document frequencies (and the NFR rows, the small side of the trace) stay in memory.
+    IDF     computed from the document frequencies of the whole stream (smooth IDF like TfidfVectorizer).
+    Pass 2  the spilled FR counts are read back one chunk at a time, weighted and L2 normalized, scored
+            against the NFR rows, and the chunk's scores are spilled to disk. The top N per NFR is merged
+            chunk by chunk and the trace file is appended, so memory is bounded by the chunk size.
+
+Columns come from one of two schemes:
+    'vocabulary'  two-pass vocabulary, terms are interned as they are seen and sorted by term once the stream
+                  is read, scores match tf_idf_similarity (up to floating point summation order)
+    'hashing'     terms are hashed into n_features columns (HashingVectorizer), nothing grows with the
+                  vocabulary, rare hash collisions add a little similarity
+
+Requirement keys are expected to be unique across the whole file.
+
+To run use 'python -m methods.streaming text_files/requirements-3nfr-60fr.txt --variant variant1 --output stream_results'
+in the root directory.
+"""
+import argparse
+import csv
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from methods.functions import parse_requirement_line, threshold_trace, top_k
+from methods.metrics import stage
+from methods.variants import PreprocessingPipeline, VARIANT_STAGES, split_cached
+from methods.vocabulary import Vocabulary
+
+
+def iter_requirement_chunks(path, chunk_size=10000):
+    """
+    Reads a requirements file lazily
+
+    param - path: Requirements file
+    param - chunk_size: Requirements per chunk
+
+    return - Yields dictionaries of requirement key -> requirement text with up to chunk_size entries
+    """
+    chunk = {}
+    with open(path, "r") as file:
+        for line in file:
+            parsed = parse_requirement_line(line)
+            if parsed is None:
+                continue
+            chunk[parsed[0]] = parsed[1]
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = {}
+    if chunk:
+        yield chunk
+
+
+class StreamCounter:
+    """
+    Turns token lists into term count rows with the vocabulary or hashing scheme
+
+    param - scheme: 'vocabulary' or 'hashing'
+    param - n_features: Number of hash columns for the hashing scheme
+    param - token_ids: Count the tokens of the variant as they are instead of re-tokenizing the joined text
+                       with the TfidfVectorizer pattern (see 'methods/vocabulary.py')
+    """
+    def __init__(self, scheme="vocabulary", n_features=2 ** 20, token_ids=False):
+        if scheme not in ("vocabulary", "hashing"):
+            raise ValueError(f"Unknown column scheme '{scheme}', expected 'vocabulary' or 'hashing'")
+        self.scheme = scheme
+        self.token_ids = token_ids
+        self.analyzer = (lambda tokens: tokens) if token_ids else TfidfVectorizer().build_analyzer()
+        if scheme == "hashing":
+            self.hasher = HashingVectorizer(n_features=n_features, analyzer=self.analyzer_of, alternate_sign=False,
+                                            norm=None, dtype=np.float64)
+            self.n_features = n_features
+            self.document_frequency = np.zeros(n_features, dtype=np.int64)
+        else:
+            self.vocabulary = Vocabulary()
+            self.document_frequency = np.zeros(0, dtype=np.int64)
+        self.documents = 0
+
+    def analyzer_of(self, tokens):
+        return self.analyzer(tokens if self.token_ids else " ".join(tokens))
+
+    def count(self, token_lists: list):
+        """
+        Term counts of a chunk, the document frequencies are updated
+
+        return - counts: CSR matrix of shape (len(token_lists), current number of columns)
+        """
+        if self.scheme == "hashing":
+            counts = self.hasher.transform(token_lists).tocsr()
+        else:
+            rows, ids = [], []
+            for row, tokens in enumerate(token_lists):
+                terms = self.vocabulary.encode(self.analyzer_of(tokens))
+                ids.append(terms)
+                rows.append(np.full(len(terms), row, dtype=np.intp))
+            ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int32)
+            rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.intp)
+            counts = sp.coo_matrix((np.ones(len(ids)), (rows, ids)),
+                                   shape=(len(token_lists), len(self.vocabulary))).tocsr()
+            if len(self.document_frequency) < len(self.vocabulary):
+                self.document_frequency = np.concatenate([
+                    self.document_frequency, np.zeros(len(self.vocabulary) - len(self.document_frequency), np.int64)
+                ])
+
+        counts.sum_duplicates()
+        self.document_frequency[:counts.shape[1]] += np.bincount(counts.indices, minlength=counts.shape[1])
+        self.documents += counts.shape[0]
+        return counts
+
+    def finish(self):
+        """
+        Fixes the columns and IDF once the whole stream is counted
+
+        return - columns: Array mapping count columns to TF-IDF columns
+               - idf: IDF of every TF-IDF column
+        """
+        if self.scheme == "hashing":
+            columns = np.arange(self.n_features)
+            frequency = self.document_frequency
+        else:
+            order = np.argsort(np.array(self.vocabulary.terms, dtype=object), kind="stable")
+            columns = np.empty(len(order), dtype=np.intp)
+            columns[order] = np.arange(len(order))
+            frequency = self.document_frequency[order]
+        idf = np.log((1 + self.documents) / (1 + frequency)) + 1
+        return columns, idf
+
+def weigh(counts, columns, idf):
+    """
+    L2 normalized TF-IDF rows of spilled counts, the same weighting as TfidfTransformer
+    """
+    counts = sp.csr_matrix((counts.data, columns[counts.indices], counts.indptr), shape=(counts.shape[0], len(idf)))
+    counts.sort_indices()
+    counts.data = counts.data * idf[counts.indices]
+    return normalize(counts, norm="l2", copy=False)
+
+def merge_top_k(best_scores, best_positions, scores, positions, k):
+    """
+    Top k of the running best and a new chunk, ties keep the FR order (the running best comes first)
+    """
+    scores = np.concatenate([best_scores, scores], axis=1)
+    positions = np.concatenate([best_positions, positions], axis=1)
+    selected, selected_scores = top_k(scores, k)
+    return selected_scores, np.take_along_axis(positions, selected, axis=1)
+
+def preprocess_chunk(info: dict, variant: str, cache=None, workers=1, pipeline=None):
+    """
+    Token lists of one chunk, the pipeline's memo is cleared afterwards so it doesn't grow with the stream
+
+    param - pipeline: PreprocessingPipeline kept over the chunks (its worker processes stay up), a new one
+                      with workers processes for this chunk if None
+    """
+    result, missing = split_cached(info, variant, cache)
+    if pipeline is None:
+        with PreprocessingPipeline(workers) as pipeline:
+            result.update(zip(missing, pipeline.variant(variant, list(missing.values()))))
+    else:
+        result.update(zip(missing, pipeline.variant(variant, list(missing.values()))))
+        pipeline.clear()
+    if cache is not None and missing:
+        cache.store(info, {key: result[key] for key in missing}, variant)
+    return [result[key] for key in info]
+
+def stream_trace(requirements_file, output_path, variant: str, top_n=10, threshold=0.14, chunk_size=10000,
+                 scheme="vocabulary", n_features=2 ** 20, token_ids=False, cache=None, workers=1, work_path=None,
+                 keep_scores=True):
+    """
+    Traces a requirements file chunk by chunk (see the module docstring)
+
+    param - requirements_file: Requirements file, read lazily
+    param - output_path: Folder for the preprocessing, top N and trace files
+    param - variant: 'variant1', 'variant2' or 'variant3'
+    param - top_n: Number of results per NFR
+    param - threshold: Trace threshold
+    param - chunk_size: Requirements per chunk, bounds the memory use
+    param - scheme: 'vocabulary' or 'hashing'
+    param - n_features: Number of hash columns for the hashing scheme
+    param - token_ids: Count the variant tokens as they are (see StreamCounter)
+    param - cache: PreprocessingCache or None
+    param - workers: Preprocessing worker processes, started once and kept over the chunks
+    param - work_path: Folder for the spilled counts, a temporary folder if None
+    param - keep_scores: Keep the per chunk similarity scores in 'output_path/stream_<variant>'
+
+    return - Dictionary of output name -> path
+    """
+    if variant not in VARIANT_STAGES:
+        raise ValueError(f"Unknown variant '{variant}', expected one of {list(VARIANT_STAGES)}")
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+    counter = StreamCounter(scheme, n_features, token_ids)
+    nfr_keys, nfr_counts = [], []
+    chunks = []
+
+    with tempfile.TemporaryDirectory(dir=work_path) as spill, PreprocessingPipeline(workers) as pipeline:
+        spill = Path(spill)
+
+        # Pass 1: preprocess, count and spill the FR counts, keep the NFR counts
+        with stage("stream_count") as record, \
+                open(output_path / f"preprocessing_{variant}.txt", "w") as preprocessing_file:
+            for number, info in enumerate(iter_requirement_chunks(requirements_file, chunk_size)):
+                token_lists = preprocess_chunk(info, variant, cache, pipeline=pipeline)
+                for key, tokens in zip(info, token_lists):
+                    preprocessing_file.write(f"{key}: {tokens}\n")
+
+                counts = counter.count(token_lists)
+                keys = list(info)
+                is_nfr = np.array([key.upper().startswith("NFR") for key in keys], dtype=bool)
+                for key in keys:
+                    if not key.upper().startswith(("NFR", "FR")):
+                        raise ValueError(f"Unknown requirement type for key '{key}'")
+
+                if is_nfr.any():
+                    nfr_keys += [key for key, nfr in zip(keys, is_nfr) if nfr]
+                    nfr_counts.append(counts[np.flatnonzero(is_nfr)])
+                if not is_nfr.all():
+                    fr_rows = np.flatnonzero(~is_nfr)
+                    sp.save_npz(spill / f"counts_{number:05d}.npz", counts[fr_rows])
+                    with open(spill / f"keys_{number:05d}.txt", "w") as file:
+                        file.writelines(f"{keys[j]}\n" for j in fr_rows)
+                    chunks.append(number)
+            record.count(requirements=counter.documents, nfrs=len(nfr_keys), chunks=len(chunks))
+
+        columns, idf = counter.finish()
+        n_columns = len(columns)
+        nfr_rows = sp.vstack(
+            [sp.csr_matrix((block.data, block.indices, block.indptr), shape=(block.shape[0], n_columns))
+             for block in nfr_counts]
+        ) if nfr_counts else sp.csr_matrix((0, n_columns))
+        nfr_rows = weigh(nfr_rows.tocsr(), columns, idf)
+
+        # Pass 2: score every FR chunk against the NFRs and spill the scores
+        scores_path = output_path / f"stream_{variant}"
+        if keep_scores:
+            shutil.rmtree(scores_path, ignore_errors=True)
+            scores_path.mkdir(parents=True)
+        k = int(top_n)
+        best_scores = np.empty((len(nfr_keys), 0))
+        best_positions = np.empty((len(nfr_keys), 0), dtype=np.intp)
+        fr_keys_seen = {}
+        offset = 0
+        manifest = []
+
+        trace_file = output_path / f"trace_{variant}.csv"
+        with stage("stream_score") as record, trace_file.open("w", newline="") as file:
+            writer = csv.writer(file)
+            for number in chunks:
+                counts = sp.load_npz(spill / f"counts_{number:05d}.npz").tocsr()
+                with open(spill / f"keys_{number:05d}.txt", "r") as key_file:
+                    fr_keys = key_file.read().splitlines()
+
+                fr_rows = weigh(counts, columns, idf)
+                similarity = (nfr_rows @ fr_rows.T).toarray()
+
+                for fr, values in zip(fr_keys, threshold_trace(similarity, threshold).tolist()):
+                    writer.writerow([fr] + values)
+
+                positions = np.broadcast_to(np.arange(offset, offset + len(fr_keys)), similarity.shape)
+                chunk_best, chunk_scores = top_k(similarity, k)
+                best_scores, best_positions = merge_top_k(
+                    best_scores, best_positions, chunk_scores, np.take_along_axis(positions, chunk_best, axis=1), k
+                )
+                needed = set(best_positions.ravel().tolist())
+                fr_keys_seen = {position: key for position, key in fr_keys_seen.items() if position in needed}
+                fr_keys_seen.update((offset + j, key) for j, key in enumerate(fr_keys) if offset + j in needed)
+
+                if keep_scores:
+                    np.save(scores_path / f"similarity_{number:05d}.npy", similarity)
+                    with open(scores_path / f"fr_keys_{number:05d}.txt", "w") as key_file:
+                        key_file.writelines(f"{key}\n" for key in fr_keys)
+                    manifest.append({"chunk": number, "frs": len(fr_keys), "first_fr": offset})
+                offset += len(fr_keys)
+            record.count(frs=offset, chunks=len(chunks))
+
+    top_n_file = output_path / f"top_n_results_{variant}.csv"
+    with top_n_file.open("w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["NFR", "Rank", "FR", "Similarity"])
+        for i, nfr in enumerate(nfr_keys):
+            for rank, (position, score) in enumerate(zip(best_positions[i], best_scores[i]), start=1):
+                writer.writerow([nfr, rank, fr_keys_seen[position], f"{score:.3f}"])
+
+    outputs = {"preprocessing": output_path / f"preprocessing_{variant}.txt", "top_n": top_n_file, "trace": trace_file}
+    if keep_scores:
+        with open(scores_path / "chunks.json", "w") as file:
+            json.dump({"variant": variant, "scheme": scheme, "nfr_keys": nfr_keys, "frs": offset,
+                       "columns": n_columns, "chunks": manifest}, file, indent=2)
+        outputs["scores"] = scores_path
+    return outputs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trace a requirements file chunk by chunk")
+    parser.add_argument("requirements", help="Requirements file")
+    parser.add_argument("--variant", default="variant1", choices=list(VARIANT_STAGES))
+    parser.add_argument("--output", required=True, help="Output folder")
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--threshold", type=float, default=0.14)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--scheme", default="vocabulary", choices=["vocabulary", "hashing"])
+    parser.add_argument("--n-features", type=int, default=2 ** 20)
+    parser.add_argument("--token-ids", action="store_true")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--work-dir", help="Folder for the spilled counts")
+    parser.add_argument("--no-scores", action="store_true", help="Don't keep the per chunk similarity scores")
+    args = parser.parse_args(argv)
+
+    outputs = stream_trace(args.requirements, args.output, args.variant, args.top_n, args.threshold,
+                           args.chunk_size, args.scheme, args.n_features, args.token_ids, workers=args.workers,
+                           work_path=args.work_dir, keep_scores=not args.no_scores)
+    for name, path in outputs.items():
+        print(f"{name}: {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Tiled NFR x FR similarity on every core with bounded memory
+
+The NFR x FR block is never materialized. The FR side (and the NFR side when it is large) is cut into tiles,
+each tile is one sparse product run on a thread or process pool, and only what the outputs need is kept
+from it: the top k FRs of every NFR row and the scores above the threshold. The tile size comes from a
+memory budget shared by the workers, so the peak memory stays flat however many FRs there are.
+Tiles are merged in FR order, so the top k (ties by FR position) is the same as functions.top_k on the
+whole block.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+import scipy.sparse as sp
+
+from methods.functions import split_requirement_types, tf_idf_vectorize, top_k
+from methods.metrics import stage
+
+# Dense tile, its top k partition copy and the comparison masks are alive at the same time
+TILE_COPIES = 4
+# Narrower FR tiles spend more time merging than scoring, the NFR side is split first to stay above this
+MIN_FR_TILE = 1024
+
+_tile_rows = {}
+
+
+def tile_shape(n_nfrs: int, n_frs: int, memory_budget: int, workers: int, itemsize=8):
+    """
+    Largest tile that keeps every worker's dense scores inside the memory budget
+
+    param - memory_budget: Bytes for the tiles of all workers together
+
+    return - nfr_tile: NFR rows per tile
+           - fr_tile: FR columns per tile
+    """
+    per_worker = max(1, memory_budget // (max(1, workers) * TILE_COPIES * itemsize))
+    nfr_tile = max(1, min(n_nfrs, per_worker // min(max(1, n_frs), MIN_FR_TILE)))
+    fr_tile = max(1, min(n_frs, per_worker // nfr_tile))
+    return nfr_tile, fr_tile
+
+def ordered_results(executor, function, tasks, window):
+    """
+    Results of the tasks in task order with at most window tasks submitted at once, so finished tiles
+    waiting for an earlier one can't pile up in memory
+    """
+    pending = []
+    tasks = iter(tasks)
+    for task in tasks:
+        pending.append(executor.submit(function, *task))
+        if len(pending) >= window:
+            break
+    while pending:
+        result = pending.pop(0).result()
+        for task in tasks:
+            pending.append(executor.submit(function, *task))
+            break
+        yield result
+
+def set_tile_rows(nfr_rows, fr_rows):
+    """
+    Process pool initializer, every worker gets the rows once instead of once per tile
+    """
+    _tile_rows["nfr"] = nfr_rows
+    _tile_rows["fr"] = fr_rows
+
+def score_worker_tile(bounds, k, threshold):
+    return score_tile(_tile_rows["nfr"], _tile_rows["fr"], bounds, k, threshold)
+
+def score_tile(nfr_rows, fr_rows, bounds, k, threshold):
+    """
+    Scores one tile and keeps its top k per NFR row and the scores above the threshold
+
+    param - bounds: (nfr start, nfr end, fr start, fr end)
+
+    return - bounds, top k FR positions, top k scores, (rows, columns, scores) above the threshold, all in
+             positions of the whole NFR x FR block
+    """
+    nfr_start, nfr_end, fr_start, fr_end = bounds
+    similarity = (nfr_rows[nfr_start:nfr_end] @ fr_rows[fr_start:fr_end].T).toarray()
+
+    indices, scores = top_k(similarity, k) if k else (None, None)
+    above = None
+    if threshold is not None:
+        rows, columns = np.nonzero(similarity > threshold)
+        above = (rows + nfr_start, columns + fr_start, similarity[rows, columns])
+    return bounds, None if indices is None else indices + fr_start, scores, above
+
+def tiled_similarity(nfr_rows, fr_rows, k=10, threshold=None, memory_budget=256 * 1024 * 1024, workers=None,
+                     pool="thread"):
+    """
+    Top k and above threshold NFR x FR scores without the whole similarity block in memory
+
+    param - nfr_rows: Sparse L2 normalized TF-IDF rows of the NFRs
+    param - fr_rows: Sparse L2 normalized TF-IDF rows of the FRs
+    param - k: Number of top FRs per NFR, 0 or None for none
+    param - threshold: Keep the scores above it, None for none
+    param - memory_budget: Bytes of dense tile scores alive at once over all workers (2 tiles per worker are
+                           in flight, each worker scores one at a time)
+    param - workers: Number of threads or processes, None uses every core
+    param - pool: 'thread' (the sparse products release the GIL) or 'process'
+
+    return - indices: FR positions of shape (|NFR|, k) or None
+           - scores: Scores of shape (|NFR|, k) or None
+           - above: CSR matrix of shape (|NFR|, |FR|) with the scores above the threshold, or None
+    """
+    if pool not in ("thread", "process"):
+        raise ValueError(f"Unknown pool '{pool}', expected 'thread' or 'process'")
+    nfr_rows = sp.csr_matrix(nfr_rows)
+    fr_rows = sp.csr_matrix(fr_rows)
+    n_nfrs, n_frs = nfr_rows.shape[0], fr_rows.shape[0]
+    workers = workers or os.cpu_count() or 1
+    k = min(int(k or 0), n_frs)
+
+    nfr_tile, fr_tile = tile_shape(n_nfrs, n_frs, memory_budget, workers, np.dtype(nfr_rows.dtype).itemsize)
+    tiles = [(nfr_start, min(nfr_start + nfr_tile, n_nfrs), fr_start, min(fr_start + fr_tile, n_frs))
+             for nfr_start in range(0, n_nfrs, nfr_tile) for fr_start in range(0, n_frs, fr_tile)]
+
+    best_scores = {start: np.empty((min(nfr_tile, n_nfrs - start), 0), dtype=nfr_rows.dtype)
+                   for start in range(0, n_nfrs, nfr_tile)}
+    best_indices = {start: np.empty((len(scores), 0), dtype=np.intp) for start, scores in best_scores.items()}
+    above_parts = []
+
+    with stage("tiled_similarity", nfrs=n_nfrs, frs=n_frs, tiles=len(tiles), workers=workers) as record:
+        tasks = ((bounds, k, threshold) for bounds in tiles)
+        if workers == 1:
+            executor = None
+            results = (score_tile(nfr_rows, fr_rows, *task) for task in tasks)
+        elif pool == "thread":
+            executor = ThreadPoolExecutor(max_workers=workers)
+            results = ordered_results(executor, partial(score_tile, nfr_rows, fr_rows), tasks, 2 * workers)
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=set_tile_rows,
+                                           initargs=(nfr_rows, fr_rows))
+            results = ordered_results(executor, score_worker_tile, tasks, 2 * workers)
+
+        try:
+            # Results come back in tile order, so merging keeps the ties in FR order
+            for (nfr_start, _, _, _), indices, scores, above in results:
+                if k:
+                    merged_scores = np.concatenate([best_scores[nfr_start], scores], axis=1)
+                    merged_indices = np.concatenate([best_indices[nfr_start], indices], axis=1)
+                    selected, best_scores[nfr_start] = top_k(merged_scores, k)
+                    best_indices[nfr_start] = np.take_along_axis(merged_indices, selected, axis=1)
+                if above is not None:
+                    above_parts.append(above)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        above = None
+        if threshold is not None:
+            rows, columns, values = (np.concatenate(part) for part in zip(*above_parts)) if above_parts else \
+                (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0, dtype=nfr_rows.dtype))
+            above = sp.csr_matrix((values, (rows, columns)), shape=(n_nfrs, n_frs))
+            record.count(above=above.nnz)
+
+    if not k:
+        return None, None, above
+    return np.concatenate(list(best_indices.values())), np.concatenate(list(best_scores.values())), above
+
+def tf_idf_tiled(info, output_path, variant_function, k=10, threshold=None, memory_budget=256 * 1024 * 1024,
+                 workers=None, pool="thread", dtype=np.float64, **variant_options):
+    """
+    Top k FRs per NFR and the scores above the threshold through the tiled executor
+
+    return - nfr_keys: NFR keys in row order
+           - fr_keys: FR keys
+           - indices, scores, above: See tiled_similarity
+    """
+    keys, _, tf_idf_matrix = tf_idf_vectorize(info, output_path, variant_function, dtype, **variant_options)
+    tf_idf_matrix = tf_idf_matrix.tocsr()
+    nfr_indices, fr_indices = split_requirement_types(keys)
+
+    indices, scores, above = tiled_similarity(tf_idf_matrix[nfr_indices], tf_idf_matrix[fr_indices], k, threshold,
+                                              memory_budget, workers, pool)
+    return [keys[i] for i in nfr_indices], [keys[j] for j in fr_indices], indices, scores, above
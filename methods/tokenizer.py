@@ -0,0 +1,118 @@
+"""
+Fast tokenizer giving the same tokens as nltk.word_tokenize on requirement text
+
+word_tokenize splits the text into sentences with Punkt and runs the Treebank regex cascade (about 25
+substitutions) on every sentence. Requirement text rarely uses what most of the cascade is for (quotes,
+contractions, ellipses), so fast_word_tokenize pads the punctuation with one compiled regex and splits on
+white space. Text the single pass can't be sure about goes to word_tokenize, so the tokens are always
+the same:
+    - quotes, '..', '---', two ':'/',' in a row and the contractions word_tokenize splits (ex. 'cannot')
+    - a period followed by a bracket or other punctuation Punkt may end a sentence before
+    - a period inside the text that Punkt could take as a sentence end, unless it follows a plain word of
+      two or more letters that is not a Punkt abbreviation or collocation and no closing bracket comes
+      next (Punkt always splits there)
+
+To compare both tokenizers on requirement files use
+'python -m methods.tokenizer text_files/requirements-3nfr-60fr.txt text_files/p2_requirements.txt'
+(synthetic corpora from 'python -m benchmarks.corpus' work the same way).
+'tests/test_tokenizer.py' runs the same check on every file in 'text_files' and on seeded synthetic corpora.
+"""
+import argparse
+import re
+
+from nltk.tokenize import _get_punkt_tokenizer, word_tokenize
+
+from methods.functions import load_requirements
+
+# Everything the Treebank cascade pads with spaces on text without quotes, contractions and ellipses:
+# '--', ;@#$%&?!*, brackets, ':' and ',' unless a digit follows, and a period that ends a sentence
+PADDED = re.compile(r"--|[;@#$%&?!*\[\](){}<>]|[:,](?!\d)|(?<=[^.])\.(?=\s|[\])}> ]*\s*$)")
+# A period followed by a period or by punctuation Punkt can split before also falls back
+FALLBACK = re.compile(r"[\"'`«»“”‘’„]|\.[.)\";}\]*:@'({\[?!]|---|[:,][:,]|cannot|gimme|gonna|gotta|lemme|wanna", re.I)
+# A period Punkt looks at as a possible sentence end, with the white space separated word before it and the
+# first character after it
+INNER_PERIOD = re.compile(r"(?<!\S)(\S*)\.(?=\s+(\S))")
+PLAIN_WORD = re.compile(r"[^\W\d_]{2,}")
+
+_punkt = {}
+
+
+def punkt_words():
+    """
+    Punkt abbreviations and first words of its collocations, a period after these needs the full decision
+
+    return - set of lower case words
+    """
+    if "words" not in _punkt:
+        params = _get_punkt_tokenizer("english")._params
+        _punkt["words"] = set(params.abbrev_types) | {first for first, _ in params.collocations}
+    return _punkt["words"]
+
+def sentence_ends(text: str):
+    """
+    return - True if every period inside the text is one Punkt certainly splits at
+    """
+    for match in INNER_PERIOD.finditer(text):
+        word, after = match.groups()
+        # Punkt moves closing brackets after the break into the sentence before
+        if not PLAIN_WORD.fullmatch(word) or word.lower() in punkt_words() or after in ")]}":
+            return False
+    return True
+
+def fast_word_tokenize(text: str):
+    """
+    Same tokens as word_tokenize(text)
+    """
+    if FALLBACK.search(text) or not sentence_ends(text):
+        return word_tokenize(text)
+    return PADDED.sub(r" \g<0> ", text).split()
+
+def fast_word_tokenize_all(texts):
+    """
+    fast_word_tokenize over a batch of texts
+    """
+    fallback = FALLBACK.search
+    pad = PADDED.sub
+    return [word_tokenize(text) if fallback(text) or not sentence_ends(text) else pad(r" \g<0> ", text).split()
+            for text in texts]
+
+def differences(texts):
+    """
+    Differential check of fast_word_tokenize against word_tokenize
+
+    param - texts: Texts to compare on
+
+    return - mismatches: List of (text, word_tokenize tokens, fast_word_tokenize tokens) that differ
+           - fast: Number of texts the single pass handled without falling back
+    """
+    mismatches = []
+    fast = 0
+    for text in texts:
+        expected = word_tokenize(text)
+        tokens = fast_word_tokenize(text)
+        if tokens != expected:
+            mismatches.append((text, expected, tokens))
+        if not FALLBACK.search(text) and sentence_ends(text):
+            fast += 1
+    return mismatches, fast
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare fast_word_tokenize with word_tokenize on requirement files")
+    parser.add_argument("requirements", nargs="+", help="Requirement files")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for path in args.requirements:
+        texts = list(load_requirements(path).values())
+        # The variants tokenize lower case text
+        texts += [text.lower() for text in texts]
+        mismatches, fast = differences(texts)
+        print(f"{path}: {len(texts)} texts, {fast} without fallback, {len(mismatches)} different")
+        for text, expected, tokens in mismatches[:10]:
+            print(f"    {text!r}\n        word_tokenize:      {expected}\n        fast_word_tokenize: {tokens}")
+        failed = failed or bool(mismatches)
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -24,9 +24,16 @@ Websites/Documents used:
 from nltk.tokenize import word_tokenize
 from nltk.corpus import stopwords, wordnet
 from nltk.stem import WordNetLemmatizer
-from nltk import pos_tag
+from nltk import pos_tag, pos_tag_sents
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import repeat
 from pathlib import Path
 
+from methods.lexicon import Lexicon, load_lexicon
+from methods.metrics import stage
+from methods.tokenizer import fast_word_tokenize_all
+
 
 def get_wordnet_pos(tag):
     if tag.startswith("J"):
@@ -53,97 +60,460 @@ def wordnet_expansion(word, POS, num_synonyms=1):
     
     return list(synonyms)
 
+def split_cached(info: dict, variant: str, cache=None):
+    """
+    Splits the requirements into the ones already preprocessed in the cache and the ones to preprocess
+
+    param - info: Dictionary of requirement key -> requirement text
+    param - variant: Variant identity used in the cache key
+    param - cache: PreprocessingCache or None
+
+    return - hits: Dictionary of requirement key -> cached token list
+           - missing: Dictionary of requirement key -> text that needs preprocessing
+    """
+    if cache is None:
+        return {}, dict(info)
+    return cache.lookup(info, variant)
+
+def finish_variant(info: dict, result: dict, output_path: Path, variant: str, cache=None, computed=None,
+                   vocabulary=None, writer=None):
+    """
+    Stores new results in the cache, writes the preprocessing file and builds the inputs for TF-IDF
+
+    param - info: Dictionary of requirement key -> requirement text, gives the output order
+    param - result: Dictionary of requirement key -> token list
+    param - output_path: Folder the preprocessing results are written to
+    param - variant: Variant identity, also the name of the preprocessing file
+    param - cache: PreprocessingCache or None
+    param - computed: Requirement keys that were preprocessed in this run and are not cached yet
+    param - vocabulary: Vocabulary to intern the tokens in, the text list is then TokenIds instead of strings
+    param - writer: BackgroundWriter the preprocessing file is written on, None writes it right away
+
+    return - key_list: Requirement keys
+           - text_list: Preprocessed requirements joined with spaces, or their token ID arrays
+    """
+    if cache is not None and computed:
+        cache.store(info, {key: result[key] for key in computed}, variant)
+
+    key_list = list(info)
+    if vocabulary is not None:
+        text_list = vocabulary.encode_all(result[key] for key in info)
+    else:
+        text_list = [" ".join(result[key]) for key in info]
+
+    full_path = output_path / Path(f"preprocessing_{variant}.txt")
+    if writer is None:
+        write_preprocessing(full_path, key_list, result)
+    else:
+        writer.submit(write_preprocessing, full_path, key_list, result)
+    return key_list, text_list
+
+def write_preprocessing(full_path: Path, keys: list, result: dict):
+    with stage("write_preprocessing", requirements=len(keys)):
+        with open(full_path, "w") as file:
+            for key in keys:
+                file.write(f"{key}: {result[key]}\n")
+
+"""
+PRE-PROCESSING STAGES
+Every variant is a chain of the same stages, so the shared ones only run once per requirement:
+    tokenize -> filter                    (variant 1)
+    tokenize -> tag -> lemmatize          (variant 2)
+    tokenize -> tag -> lemmatize -> expand (variant 3)
+Each stage works on a batch of requirements, so POS tagging is one pos_tag_sents call per batch (see tag_stage).
+The tokenize stage uses word_tokenize or the single pass fast_word_tokenize (see 'methods/tokenizer.py'),
+both give the same tokens.
+"""
+_worker_state = {}
+
+def worker_state(name: str):
+    """
+    NLTK state loaded once per process (stop words, lemmatizer with the word net corpus, lexicon)
+    """
+    if name not in _worker_state:
+        if name == "stop_words":
+            _worker_state[name] = set(stopwords.words("english"))
+        elif name == "lemmatizer":
+            lemmatizer = WordNetLemmatizer()
+            lemmatizer.lemmatize("warm")
+            _worker_state[name] = lemmatizer
+        elif name == "lexicon":
+            _worker_state[name] = Lexicon(wordnet_lemma, wordnet_expansion)
+    return _worker_state[name]
+
+def wordnet_lemma(word, POS):
+    return worker_state("lemmatizer").lemmatize(word, POS)
+
+def use_lexicon(path):
+    """
+    Answers the lemma and synonym lookups of this process from a compiled lexicon file (see 'methods/lexicon.py'),
+    an out of date or missing file leaves the memoized NLTK lookups in place
+
+    return - True if the file was loaded
+    """
+    lexicon = load_lexicon(path, wordnet_lemma, wordnet_expansion)
+    if lexicon is None:
+        return False
+    _worker_state["lexicon"] = lexicon
+    return True
+
+def load_worker_state(lexicon=None):
+    """
+    Warms every stage in a worker process before it receives work
+
+    param - lexicon: Compiled lexicon file, the word net corpus is then only loaded for words it doesn't have
+    """
+    worker_state("stop_words")
+    if lexicon is None or not use_lexicon(lexicon):
+        worker_state("lemmatizer")
+    pos_tag(["warm"])
+
+TOKENIZERS = ("nltk", "fast")
+
+def tokenize_stage(texts: list, tokenizer="nltk"):
+    """
+    param - tokenizer: 'nltk' (word_tokenize) or 'fast' (fast_word_tokenize)
+    """
+    if tokenizer == "fast":
+        return fast_word_tokenize_all([text.lower() for text in texts])
+    if tokenizer != "nltk":
+        raise ValueError(f"Unknown tokenizer '{tokenizer}', expected one of {list(TOKENIZERS)}")
+    return [word_tokenize(text.lower()) for text in texts]
+
+def filter_stage(token_lists: list):
+    stop_words = worker_state("stop_words")
+    return [[word for word in tokens if word not in stop_words] for tokens in token_lists]
+
+def tag_stage(token_lists: list):
+    """
+    POS tags of a batch of token lists with one pos_tag_sents call
+
+    The batch only shares the tagger lookup, every requirement is still tagged as its own sentence: the
+    perceptron tagger uses the neighbouring words and tags, so joining requirements would change the tags.
+    """
+    return pos_tag_sents(token_lists)
+
+def lemmatize_stage(tagged_lists: list, lexicon=None):
+    """
+    Removes stop words and punctuation and lemmatizes, keeps the word net POS of every lemma for expansion
+
+    param - lexicon: Lexicon for the lookups, the one of this process if None
+    """
+    stop_words = worker_state("stop_words")
+    if lexicon is None:
+        lexicon = worker_state("lexicon")
+    lemma_lists = []
+
+    for tagged in tagged_lists:
+        lemmas = []
+        for word, tag in tagged:
+            if word.isalpha() and word not in stop_words:
+                pos = get_wordnet_pos(tag)
+                lemmas.append((lexicon.lemmatize(word, pos), pos))
+        lemma_lists.append(lemmas)
+
+    return lemma_lists
+
+def expand_stage(lemma_lists: list, lexicon=None):
+    if lexicon is None:
+        lexicon = worker_state("lexicon")
+    expanded_lists = []
+
+    for lemmas in lemma_lists:
+        expanded = []
+        for lemma, pos in lemmas:
+            expanded.append(lemma)
+
+            synonyms = lexicon.expand(lemma, pos)
+            expanded.extend(synonyms)
+        expanded_lists.append(expanded)
+
+    return expanded_lists
+
+# stage -> (input stage, function), None is the raw requirement text
+STAGES = {
+    "tokenize": (None, tokenize_stage),
+    "filter": ("tokenize", filter_stage),
+    "tag": ("tokenize", tag_stage),
+    "lemmatize": ("tag", lemmatize_stage),
+    "expand": ("lemmatize", expand_stage),
+}
+
+VARIANT_STAGES = {
+    "variant1": "filter",
+    "variant2": "lemmatize",
+    "variant3": "expand",
+}
+
+def run_stages(texts: list, targets: list, known=None, tokenizer="nltk"):
+    """
+    Runs the target stages and the stages they depend on for a batch of requirements
+
+    param - texts: Requirement texts
+    param - targets: Stage names to compute
+    param - known: Dictionary of stage -> results already computed for texts, these are not rerun
+    param - tokenizer: Tokenizer of the tokenize stage, 'nltk' or 'fast'
+
+    return - Dictionary of stage -> list of results in the order of texts, for the stages computed in this call
+    """
+    results = dict(known or {})
+    computed = {}
+
+    def compute(name):
+        if name not in results:
+            source, function = STAGES[name]
+            inputs = texts if source is None else compute(source)
+            with stage(name, requirements=len(inputs)) as record:
+                results[name] = computed[name] = function(inputs, tokenizer) if source is None else function(inputs)
+                if name != "tag":
+                    record.count(tokens=sum(len(tokens) for tokens in results[name]))
+        return results[name]
+
+    for target in targets:
+        compute(target)
+    return computed
+
+class PreprocessingPipeline:
+    """
+    Runs the preprocessing stages with memoized intermediate results
+
+    Results are memoized per stage and requirement text, so running several variants over the same
+    requirements tokenizes and tags each requirement once and only branches where the variants differ.
+
+    param - workers: Number of worker processes, 1 runs in this process, None uses every core
+    param - chunk_size: Number of requirements per batch
+    param - lexicon: Compiled lexicon file for the lemma and synonym lookups (see build_lexicon), None uses
+                     the memoized NLTK lookups
+    param - tokenizers: Dictionary of variant name -> 'nltk' or 'fast', the tokenizer a variant's requirements
+                        are tokenized with ('nltk' if missing). Both give the same tokens, so the variants
+                        still share the tokenize results.
+
+    With several workers the process pool is started on the first batch that needs it and kept for later
+    calls, so the NLTK state of the workers is loaded once per pipeline. Close the pipeline (or use it as a
+    context manager) to stop the workers.
+    """
+    def __init__(self, workers=1, chunk_size=256, lexicon=None, tokenizers=None):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.lexicon = lexicon
+        self.tokenizers = dict(tokenizers or {})
+        for name, tokenizer in self.tokenizers.items():
+            if tokenizer not in TOKENIZERS:
+                raise ValueError(f"Unknown tokenizer '{tokenizer}' for {name}, expected one of {list(TOKENIZERS)}")
+        self.memo = {stage: {} for stage in STAGES}
+        self.executor = None
+        if lexicon is not None:
+            use_lexicon(lexicon)
+
+    def pool(self):
+        """
+        return - The worker processes of this pipeline, started with warm NLTK state on first use
+        """
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=load_worker_state,
+                                                initargs=(self.lexicon,))
+        return self.executor
+
+    def clear(self):
+        """
+        Forgets the memoized results, the worker processes stay up
+        """
+        self.memo = {stage: {} for stage in STAGES}
+
+    def retain(self, texts):
+        """
+        Forgets the memoized results of every text not in texts, the worker processes stay up
+        """
+        texts = set(texts)
+        self.memo = {stage: {text: value for text, value in memo.items() if text in texts}
+                     for stage, memo in self.memo.items()}
+
+    def close(self):
+        """
+        Stops the worker processes, a later batch starts new ones
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def dependencies(self, stage: str):
+        chain = []
+        while stage is not None:
+            chain.append(stage)
+            stage = STAGES[stage][0]
+        return chain
+
+    def run(self, texts: list, targets: list, tokenizer="nltk"):
+        """
+        Computes the target stages for every text that does not have them memoized yet
+
+        param - texts: Requirement texts
+        param - targets: Stage names
+        param - tokenizer: 'nltk' or 'fast'
+
+        return - Dictionary of target stage -> list of results in the order of texts
+        """
+        pending = list(dict.fromkeys(
+            text for text in texts if any(text not in self.memo[target] for target in targets)
+        ))
+        stages = {stage for target in targets for stage in self.dependencies(target)}
+        chunks = [pending[start:start + self.chunk_size] for start in range(0, len(pending), self.chunk_size)]
+        knowns = [
+            {stage: [self.memo[stage][text] for text in chunk]
+             for stage in stages if all(text in self.memo[stage] for text in chunk)}
+            for chunk in chunks
+        ]
+
+        if self.workers == 1 or len(chunks) <= 1:
+            computed = map(run_stages, chunks, repeat(targets), knowns, repeat(tokenizer))
+        else:
+            computed = list(self.pool().map(run_stages, chunks, repeat(targets), knowns, repeat(tokenizer)))
+
+        for chunk, results in zip(chunks, computed):
+            for stage, values in results.items():
+                self.memo[stage].update(zip(chunk, values))
+
+        return {target: [self.memo[target][text] for text in texts] for target in targets}
+
+    def variant(self, name: str, texts: list):
+        """
+        param - name: 'variant1', 'variant2' or 'variant3'
+        param - texts: Requirement texts
+
+        return - token lists of the variant in the order of texts
+        """
+        return self.variants([name], texts)[name]
+
+    def variants(self, names: list, texts: list):
+        """
+        Runs several variants in one pass over the requirements
+
+        return - Dictionary of variant name -> token lists in the order of texts
+        """
+        groups = {}
+        for name in names:
+            groups.setdefault(self.tokenizers.get(name, "nltk"), []).append(name)
+        outputs = {}
+        for tokenizer, group in groups.items():
+            outputs.update(self.run(texts, [VARIANT_STAGES[name] for name in group], tokenizer))
+        result = {}
+        for name in names:
+            tokens = outputs[VARIANT_STAGES[name]]
+            if VARIANT_STAGES[name] == "lemmatize":
+                tokens = [[lemma for lemma, _ in lemmas] for lemmas in tokens]
+            result[name] = tokens
+        return result
+
+def build_lexicon(texts: list, path, chunk_size=256):
+    """
+    Compiles the lemma and synonym lookups variant 2 and 3 make for the requirements into a lexicon file,
+    with it the variants give the same output without loading the word net corpus
+
+    param - texts: Requirement texts
+    param - path: Lexicon file, replaced if it exists
+
+    return - lexicon: Lexicon with the compiled entries
+    """
+    lexicon = Lexicon(wordnet_lemma, wordnet_expansion)
+    with stage("build_lexicon", requirements=len(texts)) as record:
+        for start in range(0, len(texts), chunk_size):
+            tagged_lists = tag_stage(tokenize_stage(texts[start:start + chunk_size]))
+            expand_stage(lemmatize_stage(tagged_lists, lexicon), lexicon)
+        lexicon.save(path)
+        record.count(lemmas=len(lexicon.lemmas), synonyms=len(lexicon.synonyms))
+    return lexicon
+
+def open_pipeline(pipeline=None, workers=1, chunk_size=256, lexicon=None, tokenizers=None):
+    """
+    return - Context manager giving the pipeline, or a new PreprocessingPipeline that is closed on exit if None
+    """
+    if pipeline is not None:
+        return nullcontext(pipeline)
+    return PreprocessingPipeline(workers, chunk_size, lexicon, tokenizers)
+
+def run_variant(name: str, info: dict, output_path: Path, cache=None, workers=1, chunk_size=256, pipeline=None,
+                vocabulary=None, writer=None, lexicon=None, tokenizers=None):
+    with stage(name, requirements=len(info)) as record:
+        result, missing = split_cached(info, name, cache)
+
+        with open_pipeline(pipeline, workers, chunk_size, lexicon, tokenizers) as pipeline:
+            result.update(zip(missing, pipeline.variant(name, list(missing.values()))))
+        record.count(cached=len(info) - len(missing), computed=len(missing),
+                     tokens=sum(len(tokens) for tokens in result.values()))
+
+        return finish_variant(info, result, output_path, name, cache, missing, vocabulary, writer)
+
+def run_variants(info: dict, output_path: Path, names=("variant1", "variant2", "variant3"),
+                 cache=None, workers=1, chunk_size=256, pipeline=None, vocabulary=None, writer=None, lexicon=None,
+                 tokenizers=None):
+    """
+    Preprocesses the requirements with several variants sharing the tokenize and tag work
+
+    param - info: Dictionary of requirement key -> requirement text
+    param - output_path: Folder the preprocessing results are written to
+    param - names: Variant names to run
+    param - cache: PreprocessingCache or None
+    param - workers: Number of worker processes, 1 runs in this process, None uses every core
+    param - chunk_size: Number of requirements per batch
+    param - pipeline: PreprocessingPipeline to reuse, a new one is made (and closed) if None
+    param - vocabulary: Vocabulary shared by the variants, the outputs are then token ID arrays (see 'methods/vocabulary.py')
+    param - writer: BackgroundWriter for the preprocessing files, None writes them right away
+    param - lexicon: Compiled lexicon file of the new pipeline (see PreprocessingPipeline)
+    param - tokenizers: Dictionary of variant name -> 'nltk' or 'fast' of the new pipeline
+
+    return - Dictionary of variant name -> (key_list, text_list)
+    """
+    with stage("variants", requirements=len(info), variants=len(names)) as record, \
+            open_pipeline(pipeline, workers, chunk_size, lexicon, tokenizers) as pipeline:
+        cached = {name: split_cached(info, name, cache) for name in names}
+        pending = list(dict.fromkeys(text for _, missing in cached.values() for text in missing.values()))
+        pipeline.variants([name for name in names if cached[name][1]], pending)
+        record.count(computed=len(pending))
+
+        outputs = {}
+        for name in names:
+            result, missing = cached[name]
+            result.update(zip(missing, pipeline.variant(name, list(missing.values()))))
+            outputs[name] = finish_variant(info, result, output_path, name, cache, missing, vocabulary, writer)
+    return outputs
+
 """
 PRE-PROCESSING
 The 1st of the 3 variants will use tokenization and remove stop words
 """
-def variant1(info: dict, output_path: Path):
-    result = {}
-    key_list = []
-    text_list = []
-    stop_words = set(stopwords.words("english"))
-
-    for id, text in info.items():
-        tokenized = word_tokenize(text.lower())
-        result[id] = [word for word in tokenized if word not in stop_words]
-    
-    for key in result:
-        key_list.append(key)
-        text_list.append(" ".join(result[key]))
-    
-    full_path = output_path / Path("preprocessing_variant1.txt")
-    with open(full_path, "w") as file:
-        for k, r in result.items():
-            file.write(f"{k}: {r}\n")
-    return key_list, text_list
+def variant1(info: dict, output_path: Path, cache=None, workers=1, chunk_size=256, pipeline=None, vocabulary=None,
+             writer=None, lexicon=None, tokenizers=None):
+    return run_variant("variant1", info, output_path, cache, workers, chunk_size, pipeline, vocabulary, writer, lexicon,
+                       tokenizers)
 
 """
 PRE-PROCESSING
 The 1st of the 3 variants will use tokenization, remove stop words, and lemmatize words based on POS tags
 """
-def variant2(info: dict, output_path: Path):
-    result = {}
-    key_list = []
-    text_list = []
-
-    stop_words = set(stopwords.words("english"))
-    lemmatizer = WordNetLemmatizer()
-
-    for id, text in info.items():
-        tokens = word_tokenize(text.lower())
-        tagged = pos_tag(tokens)
-
-        lemmatized = [lemmatizer.lemmatize(word, get_wordnet_pos(pos))
-                       for word, pos in tagged
-                       if word.isalpha() and word not in stop_words]
-        
-        result[id] = lemmatized
-
-    for key in result:
-        key_list.append(key)
-        text_list.append(" ".join(result[key]))
-
-    full_path = output_path / Path("preprocessing_variant2.txt")
-    with open(full_path, "w") as file:
-        for k, r in result.items():
-            file.write(f"{k}: {r}\n")
-    return key_list, text_list
+def variant2(info: dict, output_path: Path, cache=None, workers=1, chunk_size=256, pipeline=None, vocabulary=None,
+             writer=None, lexicon=None, tokenizers=None):
+    return run_variant("variant2", info, output_path, cache, workers, chunk_size, pipeline, vocabulary, writer, lexicon,
+                       tokenizers)
 
 """
 PRE-PROCESSING
 The 3rd of the 3 variants will use tokenization, remove stop words and punctuation, lemmatizes based on POS tags, 
 and adds word net expansion
 """
-def variant3(info: dict, output_path: Path):
-    result = {}
-    key_list = []
-    text_list = []
-
-    stop_words = set(stopwords.words("english"))
-    lemmatizer = WordNetLemmatizer()
-
-    for id, text in info.items():
-        tokens = word_tokenize(text.lower())
-        tagged = pos_tag(tokens)
-        expanded = []
+def variant3(info: dict, output_path: Path, cache=None, workers=1, chunk_size=256, pipeline=None, vocabulary=None,
+             writer=None, lexicon=None, tokenizers=None):
+    return run_variant("variant3", info, output_path, cache, workers, chunk_size, pipeline, vocabulary, writer, lexicon,
+                       tokenizers)
 
-        for word, tag in tagged:
-            if word.isalpha() and word not in stop_words:
-                pos = get_wordnet_pos(tag)
-                lemma = lemmatizer.lemmatize(word, pos) 
-                expanded.append(lemma)
-
-                synonyms = wordnet_expansion(lemma, pos)
-                expanded.extend(synonyms)
-        
-        result[id] = expanded
-
-    for key in result:
-        key_list.append(key)
-        text_list.append(" ".join(result[key]))
-
-    full_path = output_path / Path("preprocessing_variant3.txt")
-    with open(full_path, "w") as file:
-        for k, r in result.items():
-            file.write(f"{k}: {r}\n")
-    return key_list, text_list
+# Variant name -> variant function, the names are the ones of VARIANT_STAGES
+VARIANTS = {
+    "variant1": variant1,
+    "variant2": variant2,
+    "variant3": variant3,
+}
@@ -0,0 +1,122 @@
+"""
+Interned token IDs and TF-IDF straight from them
+
+The variants decide what a token is (ex. '85' and '%' are kept by variant 1). Joining the tokens with spaces
+and letting TfidfVectorizer split them again with its own regex drops some of them and tokenizes every
+requirement a second time. With a Vocabulary each distinct token is interned once as an integer ID, a
+requirement becomes an int32 array of IDs, and TokenVectorizer counts the IDs into the term matrix directly.
+
+The weighting is the same as TfidfVectorizer (raw counts, smooth IDF, L2 normalized rows) and the columns
+are sorted by term like TfidfVectorizer, so both give the same matrix when they see the same tokens.
+"""
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfTransformer
+
+
+class Vocabulary:
+    """
+    Shared token -> ID table, IDs are given in first seen order and never change
+    """
+    def __init__(self, terms=()):
+        self.terms = []
+        self.ids = {}
+        for term in terms:
+            self.intern(term)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def intern(self, token: str):
+        token_id = self.ids.get(token)
+        if token_id is None:
+            token_id = self.ids[token] = len(self.terms)
+            self.terms.append(token)
+        return token_id
+
+    def encode(self, tokens, grow=True):
+        """
+        param - tokens: Token list of one requirement
+        param - grow: Add unknown tokens, otherwise they are left out
+
+        return - ids: int32 array of token IDs
+        """
+        if grow:
+            return np.fromiter((self.intern(token) for token in tokens), dtype=np.int32)
+        ids = self.ids
+        return np.fromiter((ids[token] for token in tokens if token in ids), dtype=np.int32)
+
+    def encode_all(self, token_lists, grow=True):
+        return TokenIds((self.encode(tokens, grow) for tokens in token_lists), self)
+
+    def decode(self, ids):
+        return [self.terms[token_id] for token_id in ids]
+
+
+class TokenIds(list):
+    """
+    Token ID arrays of several requirements with the vocabulary they index into
+    """
+    def __init__(self, arrays=(), vocabulary=None):
+        super().__init__(arrays)
+        self.vocabulary = vocabulary
+
+
+class TokenVectorizer:
+    """
+    TF-IDF over token ID arrays with the fitted attributes of TfidfVectorizer (vocabulary_, idf_,
+    get_feature_names_out), so it can be stored and queried the same way
+
+    param - vocabulary: Vocabulary the token IDs index into, shared between variants
+    param - dtype: Type of the TF-IDF values
+    """
+    def __init__(self, vocabulary: Vocabulary, dtype=np.float64):
+        self.token_vocabulary = vocabulary
+        self.dtype = dtype
+
+    def counts(self, token_ids):
+        """
+        Term counts of shape (requirements, columns), IDs without a column are left out
+        """
+        lengths = np.fromiter((len(ids) for ids in token_ids), dtype=np.intp, count=len(token_ids))
+        ids = np.concatenate(token_ids) if len(token_ids) else np.empty(0, dtype=np.int32)
+        rows = np.repeat(np.arange(len(token_ids)), lengths)
+
+        columns = np.full(len(self.token_vocabulary), -1, dtype=np.intp)
+        columns[self.column_ids] = np.arange(len(self.column_ids))
+        columns = columns[ids] if len(ids) else np.empty(0, dtype=np.intp)
+        known = columns >= 0
+
+        counts = sp.coo_matrix(
+            (np.ones(known.sum(), dtype=self.dtype), (rows[known], columns[known])),
+            shape=(len(token_ids), len(self.column_ids)),
+        )
+        return counts.tocsr()
+
+    def fit_transform(self, token_ids):
+        """
+        Fits the columns and IDF on the requirements
+
+        param - token_ids: TokenIds or a list of int arrays from the vocabulary
+
+        return - tf_idf_matrix: Sparse TF-IDF matrix with L2 normalized rows
+        """
+        used = np.unique(np.concatenate(token_ids)) if len(token_ids) else np.empty(0, dtype=np.int32)
+        terms = np.array(self.token_vocabulary.decode(used), dtype=object)
+        self.column_ids = used[np.argsort(terms, kind="stable")] if len(used) else used
+        self.vocabulary_ = {self.token_vocabulary.terms[token_id]: column
+                            for column, token_id in enumerate(self.column_ids)}
+
+        self.transformer = TfidfTransformer()
+        tf_idf_matrix = self.transformer.fit_transform(self.counts(token_ids))
+        self.idf_ = self.transformer.idf_
+        return tf_idf_matrix.astype(self.dtype, copy=False)
+
+    def transform(self, token_ids):
+        """
+        TF-IDF of new requirements with the fitted columns and IDF, unknown tokens are left out
+        """
+        return self.transformer.transform(self.counts(token_ids)).astype(self.dtype, copy=False)
+
+    def get_feature_names_out(self):
+        return np.array(self.token_vocabulary.decode(self.column_ids), dtype=object)
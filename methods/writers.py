@@ -0,0 +1,226 @@
+"""
+Output layer: background writer queue and columnar trace tables
+
+BackgroundWriter runs the file writes on their own thread. The compute stages put a write on the queue
+and carry on, the writer thread drains everything queued in one batch before it waits again. The queue is
+bounded, so a slow disk holds the compute back instead of piling results up in memory. Write errors are
+raised in the compute thread at the next submit, flush or close.
+
+Columnar tables are NumPy-backed: one .npy file per column and a schema.json. Text columns (requirement
+keys) are dictionary encoded like Arrow, an int32 code column plus the list of distinct values in the
+schema. Columns are memory-mapped when read, so a single column of a large table loads without the rest.
+
+Tables written next to the CSV files ('<name>.columns' folders):
+    top_n_results_variantN    NFR, Rank, FR, Similarity (one row per NFR x rank, like the CSV)
+    trace_variantN            FR, then one int8 0/1 column per NFR (like the CSV)
+    similarity_variantN       FR, then one score column per NFR (the full similarity table)
+"""
+import contextvars
+import json
+import queue
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+
+COLUMNAR_SUFFIX = ".columns"
+
+
+class BackgroundWriter:
+    """
+    Runs writes on a background thread in the order they were submitted
+
+    param - max_pending: Number of queued writes before submit blocks
+    """
+    def __init__(self, max_pending=64):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.error = None
+        # Guards error between the writer thread and the thread raising it
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.drain, name="background-writer", daemon=True)
+        self.thread.start()
+
+    def drain(self):
+        while True:
+            batch = [self.queue.get()]
+            # Everything already queued is written in the same batch
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for job in batch:
+                try:
+                    if job is None:
+                        return
+                    context, function, args, kwargs = job
+                    with self.lock:
+                        failed = self.error is not None
+                    if not failed:
+                        context.run(function, *args, **kwargs)
+                except BaseException as error:
+                    with self.lock:
+                        self.error = error
+                finally:
+                    self.queue.task_done()
+
+    def raise_error(self):
+        with self.lock:
+            error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Queues a write, the arguments must not be changed afterwards
+        """
+        self.raise_error()
+        if not self.thread.is_alive():
+            raise RuntimeError("Background writer is closed")
+        self.queue.put((contextvars.copy_context(), function, args, kwargs))
+
+    def flush(self):
+        """
+        Waits for every queued write
+        """
+        self.queue.join()
+        self.raise_error()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        if error_type is None:
+            self.close()
+        else:
+            # Keep the original error, the queued writes still finish
+            try:
+                self.close()
+            except BaseException:
+                pass
+
+
+class SyncWriter:
+    """
+    Same interface as BackgroundWriter, writes right away in the calling thread
+    """
+    def submit(self, function, *args, **kwargs):
+        function(*args, **kwargs)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        pass
+
+
+def write_columns(path, columns: dict, dictionaries=None):
+    """
+    Writes a columnar table, the folder is replaced as a whole
+
+    param - path: Table folder ('.columns' is added if missing)
+    param - columns: Dictionary of column name -> 1-D array, all of the same length
+    param - dictionaries: Dictionary of column name -> list of values, for dictionary encoded columns
+                          (the column then holds int32 codes into the list)
+
+    return - path: Table folder
+    """
+    path = Path(path)
+    if path.suffix != COLUMNAR_SUFFIX:
+        path = path.with_name(path.name + COLUMNAR_SUFFIX)
+    dictionaries = dictionaries or {}
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"Columns of {path} have different lengths {sorted(lengths)}")
+
+    staging = path.with_name(path.name + ".tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    schema = {"rows": lengths.pop() if lengths else 0, "columns": []}
+    for position, (name, values) in enumerate(columns.items()):
+        values = np.ascontiguousarray(values)
+        file_name = f"column_{position:04d}.npy"
+        np.save(staging / file_name, values, allow_pickle=False)
+        column = {"name": name, "file": file_name, "dtype": values.dtype.str}
+        if name in dictionaries:
+            column["dictionary"] = list(dictionaries[name])
+        schema["columns"].append(column)
+    with open(staging / "schema.json", "w") as file:
+        json.dump(schema, file, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    staging.rename(path)
+    return path
+
+def read_columns(path, names=None, decode=True):
+    """
+    Reads a columnar table
+
+    param - path: Table folder
+    param - names: Column names to read, every column if None
+    param - decode: Turn dictionary encoded columns back into lists of values, otherwise their codes are returned
+
+    return - Dictionary of column name -> memory-mapped array (or list of values for decoded columns)
+    """
+    path = Path(path)
+    if path.suffix != COLUMNAR_SUFFIX:
+        path = path.with_name(path.name + COLUMNAR_SUFFIX)
+    with open(path / "schema.json", "r") as file:
+        schema = json.load(file)
+
+    table = {}
+    for column in schema["columns"]:
+        if names is not None and column["name"] not in names:
+            continue
+        values = np.load(path / column["file"], mmap_mode="r")
+        if decode and "dictionary" in column:
+            dictionary = column["dictionary"]
+            values = [dictionary[code] for code in values]
+        table[column["name"]] = values
+    return table
+
+def write_top_n_columns(path, nfr_keys: list, fr_keys: list, indices, scores):
+    """
+    Top N table from top_k positions and scores
+    """
+    indices = np.asarray(indices)
+    n_nfrs, k = indices.shape
+    write_columns(path, {
+        "NFR": np.repeat(np.arange(n_nfrs, dtype=np.int32), k),
+        "Rank": np.tile(np.arange(1, k + 1, dtype=np.int32), n_nfrs),
+        "FR": indices.ravel().astype(np.int32),
+        "Similarity": np.asarray(scores).ravel(),
+    }, {"NFR": nfr_keys, "FR": fr_keys})
+
+def write_trace_columns(path, nfr_keys: list, fr_keys: list, trace):
+    """
+    Trace table from a FR x NFR trace matrix
+    """
+    trace = np.asarray(trace, dtype=np.int8)
+    columns = {"FR": np.arange(len(fr_keys), dtype=np.int32)}
+    columns.update((nfr, trace[:, i]) for i, nfr in enumerate(nfr_keys))
+    write_columns(path, columns, {"FR": fr_keys})
+
+def write_similarity_columns(path, nfr_keys: list, fr_keys: list, similarity):
+    """
+    Full similarity table from the NFR x FR block
+    """
+    similarity = np.asarray(similarity)
+    columns = {"FR": np.arange(len(fr_keys), dtype=np.int32)}
+    columns.update((nfr, similarity[i]) for i, nfr in enumerate(nfr_keys))
+    write_columns(path, columns, {"FR": fr_keys})
@@ -0,0 +1,51 @@
+"""
+Baseline results the tests compare against
+
+The baseline is what the original analysis scripts did: every NFR's (FR, score) list sorted with merge_sort
+for the top N, and the nested scan of transpose_with_threshold for the trace.
+"""
+from pathlib import Path
+
+import numpy as np
+
+from methods.functions import merge_sort
+
+
+def plain_variant(info: dict, output_path: Path):
+    """
+    Preprocessing without NLTK, the TF-IDF vectorizer tokenizes the raw text
+    """
+    return list(info), list(info.values())
+
+def baseline_top_n(nfr_keys, fr_keys, similarity, n):
+    """
+    return - Dictionary of NFR key -> top n (FR key, score) with merge_sort
+    """
+    return {nfr: merge_sort([(fr, similarity[i][j]) for j, fr in enumerate(fr_keys)])[:n]
+            for i, nfr in enumerate(nfr_keys)}
+
+def baseline_trace(results, threshold=0.14):
+    """
+    The original transpose_with_threshold: FR key -> list of 0/1 per NFR
+    """
+    frs_result = {}
+    nfr_keys = list(results.keys())
+    all_frs = [res[0] for res in results[nfr_keys[0]]]
+
+    for fr in all_frs:
+        frs_result[fr] = []
+        for nfr in nfr_keys:
+            score = 0
+            for res in results[nfr]:
+                if res[0] == fr:
+                    score = res[1]
+                    break
+            frs_result[fr].append(1 if score > threshold else 0)
+    return frs_result
+
+def ranked_lists(indices, scores, fr_keys):
+    """
+    return - List per row of (FR key, score) in rank order
+    """
+    return [[(fr_keys[j], score) for j, score in zip(row_indices, row_scores)]
+            for row_indices, row_scores in zip(np.asarray(indices).tolist(), np.asarray(scores).tolist())]
@@ -0,0 +1,54 @@
+"""
+Requirement files the tests run on: the bundled files and seeded synthetic corpora (benchmarks/corpus.py)
+"""
+from pathlib import Path
+
+import pytest
+
+from benchmarks.corpus import write_corpus
+from baseline import plain_variant
+from methods.functions import load_requirements, split_requirement_types, tf_idf_vectorize
+from methods.variants import PreprocessingPipeline
+
+TEXT_FILES = Path(__file__).resolve().parent.parent / "text_files"
+REQUIREMENT_FILES = sorted(TEXT_FILES.glob("*requirements*.txt"))
+# (requirements, NFRs, seed) of the synthetic corpora
+SYNTHETIC_CORPORA = [(300, 3, 0), (800, 7, 1)]
+
+
+@pytest.fixture(scope="session")
+def synthetic_files(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("corpus")
+    return [write_corpus(folder / f"corpus_{size}_{seed}.txt", size, nfrs, seed)
+            for size, nfrs, seed in SYNTHETIC_CORPORA]
+
+@pytest.fixture(scope="session", params=[path.name for path in REQUIREMENT_FILES] +
+                [f"synthetic_{size}_{seed}" for size, _, seed in SYNTHETIC_CORPORA])
+def requirements_file(request, synthetic_files):
+    if request.param.startswith("synthetic"):
+        return synthetic_files[[f"synthetic_{size}_{seed}" for size, _, seed in SYNTHETIC_CORPORA].index(
+            request.param)]
+    return TEXT_FILES / request.param
+
+@pytest.fixture(scope="session")
+def tf_idf_rows(requirements_file, tmp_path_factory):
+    """
+    return - nfr_keys, fr_keys, NFR rows, FR rows and similarity of the plain variant
+    """
+    info = load_requirements(requirements_file)
+    keys, _, tf_idf_matrix = tf_idf_vectorize(info, tmp_path_factory.mktemp("plain"), plain_variant)
+    tf_idf_matrix = tf_idf_matrix.tocsr()
+    nfr_indices, fr_indices = split_requirement_types(keys)
+    nfr_rows, fr_rows = tf_idf_matrix[nfr_indices], tf_idf_matrix[fr_indices]
+    similarity = (nfr_rows @ fr_rows.T).toarray()
+    return [keys[i] for i in nfr_indices], [keys[j] for j in fr_indices], nfr_rows, fr_rows, similarity
+
+@pytest.fixture(scope="session")
+def nltk_data():
+    """
+    Skips tests that preprocess with the variants when the NLTK data is not downloaded
+    """
+    try:
+        PreprocessingPipeline().variants(["variant1", "variant2"], ["The system shall refresh the display."])
+    except LookupError as error:
+        pytest.skip(f"NLTK data is missing: {str(error).strip().splitlines()[0]}")
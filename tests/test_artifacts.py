@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from baseline import plain_variant
+from conftest import REQUIREMENT_FILES
+from methods.artifacts import load_artifacts, save_artifacts
+from methods.functions import load_requirements, split_requirement_types, tf_idf_vectorize
+
+
+@pytest.fixture
+def stored(tmp_path):
+    """
+    return - info, TF-IDF matrix, similarity and folder of artifacts saved for the plain variant
+    """
+    info = load_requirements(REQUIREMENT_FILES[0])
+    keys, vectorizer, tf_idf_matrix = tf_idf_vectorize(info, tmp_path, plain_variant)
+    tf_idf_matrix = tf_idf_matrix.tocsr()
+    nfr_indices, fr_indices = split_requirement_types(keys)
+    similarity = (tf_idf_matrix[nfr_indices] @ tf_idf_matrix[fr_indices].T).toarray()
+    path = save_artifacts(tmp_path / "artifacts" / "plain", info, "plain", keys, vectorizer, tf_idf_matrix,
+                          similarity, nfr_indices, fr_indices)
+    return info, tf_idf_matrix, similarity, path
+
+def test_round_trip(stored):
+    info, tf_idf_matrix, similarity, path = stored
+    artifacts = load_artifacts(path, info, "plain")
+    assert artifacts is not None
+    assert np.array_equal(artifacts.similarity, similarity)
+    assert (artifacts.tf_idf_matrix != tf_idf_matrix).nnz == 0
+    assert artifacts.keys == list(info)
+
+def test_manifest_mismatch_returns_none(stored, tmp_path):
+    info, _, _, path = stored
+    edited = dict(info)
+    edited[next(iter(edited))] += " Always."
+
+    assert load_artifacts(path, edited, "plain") is None
+    assert load_artifacts(path, info, "variant1") is None
+    assert load_artifacts(path, info, "plain", dtype=np.float32) is None
+    assert load_artifacts(path, info, "plain", token_ids=True) is None
+    assert load_artifacts(tmp_path / "missing", info, "plain") is None
+    # Without inputs to check against the store is opened as it is
+    assert load_artifacts(path) is not None
@@ -0,0 +1,91 @@
+import itertools
+import types
+
+import nltk
+import pytest
+
+from methods import cache as cache_module
+from methods.cache import PreprocessingCache
+
+INFO = {"NFR1": "The system shall be fast.", "FR1": "Users can log in.", "FR2": "Users can log out."}
+TOKENS = {"NFR1": ["system", "fast"], "FR1": ["users", "log"], "FR2": ["users", "log", "out"]}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Increasing last_used times, so the LRU order doesn't depend on the clock resolution
+    """
+    ticks = itertools.count(1)
+    monkeypatch.setattr(cache_module, "time", types.SimpleNamespace(time=lambda: float(next(ticks))))
+
+@pytest.fixture
+def resource(tmp_path, monkeypatch):
+    """
+    return - File of a fake NLTK resource the cache key depends on
+    """
+    path = tmp_path / "nltk_data" / "corpora" / "fake"
+    path.parent.mkdir(parents=True)
+    path.write_text("v1")
+    monkeypatch.setattr(nltk.data, "path", [str(tmp_path / "nltk_data")])
+    return path
+
+def open_cache(tmp_path, **options):
+    return PreprocessingCache(tmp_path / "cache.sqlite", resources=["corpora/fake"], **options)
+
+def test_hit_and_miss(tmp_path, resource):
+    cache = open_cache(tmp_path)
+    hits, missing = cache.lookup(INFO, "variant1")
+    assert (hits, missing) == ({}, INFO)
+
+    cache.store(INFO, {"NFR1": TOKENS["NFR1"]}, "variant1")
+    hits, missing = cache.lookup(INFO, "variant1")
+    assert hits == {"NFR1": TOKENS["NFR1"]}
+    assert missing == {"FR1": INFO["FR1"], "FR2": INFO["FR2"]}
+    # Another variant or an edited text is a miss
+    assert cache.lookup(INFO, "variant2")[0] == {}
+    assert cache.lookup({"NFR1": INFO["NFR1"] + " Always."}, "variant1")[0] == {}
+    cache.close()
+
+    reopened = open_cache(tmp_path)
+    assert reopened.lookup(INFO, "variant1")[0] == {"NFR1": TOKENS["NFR1"]}
+    reopened.close()
+
+def test_least_recently_used_entries_are_evicted(tmp_path, resource, clock):
+    cache = open_cache(tmp_path, max_bytes=2 * len('["users", "log", "out"]'))
+    cache.store(INFO, {"NFR1": TOKENS["NFR1"]}, "variant1")
+    cache.store(INFO, {"FR1": TOKENS["FR1"]}, "variant1")
+    # Using NFR1 makes FR1 the least recently used entry
+    cache.lookup({"NFR1": INFO["NFR1"]}, "variant1")
+    cache.store(INFO, {"FR2": TOKENS["FR2"]}, "variant1")
+
+    assert cache.size() <= cache.max_bytes
+    assert sorted(cache.lookup(INFO, "variant1")[0]) == ["FR2", "NFR1"]
+    cache.close()
+
+def test_invalidate(tmp_path, resource):
+    cache = open_cache(tmp_path)
+    for variant in ("variant1", "variant2"):
+        cache.store(INFO, TOKENS, variant)
+
+    assert cache.invalidate("variant1", [INFO["FR1"]]) == 1
+    assert sorted(cache.lookup(INFO, "variant1")[1]) == ["FR1"]
+    assert cache.invalidate(texts=[INFO["FR2"]]) == 2
+    assert sorted(cache.lookup(INFO, "variant2")[1]) == ["FR2"]
+    assert cache.invalidate("variant2") == 2
+    assert cache.lookup(INFO, "variant2")[0] == {}
+    assert cache.invalidate() == 1
+    assert cache.size() == 0
+    cache.close()
+
+def test_key_changes_with_the_nltk_fingerprint(tmp_path, resource):
+    cache = open_cache(tmp_path)
+    cache.store(INFO, TOKENS, "variant1")
+    key = cache.key(INFO["FR1"], "variant1")
+    cache.close()
+
+    resource.write_text("version 2")
+    cache = open_cache(tmp_path)
+    assert cache.key(INFO["FR1"], "variant1") != key
+    assert cache.lookup(INFO, "variant1") == ({}, INFO)
+    cache.close()
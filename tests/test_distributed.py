@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from methods.distributed import Coordinator, distributed_trace, start_local_workers
+from methods.functions import threshold_trace, top_k
+from test_streaming import THRESHOLD, TOP_N, in_memory, read_rows, top_n_rows, trace_rows
+
+
+@pytest.fixture(params=[1, 3])
+def coordinator(request, nltk_data, requirements_file):
+    processes, addresses = start_local_workers(requirements_file, request.param, "variant2", chunk_size=29)
+    coordinator = Coordinator(addresses)
+    yield coordinator
+    coordinator.shutdown()
+    for process in processes:
+        process.join()
+
+def test_sharded_scores_are_exact(coordinator, requirements_file, tmp_path):
+    nfr_keys, fr_keys, similarity = in_memory(requirements_file, tmp_path, "variant2")
+    assert coordinator.prepare(requirements_file, "variant2", chunk_size=37) == nfr_keys
+
+    for k, threshold in ((1, 0.0), (TOP_N, THRESHOLD), (len(fr_keys) + 2, 0.3)):
+        result = coordinator.query(coordinator.nfr_rows, k, threshold)
+        indices, scores = top_k(similarity, k)
+        assert np.array_equal(result["positions"], indices)
+        assert np.array_equal(result["scores"], scores)
+        assert result["keys"] == [[fr_keys[j] for j in row] for row in indices.tolist()]
+
+        links = np.zeros((len(fr_keys), len(nfr_keys)), dtype=np.int8)
+        for i, pairs in enumerate(result["above"]):
+            for position, score in pairs:
+                assert score == similarity[i, position]
+                links[position, i] = 1
+        assert np.array_equal(links, threshold_trace(similarity, threshold))
+
+def test_distributed_trace_files_match_in_memory(coordinator, requirements_file, tmp_path):
+    nfr_keys, fr_keys, similarity = in_memory(requirements_file, tmp_path / "memory", "variant2")
+    outputs = distributed_trace(coordinator, requirements_file, tmp_path / "distributed", "variant2", TOP_N,
+                                THRESHOLD)
+
+    assert read_rows(outputs["top_n"]) == [["NFR", "Rank", "FR", "Similarity"]] + \
+        top_n_rows(nfr_keys, fr_keys, similarity, TOP_N)
+    assert read_rows(outputs["trace"]) == trace_rows(nfr_keys, fr_keys, similarity, THRESHOLD)
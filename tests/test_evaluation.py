@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from methods.evaluation import evaluate, truth_matrix
+from methods.functions import threshold_trace
+
+# Hand computed: 4 relevant pairs, every distinct score is a threshold and a pair traces when it scores above it
+SIMILARITY = np.array([[0.9, 0.5, 0.1],
+                       [0.5, 0.3, 0.0]])
+TRUTH = np.array([[1, 0, 1],
+                  [1, 1, 0]], dtype=bool)
+# threshold, predicted, true positives, precision, recall, F1, MAP of the rankings cut at the threshold
+EXPECTED = [
+    (0.9, 0, 0, 0.0, 0.0, 0.0, 0.0),
+    (0.5, 1, 1, 1.0, 0.25, 0.4, 0.25),
+    (0.3, 3, 2, 2 / 3, 0.5, 4 / 7, 0.5),
+    (0.1, 4, 3, 0.75, 0.75, 0.75, 0.75),
+    (0.0, 5, 4, 0.8, 1.0, 8 / 9, (5 / 6 + 1) / 2),
+]
+
+
+def test_sweep_matches_hand_computed_points():
+    overall = evaluate(SIMILARITY, TRUTH, ["NFR1", "NFR2"])["overall"]
+    columns = ["threshold", "predicted", "true_positives", "precision", "recall", "f1", "map"]
+    for position, expected in enumerate(EXPECTED):
+        assert [overall[column][position] for column in columns] == pytest.approx(expected)
+
+def test_threshold_is_strict_at_an_exact_score():
+    overall = evaluate(SIMILARITY, TRUTH)["overall"]
+    position = list(overall["threshold"]).index(0.5)
+    # Both pairs scoring exactly 0.5 are left out, the same as threshold_trace
+    assert overall["predicted"][position] == 1
+    assert overall["predicted"][position] == np.count_nonzero(threshold_trace(SIMILARITY, 0.5))
+
+def test_best_point_and_map():
+    evaluation = evaluate(SIMILARITY, TRUTH, ["NFR1", "NFR2"])
+    assert evaluation["best"]["threshold"] == 0.0
+    assert evaluation["best"]["f1"] == pytest.approx(8 / 9)
+    # AP of NFR1: (1/1 + 2/3) / 2, NFR2: (1/1 + 2/2) / 2
+    assert evaluation["map"] == pytest.approx((5 / 6 + 1) / 2)
+    assert evaluation["per_nfr"]["NFR1"]["ap"] == pytest.approx(5 / 6)
+
+    nfr1 = evaluation["per_nfr"]["NFR1"]["sweep"]
+    assert nfr1["threshold"].tolist() == [0.9, 0.5, 0.1]
+    assert nfr1["f1"].tolist() == pytest.approx([0.0, 2 / 3, 0.5])
+
+def test_truth_matrix_orders_the_trace_like_the_similarity():
+    trace = {"FR2": [0, 1], "FR1": [1, 1], "FR3": [1, 0]}
+    assert np.array_equal(truth_matrix(trace, ["NFR1", "NFR2"], ["FR1", "FR2", "FR3"]), TRUTH)
+    with pytest.raises(ValueError):
+        truth_matrix({"FR1": [1]}, ["NFR1", "NFR2"], ["FR1"])
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from baseline import baseline_top_n, baseline_trace, ranked_lists
+from methods.functions import TraceResult, threshold_trace, top_k, transpose_with_threshold
+from methods.metrics import Metrics
+
+THRESHOLDS = [0.0, 0.05, 0.14, 0.3]
+
+
+def baseline_results(nfr_keys, fr_keys, similarity):
+    return {nfr: [(fr, similarity[i][j]) for j, fr in enumerate(fr_keys)] for i, nfr in enumerate(nfr_keys)}
+
+@pytest.mark.parametrize("k", [1, 3, 10, 100000])
+def test_top_k_matches_merge_sort(tf_idf_rows, k):
+    nfr_keys, fr_keys, _, _, similarity = tf_idf_rows
+    expected = baseline_top_n(nfr_keys, fr_keys, similarity, k)
+
+    indices, scores = top_k(similarity, k)
+    assert ranked_lists(indices, scores, fr_keys) == [expected[nfr] for nfr in nfr_keys]
+
+    ranked = TraceResult(nfr_keys, fr_keys, similarity).top(k)
+    assert {nfr: ranked[nfr] for nfr in ranked} == expected
+    # Shallower top N of ranked results are prefixes
+    assert {nfr: ranked.top(2)[nfr] for nfr in ranked} == {nfr: expected[nfr][:2] for nfr in nfr_keys}
+
+def test_top_k_ties_keep_fr_order():
+    similarity = np.array([[0.2, 0.5, 0.2, 0.5, 0.0, 0.2]])
+    expected = baseline_top_n(["NFR1"], list("abcdef"), similarity, 6)["NFR1"]
+    indices, scores = top_k(similarity, 6)
+    assert ranked_lists(indices, scores, list("abcdef"))[0] == expected
+    assert indices[0].tolist() == [1, 3, 0, 2, 5, 4]
+
+@pytest.mark.parametrize("k", [1, 4, 9, 30])
+def test_top_k_sparse_rows_only_sort_k_candidates(k):
+    # Mostly 0 scores with a few repeated values, k is often past the last positive score
+    rng = np.random.default_rng(7)
+    similarity = np.zeros((40, 500))
+    for row in similarity:
+        row[rng.choice(500, 6, replace=False)] = rng.choice([0.1, 0.25, 0.5], 6)
+    fr_keys = [f"FR{j + 1}" for j in range(500)]
+    nfr_keys = [f"NFR{i + 1}" for i in range(40)]
+    expected = baseline_top_n(nfr_keys, fr_keys, similarity, k)
+
+    metrics = Metrics()
+    with metrics.active():
+        indices, scores = top_k(similarity, k)
+    assert ranked_lists(indices, scores, fr_keys) == [expected[nfr] for nfr in nfr_keys]
+    assert metrics.records[-1]["counts"]["candidates"] == 40 * k
+
+@pytest.mark.parametrize("threshold", THRESHOLDS)
+def test_threshold_trace_matches_nested_scan(tf_idf_rows, threshold):
+    nfr_keys, fr_keys, _, _, similarity = tf_idf_rows
+    results = baseline_results(nfr_keys, fr_keys, similarity)
+    expected = baseline_trace(results, threshold)
+
+    assert dict(zip(fr_keys, threshold_trace(similarity, threshold).tolist())) == expected
+    assert dict(zip(fr_keys, threshold_trace(similarity, threshold, sparse=True).toarray().tolist())) == expected
+    for trace in (transpose_with_threshold(results, threshold),
+                  transpose_with_threshold(TraceResult(nfr_keys, fr_keys, similarity), threshold)):
+        assert dict(trace.items()) == expected
+        assert list(trace) == fr_keys
+        assert trace[fr_keys[-1]] == expected[fr_keys[-1]]
+
+def test_transpose_with_threshold_keeps_fr_keyed_items():
+    results = {"NFR1": [("FR1", 0.2), ("FR2", 0.05)], "NFR2": [("FR1", 0.14), ("FR2", 0.3)]}
+    assert list(transpose_with_threshold(results).items()) == [("FR1", [1, 0]), ("FR2", [0, 1])]
+
+def test_threshold_matrix_matches_single_thresholds(tf_idf_rows):
+    nfr_keys, _, _, _, similarity = tf_idf_rows
+    traces = threshold_trace(similarity, np.array(THRESHOLDS)[:, None])
+    for threshold, trace in zip(THRESHOLDS, traces):
+        assert np.array_equal(trace, threshold_trace(similarity, threshold))
+
+    per_nfr = np.resize(THRESHOLDS, len(nfr_keys))
+    expected = np.stack([threshold_trace(similarity, value)[:, i] for i, value in enumerate(per_nfr)], axis=1)
+    assert np.array_equal(threshold_trace(similarity, per_nfr), expected)
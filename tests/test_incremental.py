@@ -0,0 +1,67 @@
+import pickle
+
+from conftest import REQUIREMENT_FILES
+from methods.functions import load_requirements
+from methods.incremental import STATE_VERSION, IncrementalTrace, incremental_trace, state_parameters
+from test_streaming import THRESHOLD, TOP_N, in_memory, read_rows, top_n_rows, trace_rows
+
+
+def edited(info):
+    """
+    return - Copy of info with the text of its first FR changed
+    """
+    key = next(key for key in info if key.startswith("FR"))
+    return {**info, key: info[key] + " The display shall refresh within one second."}
+
+def test_state_keeps_version_and_parameters(tmp_path):
+    parameters = state_parameters(tmp_path, TOP_N, THRESHOLD)
+    IncrementalTrace("variant1").save(tmp_path / "state.pkl", parameters)
+
+    assert IncrementalTrace.load(tmp_path / "state.pkl", parameters=parameters).variant == "variant1"
+    assert IncrementalTrace.load(tmp_path / "state.pkl", parameters=state_parameters(tmp_path, TOP_N + 1,
+                                                                                      THRESHOLD)) is None
+    assert IncrementalTrace.load(tmp_path / "state.pkl", parameters=state_parameters(tmp_path, TOP_N, 0.2)) is None
+
+    with open(tmp_path / "state.pkl", "wb") as file:
+        pickle.dump({"version": STATE_VERSION + 1, "parameters": parameters}, file)
+    assert IncrementalTrace.load(tmp_path / "state.pkl") is None
+
+    # States saved before the version was recorded are the bare trace
+    with open(tmp_path / "state.pkl", "wb") as file:
+        pickle.dump(IncrementalTrace("variant1"), file)
+    assert IncrementalTrace.load(tmp_path / "state.pkl") is None
+
+    (tmp_path / "state.pkl").write_bytes(b"not a pickle")
+    assert IncrementalTrace.load(tmp_path / "state.pkl") is None
+
+def test_incremental_trace_matches_full_fit(nltk_data, tmp_path):
+    info = load_requirements(REQUIREMENT_FILES[0])
+    state_path = tmp_path / "state" / "variant1.pkl"
+
+    _, summary, _ = incremental_trace(info, tmp_path, "variant1", state_path, TOP_N, THRESHOLD)
+    assert summary["requirements"] == list(info)
+
+    info = edited(info)
+    _, summary, files = incremental_trace(info, tmp_path, "variant1", state_path, TOP_N, THRESHOLD)
+    assert len(summary["requirements"]) == 1
+    assert files
+
+    requirements_file = tmp_path / "edited.txt"
+    requirements_file.write_text("".join(f"{key}: {text}\n" for key, text in info.items()))
+    nfr_keys, fr_keys, similarity = in_memory(requirements_file, tmp_path / "memory", "variant1")
+    assert read_rows(tmp_path / "top_n_results_variant1.csv")[1:] == top_n_rows(nfr_keys, fr_keys, similarity,
+                                                                                 TOP_N)
+    assert read_rows(tmp_path / "trace_variant1.csv") == trace_rows(nfr_keys, fr_keys, similarity, THRESHOLD)
+
+def test_incremental_trace_refits_on_other_parameters(nltk_data, tmp_path):
+    info = load_requirements(REQUIREMENT_FILES[0])
+    state_path = tmp_path / "state" / "variant1.pkl"
+    incremental_trace(info, tmp_path, "variant1", state_path, TOP_N, THRESHOLD)
+
+    _, summary, _ = incremental_trace(info, tmp_path, "variant1", state_path, TOP_N + 1, THRESHOLD)
+    assert summary["requirements"] == list(info)
+
+    (tmp_path / "trace_variant1.csv").unlink()
+    _, summary, _ = incremental_trace(info, tmp_path, "variant1", state_path, TOP_N + 1, THRESHOLD)
+    assert summary["requirements"] == list(info)
+    assert (tmp_path / "trace_variant1.csv").exists()
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from baseline import baseline_top_n, ranked_lists
+from methods.functions import top_k
+from methods.index import InvertedIndex
+
+
+@pytest.mark.parametrize("k", [1, 5, 20, 100000])
+def test_index_top_k_is_exact(tf_idf_rows, k):
+    nfr_keys, fr_keys, nfr_rows, fr_rows, similarity = tf_idf_rows
+    indices, scores = InvertedIndex(fr_rows, fr_keys).top_k(nfr_rows, k)
+
+    expected_indices, expected_scores = top_k(similarity, k)
+    assert np.array_equal(indices, expected_indices)
+    assert np.array_equal(scores, expected_scores)
+    expected = baseline_top_n(nfr_keys, fr_keys, similarity, k)
+    assert ranked_lists(indices, scores, fr_keys) == [expected[nfr] for nfr in nfr_keys]
+
+@pytest.mark.parametrize("threshold", [0.0, 0.05, 0.14, 0.3])
+def test_index_above_threshold_is_exact(tf_idf_rows, threshold):
+    _, fr_keys, nfr_rows, fr_rows, similarity = tf_idf_rows
+    results = InvertedIndex(fr_rows, fr_keys).above_threshold(nfr_rows, threshold)
+
+    for row, (positions, scores) in zip(similarity, results):
+        expected = np.flatnonzero(row > threshold)
+        assert np.array_equal(np.sort(positions), expected)
+        assert np.array_equal(scores[np.argsort(positions)], row[expected])
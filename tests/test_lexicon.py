@@ -0,0 +1,58 @@
+import nltk
+import pytest
+
+from methods import variants
+from methods.lexicon import Lexicon, load_lexicon
+
+
+@pytest.fixture
+def wordnet(tmp_path, monkeypatch):
+    """
+    return - File of a fake WordNet corpus the lexicon fingerprint depends on
+    """
+    path = tmp_path / "nltk_data" / "corpora" / "wordnet"
+    path.parent.mkdir(parents=True)
+    path.write_text("v1")
+    monkeypatch.setattr(nltk.data, "path", [str(tmp_path / "nltk_data")])
+    return path
+
+def wordnet_lemma(word, pos):
+    return f"{word}-wordnet"
+
+def wordnet_expansion(lemma, pos):
+    return [f"{lemma}-synonym"]
+
+def saved_lexicon(path):
+    lexicon = Lexicon(wordnet_lemma, wordnet_expansion, {("users", "n"): "user"}, {("user", "n"): ("client",)})
+    return lexicon.save(path)
+
+def test_loaded_lexicon_answers_from_the_file(tmp_path, wordnet):
+    lexicon = load_lexicon(saved_lexicon(tmp_path / "lexicon.json"), wordnet_lemma, wordnet_expansion)
+    assert lexicon.lemmatize("users", "n") == "user"
+    assert lexicon.expand("user", "n") == ["client"]
+    assert lexicon.misses == 0
+    # Entries the file doesn't have are asked from WordNet once
+    assert lexicon.lemmatize("logs", "v") == "logs-wordnet"
+    assert lexicon.lemmatize("logs", "v") == "logs-wordnet"
+    assert lexicon.misses == 1
+
+def test_stale_fingerprint_falls_back_to_wordnet(tmp_path, wordnet, monkeypatch):
+    path = saved_lexicon(tmp_path / "lexicon.json")
+    wordnet.write_text("version 2")
+    assert load_lexicon(path, wordnet_lemma, wordnet_expansion) is None
+
+    monkeypatch.setattr(variants, "_worker_state", {})
+    monkeypatch.setattr(variants, "wordnet_lemma", wordnet_lemma)
+    monkeypatch.setattr(variants, "wordnet_expansion", wordnet_expansion)
+    assert not variants.use_lexicon(path)
+    lexicon = variants.worker_state("lexicon")
+    assert lexicon.lemmatize("users", "n") == "users-wordnet"
+    assert lexicon.misses == 1
+
+def test_missing_file_or_wordnet(tmp_path, wordnet):
+    assert load_lexicon(tmp_path / "missing.json", wordnet_lemma, wordnet_expansion) is None
+
+    path = saved_lexicon(tmp_path / "lexicon.json")
+    # Without WordNet installed the file is used as it is
+    wordnet.unlink()
+    assert load_lexicon(path, wordnet_lemma, wordnet_expansion) is not None
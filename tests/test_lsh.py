@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from baseline import plain_variant
+from conftest import REQUIREMENT_FILES
+from methods.functions import load_requirements, nfr_fr_similarity, split_requirement_types, tf_idf_vectorize, top_k
+from methods.lsh import lsh_recall, lsh_similarity
+
+TOP_N = 10
+THRESHOLD = 0.14
+
+
+@pytest.fixture(params=REQUIREMENT_FILES, ids=[path.name for path in REQUIREMENT_FILES])
+def exact(request, tmp_path):
+    """
+    return - NFR rows, FR rows and exact similarity of a bundled file with the plain variant
+    """
+    info = load_requirements(request.param)
+    keys, _, tf_idf_matrix = tf_idf_vectorize(info, tmp_path, plain_variant)
+    tf_idf_matrix = tf_idf_matrix.tocsr()
+    nfr_indices, fr_indices = split_requirement_types(keys)
+    similarity = nfr_fr_similarity(tf_idf_matrix, nfr_indices, fr_indices)
+    return tf_idf_matrix[nfr_indices], tf_idf_matrix[fr_indices], similarity
+
+def test_recall_against_exact_pairs(exact):
+    nfr_rows, fr_rows, similarity = exact
+    # One value per band and many bands: every pair that shares a term is a candidate
+    indices, scores, above, candidates = lsh_similarity(nfr_rows, fr_rows, TOP_N, THRESHOLD, bands=128, rows=1)
+    assert candidates <= similarity.size
+    assert lsh_recall(similarity, indices, scores, above, TOP_N, THRESHOLD) == {
+        "top_k_recall": 1.0, "threshold_recall": 1.0}
+
+    exact_indices, exact_scores = top_k(similarity, TOP_N)
+    assert np.allclose(scores, exact_scores)
+    positive = exact_scores > 0
+    assert np.array_equal(indices[positive], exact_indices[positive])
+    assert np.allclose(above.toarray(), np.where(similarity > THRESHOLD, similarity, 0))
+
+def test_scored_pairs_are_exact(exact):
+    nfr_rows, fr_rows, similarity = exact
+    # Few candidates: the recall drops, but what is scored has the exact score
+    indices, scores, above, _ = lsh_similarity(nfr_rows, fr_rows, TOP_N, THRESHOLD, bands=32, rows=2)
+    report = lsh_recall(similarity, indices, scores, above, TOP_N, THRESHOLD)
+    assert 0.0 <= report["top_k_recall"] <= 1.0
+    scored = scores > 0
+    assert np.allclose(scores[scored], np.take_along_axis(similarity, indices, axis=1)[scored])
+    rows, columns = above.nonzero()
+    assert np.allclose(np.asarray(above[rows, columns]).ravel(), similarity[rows, columns])
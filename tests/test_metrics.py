@@ -0,0 +1,44 @@
+import threading
+
+from methods.metrics import Metrics, stage
+from methods.writers import BackgroundWriter
+
+
+def test_stages_on_the_writer_thread_nest_separately():
+    writing, computed = threading.Event(), threading.Event()
+
+    def write():
+        with stage("write", rows=3):
+            writing.set()
+            # The main thread opens its stage while this one is still open
+            computed.wait(5)
+            with stage("columns"):
+                pass
+
+    metrics = Metrics()
+    with metrics.active(), BackgroundWriter() as writer:
+        with stage("trace"):
+            writer.submit(write)
+            writing.wait(5)
+            with stage("rank"):
+                pass
+            computed.set()
+            writer.flush()
+
+    records = {record["stage"]: record for record in metrics.records}
+    assert sorted(records) == ["columns", "rank", "trace", "write"]
+    assert records["rank"]["parent"] == "trace"
+    assert records["write"]["parent"] is None
+    assert records["columns"]["parent"] == "write"
+    assert records["write"]["counts"] == {"rows": 3}
+
+def test_stage_is_a_no_op_without_a_recorder():
+    metrics = Metrics()
+    with stage("vectorize", documents=5) as record:
+        record.count(vocabulary=10)
+    assert metrics.records == []
+
+    with metrics.active():
+        with stage("vectorize", documents=5) as record:
+            record.count(vocabulary=10)
+    assert metrics.summary()["vectorize"]["counts"] == {"documents": 5, "vocabulary": 10}
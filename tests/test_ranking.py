@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from methods.ranking import block_records, ranked_pairs
+
+
+def random_blocks(similarity, rng):
+    """
+    return - RECORD arrays of the similarity cut into blocks at random NFR and FR boundaries, in random order
+    """
+    n_nfrs, n_frs = similarity.shape
+    nfr_cuts = [0, *sorted(rng.choice(np.arange(1, n_nfrs), 3, replace=False)), n_nfrs]
+    fr_cuts = [0, *sorted(rng.choice(np.arange(1, n_frs), 5, replace=False)), n_frs]
+    blocks = [block_records(similarity[top:bottom, left:right], top, left)
+              for top, bottom in zip(nfr_cuts, nfr_cuts[1:]) for left, right in zip(fr_cuts, fr_cuts[1:])]
+    return [blocks[i] for i in rng.permutation(len(blocks))]
+
+def expected_ranking(similarity, top_n=None, threshold=None):
+    pairs = [(score, i, j) for (i, j), score in np.ndenumerate(similarity) if threshold is None or score > threshold]
+    return sorted(pairs, key=lambda pair: (-pair[0], pair[1], pair[2]))[:top_n]
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("top_n, threshold", [(None, None), (1, None), (37, None), (None, 0.25), (50, 0.0)])
+def test_ranked_pairs_match_sorted(tmp_path, seed, top_n, threshold):
+    rng = np.random.default_rng(seed)
+    # Few distinct scores so most pairs tie and the NFR/FR tie order decides the ranking
+    similarity = rng.choice([0.0, 0.0, 0.1, 0.25, 0.5, 1.0], size=(23, 41))
+    run_size, block_size = int(rng.integers(5, 200)), int(rng.integers(1, 40))
+
+    ranked = ranked_pairs(random_blocks(similarity, rng), tmp_path, top_n, threshold, run_size, block_size)
+    records = np.concatenate(list(ranked))
+    assert records.tolist() == expected_ranking(similarity, top_n, threshold)
+    assert list(tmp_path.iterdir()) == []
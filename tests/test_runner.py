@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from conftest import TEXT_FILES
+from methods.runner import load_config, run, validate_config
+from test_streaming import in_memory, read_rows, top_n_rows, trace_rows
+
+DATASET = {"name": "part_1", "requirements": str(TEXT_FILES / "requirements-3nfr-60fr.txt"), "output": "results"}
+
+
+def test_validate_config_fills_in_the_defaults(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"datasets": [DATASET], "variants": ["variant1", "variant3"],
+                                "thresholds": {"variant1": 0.1, "variant3": [0.2, 0.3]},
+                                "tokenizer": {"variant1": "fast"}, "outputs": "columnar"}))
+    config = load_config(path)
+    assert config["top_n"] == 10
+    assert config["thresholds"] == {"variant1": [0.1], "variant3": [0.2, 0.3]}
+    assert config["tokenizer"] == {"variant1": "fast", "variant3": "nltk"}
+    assert config["outputs"] == ["columnar"]
+
+    config = validate_config({"datasets": [DATASET], "thresholds": 0.2})
+    assert config["variants"] == ["variant1", "variant2", "variant3"]
+    assert config["thresholds"] == {name: [0.2] for name in config["variants"]}
+
+@pytest.mark.parametrize("changes", [
+    {"datasets": []},
+    {"datasets": [{"name": "part_1", "requirements": "requirements.txt"}]},
+    {"variants": ["variant4"]},
+    {"top_n": [10, 0]},
+    {"top_n": 2.5},
+    {"variants": ["variant1", "variant2"], "thresholds": {"variant1": 0.1}},
+    {"tokenizer": "regex"},
+    {"lsa_components": 0},
+    {"outputs": ["csv", "parquet"]},
+    {"incremental": True, "top_n": [5, 10]},
+    {"incremental": True, "outputs": ["columnar"]},
+    {"incremental": True, "token_ids": True},
+])
+def test_validate_config_rejects(changes):
+    with pytest.raises(ValueError):
+        validate_config({"datasets": [DATASET], **changes})
+
+def test_config_driven_run_matches_in_memory(nltk_data, tmp_path):
+    config = {
+        "datasets": [{**DATASET, "output": str(tmp_path / "results"),
+                      "ground_truth": str(TEXT_FILES / "trace-3nfr-60fr.txt")}],
+        "variants": ["variant1"],
+        "top_n": [3, 5],
+        "thresholds": {"variant1": [0.1, 0.2]},
+        "cache": None,
+        "lexicon": None,
+        "artifacts": None,
+        "metrics": str(tmp_path / "metrics.json"),
+    }
+    files = run(config)
+    output_path = tmp_path / "results"
+    assert sorted(path.name for path in files[("part_1", "variant1")]) == sorted([
+        "top_n_results_variant1_top3.csv", "top_n_results_variant1_top5.csv", "trace_variant1_threshold0.1.csv",
+        "trace_variant1_threshold0.2.csv", "evaluation_variant1.csv"])
+
+    nfr_keys, fr_keys, similarity = in_memory(DATASET["requirements"], tmp_path / "memory", "variant1")
+    for top_n in (3, 5):
+        assert read_rows(output_path / f"top_n_results_variant1_top{top_n}.csv")[1:] == \
+            top_n_rows(nfr_keys, fr_keys, similarity, top_n)
+    for threshold in (0.1, 0.2):
+        assert read_rows(output_path / f"trace_variant1_threshold{threshold:g}.csv") == \
+            trace_rows(nfr_keys, fr_keys, similarity, threshold)
+    with open(tmp_path / "metrics.json", "r") as file:
+        assert "trace" in json.load(file)["summary"]
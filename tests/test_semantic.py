@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from baseline import plain_variant
+from conftest import REQUIREMENT_FILES
+from methods.functions import load_requirements, tf_idf_vectorize
+from methods.semantic import SemanticIndex, load_semantic_index
+from methods.vocabulary import TokenVectorizer, Vocabulary
+
+QUERIES = ["the system shall refresh the display every 60 seconds", "users shall be able to export reports"]
+
+
+def test_loaded_index_folds_in_like_the_fitted_one(requirements_file, tmp_path):
+    info = load_requirements(requirements_file)
+    keys, vectorizer, tf_idf_matrix = tf_idf_vectorize(info, tmp_path, plain_variant)
+    index = SemanticIndex.fit(keys, vectorizer, tf_idf_matrix.tocsr(), 20)
+    index.save(tmp_path / "lsa", info, "plain")
+
+    loaded = load_semantic_index(tmp_path / "lsa", info, "plain", 20)
+    assert loaded is not None and not loaded.token_ids
+    assert np.allclose(loaded.transform_text(QUERIES), index.transform_text(QUERIES))
+    for kind in ("NFR", "FR"):
+        expected_keys, expected_indices, expected_scores = index.query(QUERIES, 5, kind)
+        keys, indices, scores = loaded.query(QUERIES, 5, kind)
+        assert keys == expected_keys
+        assert np.array_equal(indices, expected_indices)
+        assert np.allclose(scores, expected_scores)
+
+def test_token_id_index_refuses_text_after_loading(tmp_path):
+    info = load_requirements(REQUIREMENT_FILES[-1])
+    vocabulary = Vocabulary()
+    vectorizer = TokenVectorizer(vocabulary)
+    tf_idf_matrix = vectorizer.fit_transform(vocabulary.encode_all(text.lower().split() for text in info.values()))
+    index = SemanticIndex.fit(list(info), vectorizer, tf_idf_matrix.tocsr(), 10)
+    index.save(tmp_path / "lsa", info, "plain")
+
+    loaded = load_semantic_index(tmp_path / "lsa")
+    assert loaded.token_ids
+    assert load_semantic_index(tmp_path / "lsa", info, "plain", 10, token_ids=True) is not None
+    for semantic_index in (index, loaded):
+        with pytest.raises(ValueError, match="token IDs"):
+            semantic_index.transform_text(QUERIES)
@@ -0,0 +1,102 @@
+import json
+import shutil
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from conftest import REQUIREMENT_FILES
+from methods.functions import load_requirements
+from methods.service import TraceService, serve
+
+NFR_TEXT = "The system shall refresh the display every 60 seconds."
+FR_TEXT = "The product shall be easy to use for new users."
+
+
+@pytest.fixture
+def server(nltk_data, tmp_path):
+    """
+    return - base URL, requirements file and TraceService of a server on a free port
+    """
+    requirements_file = tmp_path / "requirements.txt"
+    shutil.copy(REQUIREMENT_FILES[-1], requirements_file)
+    service = TraceService(requirements_file, ["variant1", "variant2"])
+    http_server = serve(service, port=0)
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{http_server.server_address[1]}", requirements_file, service
+    http_server.shutdown()
+    http_server.server_close()
+    service.close()
+
+def request(url, body=None):
+    """
+    return - (status, JSON body) of a GET, or a POST when body is given
+    """
+    data = None if body is None else json.dumps(body).encode("utf-8")
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data)) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+def test_health(server):
+    url, requirements_file, _ = server
+    status, body = request(f"{url}/health")
+    assert status == 200
+    assert body == {"status": "ok", "requirements": len(load_requirements(requirements_file)),
+                    "variants": ["variant1", "variant2"]}
+
+@pytest.mark.parametrize("kind, text", [("NFR", NFR_TEXT), ("FR", FR_TEXT)])
+def test_trace(server, kind, text):
+    url, requirements_file, service = server
+    keys = load_requirements(requirements_file)
+    targets = [key for key in keys if key.startswith("FR") == (kind == "NFR")]
+
+    status, body = request(f"{url}/trace", {"text": text, "type": kind, "variant": "variant2", "top_n": 3})
+    assert status == 200
+    assert body["type"] == kind and "trace" not in body
+    assert len(body["results"]) == min(3, len(targets))
+    assert all(result["key"] in targets for result in body["results"])
+    scores = [result["similarity"] for result in body["results"]]
+    assert scores == sorted(scores, reverse=True)
+
+    status, body = request(f"{url}/trace", {"text": text, "type": kind, "variant": "variant2", "top_n": 3,
+                                            "threshold": 0.0})
+    assert status == 200
+    expected = service.models["variant2"].query(text, kind, len(targets))["results"]
+    assert sorted(body["trace"]) == sorted(result["key"] for result in expected if result["similarity"] > 0.0)
+    assert body["trace"]
+
+@pytest.mark.parametrize("body", [{"type": "NFR"}, {"text": NFR_TEXT, "type": "bug"},
+                                  {"text": NFR_TEXT, "variant": "variant9"}])
+def test_bad_request(server, body):
+    url, _, _ = server
+    status, response = request(f"{url}/trace", body)
+    assert status == 400
+    assert "error" in response
+
+def test_reload_after_the_file_changes(server):
+    url, requirements_file, service = server
+    count = len(load_requirements(requirements_file))
+    with open(requirements_file, "a") as file:
+        file.write("\nFR999: The display shall refresh within one second.\n")
+
+    status, body = request(f"{url}/reload", {})
+    assert (status, body["requirements"]) == (200, count + 1)
+    _, body = request(f"{url}/trace", {"text": "The display shall refresh within one second.", "top_n": 1})
+    assert body["results"][0]["key"] == "FR999"
+    # The reload pipeline only keeps the texts of the current file memoized
+    assert set(service.pipeline.memo["tokenize"]) <= set(load_requirements(requirements_file).values())
+
+def test_failed_reload_keeps_the_models(server):
+    url, requirements_file, _ = server
+    count = len(load_requirements(requirements_file))
+    requirements_file.unlink()
+
+    status, body = request(f"{url}/reload", {})
+    assert status == 500
+    assert body["error"].startswith("Reload failed")
+    assert request(f"{url}/health")[1]["requirements"] == count
+    assert request(f"{url}/trace", {"text": NFR_TEXT})[0] == 200
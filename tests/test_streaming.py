@@ -0,0 +1,51 @@
+import csv
+import json
+
+import numpy as np
+import pytest
+
+from baseline import baseline_top_n, baseline_trace
+from methods import variants
+from methods.functions import load_requirements, tf_idf_similarity
+
+TOP_N, THRESHOLD = 5, 0.1
+
+
+def in_memory(requirements_file, output_path, variant):
+    """
+    return - nfr_keys, fr_keys, similarity of the single process path
+    """
+    output_path.mkdir(parents=True, exist_ok=True)
+    return tf_idf_similarity(load_requirements(requirements_file), output_path, getattr(variants, variant))
+
+def top_n_rows(nfr_keys, fr_keys, similarity, n):
+    expected = baseline_top_n(nfr_keys, fr_keys, similarity, n)
+    return [[nfr, str(rank), fr, f"{score:.3f}"]
+            for nfr in nfr_keys for rank, (fr, score) in enumerate(expected[nfr], start=1)]
+
+def trace_rows(nfr_keys, fr_keys, similarity, threshold):
+    results = {nfr: [(fr, similarity[i][j]) for j, fr in enumerate(fr_keys)] for i, nfr in enumerate(nfr_keys)}
+    return [[fr] + [str(link) for link in links] for fr, links in baseline_trace(results, threshold).items()]
+
+def read_rows(path):
+    with open(path, "r", newline="") as file:
+        return list(csv.reader(file))
+
+@pytest.mark.parametrize("variant", ["variant1", "variant2"])
+def test_stream_trace_matches_in_memory(nltk_data, requirements_file, tmp_path, variant):
+    from methods.streaming import stream_trace
+
+    nfr_keys, fr_keys, similarity = in_memory(requirements_file, tmp_path / "memory", variant)
+    outputs = stream_trace(requirements_file, tmp_path / "stream", variant, TOP_N, THRESHOLD, chunk_size=41)
+
+    # Norms are summed in column order, the scores can differ in the last bit
+    with open(outputs["scores"] / "chunks.json", "r") as file:
+        manifest = json.load(file)
+    assert manifest["nfr_keys"] == nfr_keys
+    scores = np.concatenate([np.load(outputs["scores"] / f"similarity_{chunk['chunk']:05d}.npy")
+                             for chunk in manifest["chunks"]], axis=1)
+    np.testing.assert_allclose(scores, similarity, rtol=1e-12, atol=1e-15)
+
+    assert read_rows(outputs["top_n"]) == [["NFR", "Rank", "FR", "Similarity"]] + \
+        top_n_rows(nfr_keys, fr_keys, similarity, TOP_N)
+    assert read_rows(outputs["trace"]) == trace_rows(nfr_keys, fr_keys, similarity, THRESHOLD)
@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from methods.functions import threshold_trace, top_k
+from methods.tiles import tiled_similarity
+
+
+@pytest.mark.parametrize("workers, pool", [(1, "thread"), (2, "thread"), (2, "process")])
+@pytest.mark.parametrize("memory_budget", [4096, 256 * 1024 * 1024])
+def test_tiled_similarity_matches_in_memory(tf_idf_rows, workers, pool, memory_budget):
+    _, _, nfr_rows, fr_rows, similarity = tf_idf_rows
+    k, threshold = 10, 0.1
+    indices, scores, above = tiled_similarity(nfr_rows, fr_rows, k, threshold, memory_budget, workers, pool)
+
+    expected_indices, expected_scores = top_k(similarity, k)
+    assert np.array_equal(indices, expected_indices)
+    assert np.array_equal(scores, expected_scores)
+    assert np.array_equal((above.toarray() > 0).T.astype(np.int8), threshold_trace(similarity, threshold))
+    assert np.array_equal(above.toarray()[above.toarray() > 0], similarity[similarity > threshold])
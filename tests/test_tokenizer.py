@@ -0,0 +1,48 @@
+import pytest
+
+from benchmarks.corpus import write_corpus
+from conftest import TEXT_FILES
+from methods.functions import load_requirements
+from methods.tokenizer import differences, punkt_words
+
+# (requirements, NFRs, seed) of the synthetic corpora, besides the ones in conftest
+CORPORA = [(50, 2, 3), (400, 5, 4), (2000, 9, 5)]
+# Text the single pass has to hand to word_tokenize or pad exactly like the Treebank cascade
+EDGE_CASES = [
+    "The system shall respond within 2.5 seconds, e.g. for 1,000 users.",
+    "Users can't log in (see Fig. 3). The admin shall unlock them.",
+    "The U.S. office shall use the \"standard\" layout -- not the legacy one...",
+    "Reports shall list: name, date; and status [required].",
+    "Logs shall be kept for 30 days.The archive keeps the rest.",
+    "The app shall support iOS 17.1 and Android 14 (or later).",
+    "Users cannot export more than 5 MB at once!",
+]
+
+
+@pytest.fixture(scope="module")
+def punkt():
+    """
+    Skips the module when the Punkt data word_tokenize needs is not downloaded
+    """
+    try:
+        punkt_words()
+        differences(["The system shall start."])
+    except LookupError as error:
+        pytest.skip(f"NLTK data is missing: {str(error).strip().splitlines()[0]}")
+
+def assert_same_tokens(texts):
+    # The variants tokenize lower case text
+    mismatches, _ = differences(texts + [text.lower() for text in texts])
+    assert mismatches == []
+
+@pytest.mark.parametrize("path", sorted(TEXT_FILES.glob("*.txt")), ids=lambda path: path.name)
+def test_text_files(punkt, path):
+    assert_same_tokens(list(load_requirements(path).values()))
+
+@pytest.mark.parametrize("size, nfrs, seed", CORPORA)
+def test_synthetic_corpus(punkt, tmp_path, size, nfrs, seed):
+    path = write_corpus(tmp_path / "corpus.txt", size, nfrs, seed)
+    assert_same_tokens(list(load_requirements(path).values()))
+
+def test_edge_cases(punkt):
+    assert_same_tokens(EDGE_CASES)
@@ -0,0 +1,38 @@
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from conftest import REQUIREMENT_FILES
+from methods.functions import load_requirements
+from methods.vocabulary import TokenVectorizer, Vocabulary
+
+QUERIES = ["the system shall refresh the display every 60 seconds", "users shall export unknownterm reports"]
+
+
+def test_token_vectorizer_scores_equal_tfidf_vectorizer(requirements_file):
+    texts = list(load_requirements(requirements_file).values())
+    # Both see the same tokens: the ones the TfidfVectorizer regex gives
+    analyzer = TfidfVectorizer().build_analyzer()
+    vocabulary = Vocabulary()
+    token_vectorizer = TokenVectorizer(vocabulary)
+    tfidf_vectorizer = TfidfVectorizer()
+
+    token_matrix = token_vectorizer.fit_transform(vocabulary.encode_all(analyzer(text) for text in texts))
+    tfidf_matrix = tfidf_vectorizer.fit_transform(texts)
+    assert list(token_vectorizer.get_feature_names_out()) == list(tfidf_vectorizer.get_feature_names_out())
+    assert token_vectorizer.vocabulary_ == tfidf_vectorizer.vocabulary_
+    assert np.allclose(token_vectorizer.idf_, tfidf_vectorizer.idf_)
+    assert np.allclose(token_matrix.toarray(), tfidf_matrix.toarray())
+    assert np.allclose((token_matrix @ token_matrix.T).toarray(), (tfidf_matrix @ tfidf_matrix.T).toarray())
+
+    # Unknown query tokens are left out by both
+    queries = vocabulary.encode_all((analyzer(query) for query in QUERIES), grow=False)
+    assert np.allclose(token_vectorizer.transform(queries).toarray(), tfidf_vectorizer.transform(QUERIES).toarray())
+
+def test_vocabulary_ids_are_stable():
+    vocabulary = Vocabulary(["system", "shall"])
+    ids = vocabulary.encode(["shall", "display", "system", "display"])
+    assert ids.dtype == np.int32
+    assert ids.tolist() == [1, 2, 0, 2]
+    assert vocabulary.encode(["new", "shall"], grow=False).tolist() == [1]
+    assert vocabulary.decode(ids) == ["shall", "display", "system", "display"]
+    assert len(vocabulary) == 3
@@ -0,0 +1,87 @@
+import threading
+
+import numpy as np
+import pytest
+
+from methods.functions import threshold_trace, top_k
+from methods.writers import (BackgroundWriter, read_columns, write_columns, write_similarity_columns,
+                             write_top_n_columns, write_trace_columns)
+
+NFR_KEYS = ["NFR1", "NFR2"]
+FR_KEYS = ["FR1", "FR2", "FR3"]
+SIMILARITY = np.array([[0.9, 0.5, 0.1],
+                       [0.5, 0.3, 0.0]])
+
+
+def test_columnar_round_trip(tmp_path):
+    columns = {"key": np.array([2, 0, 1], dtype=np.int32), "score": np.array([0.5, 0.25, 1.0])}
+    path = write_columns(tmp_path / "table", columns, {"key": ["a", "b", "c"]})
+    assert path.name == "table.columns"
+
+    table = read_columns(tmp_path / "table")
+    assert table["key"] == ["c", "a", "b"]
+    assert np.array_equal(table["score"], columns["score"])
+    assert np.array_equal(read_columns(path, names=["key"], decode=False)["key"], columns["key"])
+    assert list(read_columns(path, names=["score"])) == ["score"]
+
+    with pytest.raises(ValueError):
+        write_columns(tmp_path / "bad", {"a": np.zeros(2), "b": np.zeros(3)})
+
+def test_trace_tables_round_trip(tmp_path):
+    indices, scores = top_k(SIMILARITY, 2)
+    write_top_n_columns(tmp_path / "top_n", NFR_KEYS, FR_KEYS, indices, scores)
+    table = read_columns(tmp_path / "top_n")
+    rows = list(zip(table["NFR"], table["Rank"].tolist(), table["FR"], table["Similarity"].tolist()))
+    assert rows == [("NFR1", 1, "FR1", 0.9), ("NFR1", 2, "FR2", 0.5), ("NFR2", 1, "FR1", 0.5), ("NFR2", 2, "FR2", 0.3)]
+
+    trace = threshold_trace(SIMILARITY, 0.2)
+    write_trace_columns(tmp_path / "trace", NFR_KEYS, FR_KEYS, trace)
+    table = read_columns(tmp_path / "trace")
+    assert table["FR"] == FR_KEYS
+    assert np.array_equal(np.stack([table[nfr] for nfr in NFR_KEYS], axis=1), trace)
+
+    write_similarity_columns(tmp_path / "similarity", NFR_KEYS, FR_KEYS, SIMILARITY)
+    table = read_columns(tmp_path / "similarity")
+    assert np.array_equal(np.stack([table[nfr] for nfr in NFR_KEYS]), SIMILARITY)
+
+def test_background_writer_runs_writes_in_order():
+    written = []
+    with BackgroundWriter(max_pending=2) as writer:
+        for number in range(20):
+            writer.submit(written.append, number)
+        writer.flush()
+        assert written == list(range(20))
+
+def test_background_writer_error_reaches_the_caller():
+    def fail():
+        raise OSError("disk full")
+
+    written = []
+    writer = BackgroundWriter()
+    writer.submit(fail)
+    writer.submit(written.append, "after the error")
+    with pytest.raises(OSError, match="disk full"):
+        writer.flush()
+    # The writes queued behind the failed one are skipped, the error is raised once
+    assert written == []
+    writer.submit(written.append, "next")
+    writer.close()
+    assert written == ["next"]
+
+def test_background_writer_error_at_submit_and_close():
+    release = threading.Event()
+
+    def fail():
+        release.wait()
+        raise OSError("disk full")
+
+    writer = BackgroundWriter()
+    writer.submit(fail)
+    release.set()
+    writer.queue.join()
+    with pytest.raises(OSError):
+        writer.submit(print)
+
+    writer.submit(fail)
+    with pytest.raises(OSError):
+        writer.close()